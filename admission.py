@@ -0,0 +1,113 @@
+"""
+Contrôle d'admission des routes d'ingestion (enregistrement, rapports d'appareils)
+
+Après un redémarrage du serveur, tous les clients se réenregistrent et
+envoient leurs appareils au même moment. Avant même le décodage du corps,
+chaque requête d'ingestion passe trois contrôles :
+- le plafond de requêtes d'ingestion simultanées (503) ;
+- le remplissage de la file d'écriture (503) ;
+- le seau à jetons de son client (429), pour qu'un client trop bavard ne
+  prenne pas la place des autres.
+Chaque refus indique `Retry-After`. Celui des 503 est tiré au hasard dans
+[retry_after, 2 × retry_after] : les clients refusés ensemble ne reviennent
+pas ensemble.
+"""
+import math
+import random
+import threading
+import time
+from collections import Counter, OrderedDict
+
+
+class Rejected(Exception):
+    """Requête refusée : statut HTTP, délai à respecter (secondes entières) et motif"""
+
+    def __init__(self, status, retry_after, reason):
+        super().__init__(reason)
+        self.status = status
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class TokenBucket:
+    """Seau de `burst` jetons, rempli de `rate` jetons par seconde (calcul paresseux)"""
+
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, burst, now):
+        self.tokens = burst
+        self.updated = now
+
+    def take(self, rate, burst, now):
+        """Prend un jeton ; retourne 0 ou le délai avant qu'un jeton soit disponible"""
+        self.tokens = min(burst, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / rate
+
+
+class AdmissionControl:
+    """Seaux par client (LRU de `max_clients`), plafond global et pression de la file
+
+    `rate` à 0 désactive la limite par client, `max_concurrent` à 0 le
+    plafond ; `pressure()` retourne vrai quand la file d'écriture est trop
+    pleine pour accepter de nouveaux rapports.
+    """
+
+    def __init__(self, rate, burst, max_concurrent, retry_after=2.0, max_clients=100000, pressure=None):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.max_concurrent = max_concurrent
+        self.base_retry_after = retry_after
+        self.max_clients = max_clients
+        self.pressure = pressure
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+        self._active = 0
+        self._outcomes = Counter()
+
+    def retry_after(self):
+        """Délai à annoncer dans un 503, avec gigue (secondes entières)"""
+        return math.ceil(self.base_retry_after * (1 + random.random()))
+
+    def _reject(self, status, retry_after, reason):
+        self._outcomes[reason] += 1
+        raise Rejected(status, retry_after, reason)
+
+    def enter(self, client, now=None):
+        """Admet une requête de `client` ou lève Rejected ; appeler `leave()` à la fin"""
+        now = now if now is not None else time.monotonic()
+        with self._lock:
+            if self.max_concurrent and self._active >= self.max_concurrent:
+                self._reject(503, self.retry_after(), 'concurrency')
+            if self.pressure is not None and self.pressure():
+                self._reject(503, self.retry_after(), 'queue')
+            if self.rate > 0:
+                bucket = self._buckets.get(client)
+                if bucket is None:
+                    bucket = self._buckets[client] = TokenBucket(self.burst, now)
+                    if len(self._buckets) > self.max_clients:
+                        self._buckets.popitem(last=False)
+                else:
+                    self._buckets.move_to_end(client)
+                wait = bucket.take(self.rate, self.burst, now)
+                if wait:
+                    self._reject(429, math.ceil(wait), 'rate')
+            self._active += 1
+            self._outcomes['admitted'] += 1
+
+    def leave(self):
+        with self._lock:
+            self._active -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'in_flight': self._active,
+                'max_concurrent': self.max_concurrent,
+                'clients': len(self._buckets),
+                'admitted': self._outcomes['admitted'],
+                'rejected': {reason: self._outcomes[reason] for reason in ('rate', 'concurrency', 'queue')},
+            }
@@ -0,0 +1,226 @@
+"""
+Agrégats de la flotte par site (location), tenus à jour en mémoire
+
+Chaque WAN contribue aux totaux de son site et de la flotte : statut,
+appareils présents et disparus, latence et charge CPU s'il est en ligne.
+Les écritures (enregistrement, rapport d'appareils, battements, passage
+hors ligne, suppression) transmettent l'état résultant du WAN après leur
+commit : sa contribution précédente est retirée et la nouvelle ajoutée, en
+temps constant. Une réconciliation périodique recalcule le tout depuis la
+base et signale les écarts.
+"""
+import math
+import threading
+from collections import Counter
+
+# Appareils par WAN et par statut : parcours de l'index (status, wan_id, ip) seul
+SQL_DEVICE_COUNTS = 'SELECT status, wan_id, COUNT(*) AS count FROM devices GROUP BY status, wan_id'
+SQL_WANS = 'SELECT client_id, location, status, latency, cpu_load FROM wans'
+
+# Champs d'un WAN pris en compte dans les agrégats
+FIELDS = ('location', 'status', 'latency', 'cpu_load', 'devices_up', 'devices_gone')
+
+
+class RunningStat:
+    """Nombre, somme et somme des carrés : moyenne et écart type en O(1)"""
+
+    __slots__ = ('count', 'total', 'squares')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.squares = 0.0
+
+    def add(self, value, sign=1):
+        self.count += sign
+        self.total += sign * value
+        self.squares += sign * value * value
+
+    def as_dict(self):
+        if not self.count:
+            return {'count': 0, 'mean': None, 'stddev': None}
+        mean = self.total / self.count
+        # Les soustractions successives peuvent laisser un résidu négatif
+        variance = max(self.squares / self.count - mean * mean, 0.0)
+        return {'count': self.count, 'mean': round(mean, 3), 'stddev': round(math.sqrt(variance), 3)}
+
+
+class Totals:
+    """Totaux d'un site ou de la flotte"""
+
+    __slots__ = ('wans', 'devices', 'latency', 'cpu_load')
+
+    def __init__(self):
+        self.wans = Counter()
+        self.devices = Counter()
+        self.latency = RunningStat()
+        self.cpu_load = RunningStat()
+
+    def add(self, wan, sign=1):
+        self.wans[wan['status']] += sign
+        self.devices['up'] += sign * wan['devices_up']
+        self.devices['gone'] += sign * wan['devices_gone']
+        # Latence et charge d'un WAN hors ligne ne sont plus d'actualité
+        if wan['status'] == 'online':
+            for name in ('latency', 'cpu_load'):
+                if wan[name] is not None:
+                    getattr(self, name).add(wan[name], sign)
+
+    @property
+    def empty(self):
+        return not any(self.wans.values())
+
+    def as_dict(self):
+        wans = {status: count for status, count in sorted(self.wans.items()) if count}
+        return {
+            'wans': {'total': sum(wans.values()), **wans},
+            'devices': {'up': self.devices['up'], 'gone': self.devices['gone']},
+            'latency': self.latency.as_dict(),
+            'cpu_load': self.cpu_load.as_dict(),
+        }
+
+
+def _number(value):
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class FleetAggregates:
+    """Contribution de chaque WAN et totaux par site, sous un même verrou
+
+    `version` augmente à chaque changement des totaux (ETag de l'API).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wans = {}
+        self._locations = {}
+        self._fleet = Totals()
+        self.version = 0
+        self._updates = 0
+        self._reconciliations = 0
+        self._drifts = 0
+
+    def _remove(self, wan):
+        self._fleet.add(wan, -1)
+        totals = self._locations[wan['location']]
+        totals.add(wan, -1)
+        if totals.empty:
+            del self._locations[wan['location']]
+
+    def _add(self, wan):
+        self._fleet.add(wan)
+        self._locations.setdefault(wan['location'], Totals()).add(wan)
+
+    def update(self, client_id, create=False, **fields):
+        """Remplace une partie de l'état d'un WAN (champs de `FIELDS`)
+
+        Un WAN inconnu n'est créé que si `create` est vrai (enregistrement) :
+        un rapport ou un battement d'un WAN supprimé est ignoré.
+        """
+        for name in ('latency', 'cpu_load'):
+            if name in fields:
+                fields[name] = _number(fields[name])
+        with self._lock:
+            old = self._wans.get(client_id)
+            if old is None:
+                if not create:
+                    return False
+                wan = {'location': '', 'status': 'online', 'latency': None, 'cpu_load': None,
+                       'devices_up': 0, 'devices_gone': 0}
+            else:
+                wan = dict(old)
+            wan.update(fields)
+            wan['location'] = wan['location'] or ''
+            if wan == old:
+                return False
+            if old is not None:
+                self._remove(old)
+            self._add(wan)
+            self._wans[client_id] = wan
+            self.version += 1
+            self._updates += 1
+            return True
+
+    def remove(self, client_id):
+        with self._lock:
+            wan = self._wans.pop(client_id, None)
+            if wan is None:
+                return False
+            self._remove(wan)
+            self.version += 1
+            self._updates += 1
+            return True
+
+    @staticmethod
+    def read(db):
+        """État de chaque WAN recalculé depuis les tables `wans` et `devices`"""
+        wans = {
+            row['client_id']: {
+                'location': row['location'] or '',
+                'status': row['status'],
+                'latency': _number(row['latency']),
+                'cpu_load': _number(row['cpu_load']),
+                'devices_up': 0,
+                'devices_gone': 0,
+            }
+            for row in db.execute(SQL_WANS)
+        }
+        for row in db.execute(SQL_DEVICE_COUNTS):
+            wan = wans.get(row['wan_id'])
+            if wan is not None and row['status'] in ('up', 'gone'):
+                wan[f"devices_{row['status']}"] = row['count']
+        return wans
+
+    def load(self, wans):
+        """Remplace tout l'état par celui lu dans la base (`read`)
+
+        Retourne les WANs dont l'état en mémoire différait : vide si la mise
+        à jour incrémentale n'a pas dérivé.
+        """
+        locations, fleet = {}, Totals()
+        for wan in wans.values():
+            fleet.add(wan)
+            locations.setdefault(wan['location'], Totals()).add(wan)
+        with self._lock:
+            drift = sorted(
+                client_id for client_id in self._wans.keys() | wans.keys()
+                if self._wans.get(client_id) != wans.get(client_id)
+            )
+            self._wans, self._locations, self._fleet = wans, locations, fleet
+            self._reconciliations += 1
+            self._drifts += bool(drift)
+            if drift:
+                self.version += 1
+            return drift
+
+    def summary(self):
+        """Totaux de la flotte et de chaque site"""
+        with self._lock:
+            return {
+                'fleet': self._fleet.as_dict(),
+                'locations': {location: totals.as_dict()
+                              for location, totals in sorted(self._locations.items())},
+            }
+
+    def counts(self):
+        """(WANs par statut, appareils par statut, appareils présents par WAN)"""
+        with self._lock:
+            return (
+                {status: count for status, count in self._fleet.wans.items() if count},
+                dict(self._fleet.devices),
+                {client_id: wan['devices_up'] for client_id, wan in self._wans.items()},
+            )
+
+    def stats(self):
+        with self._lock:
+            return {
+                'wans': len(self._wans),
+                'locations': len(self._locations),
+                'version': self.version,
+                'updates': self._updates,
+                'reconciliations': self._reconciliations,
+                'drifts': self._drifts,
+            }
@@ -5,7 +5,7 @@ import logging
 import threading
 import time
 from datetime import datetime
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, render_template, jsonify, request, Response, stream_with_context, g, url_for
 from dotenv import load_dotenv
 import git
 import sys
@@ -13,6 +13,33 @@ import signal
 import psutil
 import socket
 import subprocess
+import hmac
+import tempfile
+from functools import wraps
+from werkzeug.middleware.proxy_fix import ProxyFix
+from db_pool import ConnectionPool
+from change_tracker import ChangeTracker
+from event_stream import EventBroker
+from device_ingest import apply_device_report, SELECT_WAN_DEVICES
+from migrations import migrate, schema_version, check_query_plans
+import metrics_history
+from ingest_queue import WriteBehindQueue, QueueFull
+from heartbeat import HeartbeatBuffer, WanRegistry
+from liveness import LivenessTracker
+from aggregates import FleetAggregates
+from admission import AdmissionControl, Rejected
+import read_model
+from read_model import ReadModel
+from response_cache import ResponseCache
+import wire
+import listing
+from listing import InvalidQuery
+import search
+import ports
+import export
+import maintenance
+import instrumentation
+import profiling
 
 # Chargement des variables d'environnement
 load_dotenv()
@@ -22,6 +49,77 @@ VERSION = '3.2.0'
 DATABASE_PATH = os.getenv('DATABASE_PATH', 'wans.db')
 LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
 LOG_FILE = os.getenv('LOG_FILE', 'seahawks.log')
+METRICS_ROLLUP_INTERVAL = float(os.getenv('METRICS_ROLLUP_INTERVAL', '60'))
+# Intervalle de réconciliation des agrégats de la flotte avec la base (secondes)
+AGGREGATES_RECONCILE_INTERVAL = float(os.getenv('AGGREGATES_RECONCILE_INTERVAL', '300'))
+# Maintenance de la base (rétention, vacuum, sauvegarde), une fois par intervalle dans la fenêtre creuse
+MAINTENANCE_WINDOW = os.getenv('MAINTENANCE_WINDOW', '02:00-05:00')
+MAINTENANCE_INTERVAL = float(os.getenv('MAINTENANCE_INTERVAL', '86400'))
+# Rétention en jours (0 : jamais supprimés) ; l'historique des métriques a la sienne
+RETENTION_GONE_DEVICES_DAYS = float(os.getenv('RETENTION_GONE_DEVICES_DAYS', '30'))
+RETENTION_STALE_WANS_DAYS = float(os.getenv('RETENTION_STALE_WANS_DAYS', '0'))
+# Pages libres rendues au système au plus par maintenance
+VACUUM_MAX_PAGES = int(os.getenv('VACUUM_MAX_PAGES', '100000'))
+# Sauvegardes à chaud (vide : désactivées) et nombre conservé
+BACKUP_DIR = os.getenv('BACKUP_DIR', 'backups')
+BACKUP_KEEP = int(os.getenv('BACKUP_KEEP', '7'))
+METRICS_RETENTION = {
+    'raw': int(os.getenv('METRICS_RETENTION_RAW', str(metrics_history.DEFAULT_RETENTION['raw']))),
+    '1m': int(os.getenv('METRICS_RETENTION_1M', str(metrics_history.DEFAULT_RETENTION['1m']))),
+    '1h': int(os.getenv('METRICS_RETENTION_1H', str(metrics_history.DEFAULT_RETENTION['1h']))),
+    '1d': int(os.getenv('METRICS_RETENTION_1D', str(metrics_history.DEFAULT_RETENTION['1d']))),
+}
+INGEST_QUEUE_SIZE = int(os.getenv('INGEST_QUEUE_SIZE', '10000'))
+INGEST_BATCH_SIZE = int(os.getenv('INGEST_BATCH_SIZE', '200'))
+INGEST_FLUSH_INTERVAL = float(os.getenv('INGEST_FLUSH_INTERVAL', '0.05'))
+# 'async' : réponse 202 dès la mise en file ; 'commit' : réponse 200 après le commit
+INGEST_DURABILITY = os.getenv('INGEST_DURABILITY', 'async')
+INGEST_COMMIT_TIMEOUT = float(os.getenv('INGEST_COMMIT_TIMEOUT', '30'))
+# Contrôle d'admission de /api/register et /api/devices/update (0 : limite désactivée)
+ADMISSION_CLIENT_RATE = float(os.getenv('ADMISSION_CLIENT_RATE', '0.5'))
+ADMISSION_CLIENT_BURST = float(os.getenv('ADMISSION_CLIENT_BURST', '10'))
+ADMISSION_MAX_CONCURRENT = int(os.getenv('ADMISSION_MAX_CONCURRENT', '16'))
+# Remplissage de la file d'écriture (fraction) au-delà duquel les rapports sont refusés
+ADMISSION_QUEUE_HIGH_WATER = float(os.getenv('ADMISSION_QUEUE_HIGH_WATER', '0.8'))
+# Délai de base annoncé dans les 503 (Retry-After, tiré entre 1 et 2 fois cette valeur)
+ADMISSION_RETRY_AFTER = float(os.getenv('ADMISSION_RETRY_AFTER', '2'))
+# Proxys inverses de confiance devant le serveur (0 : connexion directe). L'adresse
+# du client, clé des seaux d'admission, est alors lue dans X-Forwarded-For
+TRUSTED_PROXIES = int(os.getenv('TRUSTED_PROXIES', '0'))
+LIVENESS_TIMEOUT = float(os.getenv('LIVENESS_TIMEOUT', '10'))
+HEARTBEAT_FLUSH_INTERVAL = float(os.getenv('HEARTBEAT_FLUSH_INTERVAL', '2'))
+EVENTS_HISTORY = int(os.getenv('EVENTS_HISTORY', '1000'))
+EVENTS_SUBSCRIBER_BUFFER = int(os.getenv('EVENTS_SUBSCRIBER_BUFFER', '256'))
+EVENTS_KEEPALIVE = float(os.getenv('EVENTS_KEEPALIVE', '15'))
+# Nombre maximal de réponses JSON gardées en cache (éviction LRU)
+RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', '1024'))
+# Exports simultanés (chacun occupe une connexion du pool jusqu'à la fin du flux)
+EXPORT_MAX_CONCURRENT = int(os.getenv('EXPORT_MAX_CONCURRENT', '2'))
+# Compression des réponses (gzip/deflate) au-delà de cette taille, en octets
+WIRE_COMPRESS_MIN_SIZE = int(os.getenv('WIRE_COMPRESS_MIN_SIZE', '1024'))
+WIRE_COMPRESS_LEVEL = int(os.getenv('WIRE_COMPRESS_LEVEL', '6'))
+WIRE_MAX_BODY_SIZE = int(os.getenv('WIRE_MAX_BODY_SIZE', str(wire.MAX_BODY_SIZE)))
+SERVER_HOST = os.getenv('SERVER_HOST', '0.0.0.0')
+SERVER_PORT = int(os.getenv('SERVER_PORT', '5000'))
+# Threads de traitement des requêtes (chaque flux SSE ouvert en occupe un)
+SERVER_THREADS = int(os.getenv('SERVER_THREADS', '32'))
+SERVER_BACKLOG = int(os.getenv('SERVER_BACKLOG', '128'))
+SERVER_KEEPALIVE = float(os.getenv('SERVER_KEEPALIVE', '5'))
+# Rechargement (server.py --supervise) : délai accordé aux requêtes en cours à l'arrêt,
+# et au nouveau processus pour répondre à son contrôle de santé
+SERVER_DRAIN_TIMEOUT = float(os.getenv('SERVER_DRAIN_TIMEOUT', '30'))
+SERVER_READY_TIMEOUT = float(os.getenv('SERVER_READY_TIMEOUT', '60'))
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '8'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '10'))
+DB_BUSY_TIMEOUT_MS = int(os.getenv('DB_BUSY_TIMEOUT_MS', '5000'))
+DB_SYNCHRONOUS = os.getenv('DB_SYNCHRONOUS', 'NORMAL')
+DB_CACHED_STATEMENTS = int(os.getenv('DB_CACHED_STATEMENTS', '256'))
+# Nombre d'appareils actifs par WAN dans /metrics (une série par WAN)
+METRICS_PER_WAN = os.getenv('METRICS_PER_WAN', 'true').lower() in ('1', 'true', 'yes')
+# Jeton des routes d'administration (/api/admin/...) ; vide : routes désactivées
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', '')
+PROFILE_MAX_SECONDS = float(os.getenv('PROFILE_MAX_SECONDS', '60'))
+PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL', '0.005'))
 
 # Configuration du logging
 logging.basicConfig(
@@ -37,46 +135,410 @@ logger = logging.getLogger(__name__)
 # Initialisation de Flask
 app = Flask(__name__)
 app.config['JSON_SORT_KEYS'] = False
+if TRUSTED_PROXIES:
+    # Sans cela, tous les WANs derrière le proxy partageraient un seul seau d'admission
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES)
+
+# Métriques Prometheus exposées sur /metrics
+metrics = instrumentation.Registry()
+http_duration = metrics.histogram(
+    'seahawks_http_request_duration_seconds', 'Durée de traitement des requêtes HTTP',
+    ('route', 'method', 'status'),
+)
+db_query_duration = metrics.histogram(
+    'seahawks_db_query_duration_seconds', 'Durée des requêtes SQLite (jusqu\'à la première ligne)',
+    ('operation', 'table'),
+)
+ingest_payload_bytes = metrics.histogram(
+    'seahawks_ingest_payload_bytes', 'Taille des corps de requête reçus, tels que transmis',
+    ('route', 'encoding'), buckets=instrumentation.SIZE_BUCKETS,
+)
+ingest_devices = metrics.histogram(
+    'seahawks_ingest_devices', "Nombre d'appareils par rapport reçu",
+    buckets=instrumentation.COUNT_BUCKETS,
+)
+maintenance_duration = metrics.histogram(
+    'seahawks_maintenance_duration_seconds', 'Durée des étapes de maintenance de la base',
+    ('step',), buckets=(0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0),
+)
+background_duration = metrics.histogram(
+    'seahawks_background_loop_duration_seconds', "Durée d'un passage des tâches de fond",
+    ('task',),
+)
+app.wsgi_app = instrumentation.WSGIMetrics(app.wsgi_app, http_duration)
+
+@app.before_request
+def record_route():
+    """Gabarit de la route pour les métriques (et non le chemin, de cardinalité non bornée)"""
+    if request.url_rule is not None:
+        request.environ[instrumentation.WSGIMetrics.ROUTE_KEY] = request.url_rule.rule
+
+# Routes d'ingestion soumises au contrôle d'admission
+ADMITTED_ENDPOINTS = ('register_wan', 'update_devices')
+
+def admission_key():
+    """Clé du seau de jetons d'une requête : adresse du client et, s'il est enregistré, son identifiant
+
+    L'en-tête X-Client-Id est fourni par le client : seul, il permettrait de
+    vider le seau d'un autre WAN ou de changer d'identifiant pour échapper
+    à sa limite. Il ne fait que séparer les WANs enregistrés derrière une
+    même adresse (NAT). Derrière un proxy inverse, TRUSTED_PROXIES fait de
+    `remote_addr` l'adresse transmise par le proxy.
+    """
+    client_id = request.headers.get('X-Client-Id')
+    if client_id and client_id in registry:
+        return (request.remote_addr, client_id)
+    return (request.remote_addr, None)
+
+@app.before_request
+def admit_ingestion():
+    """Admet ou refuse (429/503 avec Retry-After) une requête d'ingestion, avant décodage du corps"""
+    if request.endpoint not in ADMITTED_ENDPOINTS:
+        return None
+    try:
+        admission.enter(admission_key())
+    except Rejected as e:
+        logger.debug(f"Requête {request.endpoint} refusée ({e.reason}), Retry-After {e.retry_after}s")
+        message = ("Trop de requêtes pour ce client, réessayez plus tard" if e.status == 429
+                   else 'Serveur saturé, réessayez plus tard')
+        return jsonify({'error': message, 'retry_after': e.retry_after}), e.status, {'Retry-After': str(e.retry_after)}
+    g.admitted = True
+    return None
+
+@app.teardown_request
+def release_admission(exc):
+    if g.pop('admitted', False):
+        admission.leave()
+
+# Types de réponse qui gagnent à être compressés
+COMPRESSIBLE_TYPES = ('application/json', 'application/javascript', 'text/html', 'text/css', 'text/plain')
+
+@app.before_request
+def decode_request_body():
+    """Décode les corps JSON ou binaires, éventuellement compressés (gzip/deflate)"""
+    if request.method != 'POST' or not request.content_length:
+        return None
+    ingest_payload_bytes.observe(
+        request.content_length,
+        request.url_rule.rule if request.url_rule is not None else '<unmatched>',
+        request.headers.get('Content-Encoding', 'identity'),
+    )
+    try:
+        g.payload = wire.decode_body(
+            request.get_data(cache=False),
+            request.content_type,
+            request.headers.get('Content-Encoding'),
+            max_size=WIRE_MAX_BODY_SIZE,
+        )
+    except wire.UnsupportedEncoding as e:
+        return jsonify({'error': str(e)}), 415
+    except wire.WireError as e:
+        return jsonify({'error': str(e)}), 400
+    # Les routes d'ingestion attendent un objet dont l'identifiant est une chaîne
+    if not isinstance(g.payload, dict):
+        return jsonify({'error': 'Le corps de la requête doit être un objet JSON'}), 400
+    for field in ('client_id', 'wan_id'):
+        if field in g.payload and not isinstance(g.payload[field], str):
+            return jsonify({'error': f'{field} doit être une chaîne'}), 400
+    return None
+
+def read_payload():
+    """Corps de la requête décodé par `decode_request_body` : objet, ou None s'il est vide"""
+    return g.get('payload')
+
+@app.after_request
+def negotiate_encoding(response):
+    """Annonce les formats acceptés et compresse les réponses volumineuses"""
+    if request.method == 'POST':
+        # RFC 7694 : les clients récents compressent leurs envois suivants
+        response.headers['Accept-Encoding'] = ', '.join(wire.ENCODINGS)
+        response.headers['Accept-Post'] = f'{wire.JSON_TYPE}, {wire.BINARY_TYPE}'
+
+    # Flux SSE et fichiers statiques ne sont jamais mis en mémoire pour être compressés
+    if (response.direct_passthrough or response.is_streamed or response.status_code != 200
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_TYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = wire.negotiate(request.headers.get('Accept-Encoding'))
+    if encoding is None or (response.content_length or 0) < WIRE_COMPRESS_MIN_SIZE:
+        return response
+    response.set_data(wire.compress(response.get_data(), encoding, WIRE_COMPRESS_LEVEL))
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+# Pool de connexions partagé par les routes et les threads de fond
+db_pool = ConnectionPool(
+    DATABASE_PATH,
+    max_size=DB_POOL_SIZE,
+    acquire_timeout=DB_POOL_TIMEOUT,
+    busy_timeout_ms=DB_BUSY_TIMEOUT_MS,
+    synchronous=DB_SYNCHRONOUS,
+    cached_statements=DB_CACHED_STATEMENTS,
+    connection_factory=instrumentation.timed_connection_factory(db_query_duration),
+    # Base neuve : pages libres rendues par le vacuum incrémental (maintenance.py)
+    auto_vacuum='INCREMENTAL',
+)
 
 def get_db():
-    """Crée une connexion à la base de données"""
-    db = sqlite3.connect(DATABASE_PATH)
-    db.row_factory = sqlite3.Row
-    return db
+    """Emprunte une connexion au pool (à utiliser avec `with`)"""
+    return db_pool.connection()
+
+# Requêtes fréquentes, vérifiées au démarrage avec EXPLAIN QUERY PLAN
+SQL_ONLINE_WANS = '''
+    SELECT client_id, CAST(strftime('%s', last_seen) AS INTEGER) AS last_seen_ts, liveness_timeout
+    FROM wans WHERE status = 'online'
+'''
+
+def listing_query(target, sort, filters=None, scope=None):
+    """(sql, paramètres) d'une page suivante de liste, pour la vérification des plans"""
+    query = listing.ListQuery(sort, False, listing.DEFAULT_LIMIT, ['', ''], filters or {})
+    return target.sql(query, scope)
+
+def search_query(q, kind='auto'):
+    """(sql, paramètres) d'une recherche, pour la vérification des plans"""
+    return search.sql(search.parse({'q': q, 'type': kind}))
+
+HOT_QUERIES = {
+    'wans_page': listing_query(listing.WANS, 'client_id'),
+    'wans_by_name': listing_query(listing.WANS, 'name'),
+    'wans_by_last_seen': listing_query(listing.WANS, 'last_seen'),
+    'wans_online': listing_query(listing.WANS, 'client_id', {'status': 'online'}),
+    'wans_by_location': listing_query(listing.WANS, 'client_id', {'location': ''}),
+    'wans_by_hostname': listing_query(listing.WANS, 'client_id', {'hostname': 'srv'}),
+    'wan_devices_page': listing_query(listing.DEVICES, 'ip', scope={'wan_id': ''}),
+    'wan_devices_up': listing_query(listing.DEVICES, 'ip', {'status': 'up'}, {'wan_id': ''}),
+    'wan_devices_by_mac': listing_query(listing.DEVICES, 'mac', scope={'wan_id': ''}),
+    'wan_devices_by_last_seen': listing_query(listing.DEVICES, 'last_seen', scope={'wan_id': ''}),
+    'devices_page': listing_query(listing.DEVICES, 'ip'),
+    'devices_by_ip': listing_query(listing.DEVICES, 'id', {'ip': '10.'}),
+    'delete_wan_devices': (maintenance.SQL_DELETE_WAN_DEVICES, ('',)),
+    'expired_devices': (maintenance.SQL_EXPIRED_DEVICES, ('', maintenance.DELETE_BATCH)),
+    'gone_devices_count': (maintenance.SQL_GONE_COUNT, ('',)),
+    'stale_wans': (maintenance.SQL_STALE_WANS, ('', maintenance.WAN_DELETE_BATCH)),
+    'ingest_existing_devices': (SELECT_WAN_DEVICES, ('',)),
+    'online_wans': (SQL_ONLINE_WANS, ()),
+    'snapshot_wan_devices': (read_model.SQL_WAN_DEVICES, ('',)),
+    'search_mac': search_query('aa:bb:cc'),
+    'search_ip': search_query('10.1.'),
+    'search_cidr': search_query('10.1.0.0/16'),
+    'top_ports': (ports.SQL_TOP_PORTS.format(where=''), (10,)),
+    'port_devices': (ports.SQL_PORT_DEVICES.format(after='AND (p.wan_id, p.device_id) > (?, ?)'),
+                     (23, 'tcp', '', 0, 100)),
+    'port_exposure': (ports.SQL_WAN_EXPOSURE.format(where='WHERE (p.port = ? AND p.protocol = ?)'),
+                      (23, 'tcp', 100)),
+    'wan_ports': (ports.SQL_WAN_PORTS, ('',)),
+    'devices_by_port': listing_query(listing.DEVICES, 'ip', {'port': '23'}, {'wan_id': ''}),
+}
+
+# Recherches servies par l'index FTS5, vérifiées seulement s'il existe
+SEARCH_INDEX_QUERIES = {
+    'search_text': search_query('printer', 'text'),
+    'search_hostname': search_query('printer*'),
+}
+# Index FTS5 des appareils disponible (tokenizer trigram), fixé par init_db
+search_fts = False
+
+# Versions de changement des WANs, incrémentées après chaque écriture
+changes = ChangeTracker()
+
+# Colonnes renvoyées par l'API de statut groupé, dans cet ordre
+STATUS_FIELDS = ('status', 'latency', 'cpu_load', 'last_seen')
+
+# Canal de diffusion des changements vers les tableaux de bord (SSE)
+events = EventBroker(history=EVENTS_HISTORY, subscriber_buffer=EVENTS_SUBSCRIBER_BUFFER)
+
+def select_in(db, sql, ids, chunk_size=500):
+    """Exécute `sql` (contenant `{ids}`) par paquets d'identifiants
+
+    Évite de dépasser la limite de paramètres SQLite sur les grandes flottes.
+    """
+    ids = list(ids)
+    rows = []
+    for i in range(0, len(ids), chunk_size):
+        chunk = ids[i:i + chunk_size]
+        rows.extend(db.execute(sql.format(ids=','.join('?' * len(chunk))), chunk).fetchall())
+    return rows
+
+def notify_wans_changed(db, client_ids):
+    """Signale des WANs modifiés (à appeler après le commit)
+
+    Incrémente leurs versions et publie leur nouvel état aux abonnés SSE.
+    """
+    if not client_ids:
+        return
+    changes.bump(*client_ids)
+    columns = ', '.join(('client_id',) + STATUS_FIELDS)
+    rows = select_in(db, f'SELECT {columns} FROM wans WHERE client_id IN ({{ids}})', client_ids)
+    for row in rows:
+        events.publish('wan', dict(row))
+
+# Corps JSON des API de lecture, réutilisés tant que la version n'a pas changé
+responses = ResponseCache(max_entries=RESPONSE_CACHE_SIZE)
+
+def conditional_json(key, version, build):
+    """Réponse JSON avec ETag, servie depuis le cache tant que `version` ne change pas
+
+    `build()` n'est appelée qu'en cas d'absence du cache ; elle retourne les
+    données à sérialiser, éventuellement accompagnées d'en-têtes
+    `(données, en-têtes)`, ou None si la ressource n'existe pas (404).
+    La version doit être lue avant `build()` : une écriture concurrente
+    donnera au pire un corps plus récent que son ETag, jamais l'inverse.
+    """
+    etag = f'{changes.epoch}-{version}'
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        # Chaque codage a son entrée : un corps compressé n'est calculé qu'une fois
+        accepted = wire.negotiate(request.headers.get('Accept-Encoding'))
+        cached = responses.get((key, accepted), etag)
+        if cached is None:
+            data = build()
+            if data is None:
+                return jsonify({'error': 'Ressource non trouvée'}), 404
+            data, headers = data if isinstance(data, tuple) else (data, {})
+            body, encoding = jsonify(data).get_data(), None
+            if accepted and len(body) >= WIRE_COMPRESS_MIN_SIZE:
+                body, encoding = wire.compress(body, accepted, WIRE_COMPRESS_LEVEL), accepted
+            cached = (body, encoding, headers)
+            responses.put((key, accepted), etag, cached)
+        body, encoding, headers = cached
+        response = Response(body, mimetype='application/json', headers=headers)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag, weak=True)
+    response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def after_write_commit(db, results):
+    """Propage les écritures d'un lot validé (instantané de lecture, versions, événements SSE)"""
+    changed = []
+    touched = []
+    devices_changed = []
+    # Appareils à relire : liste complète du WAN, ou seules clés écrites
+    devices_reload = []
+    device_keys = {}
+    removed = []
+    for result in results:
+        if result:
+            changed.extend(result.get('changed', ()))
+            touched.extend(result.get('touched', ()))
+            devices_changed.extend(result.get('devices_changed', ()))
+            removed.extend(result.get('removed', ()))
+            keys = dict(result.get('device_keys', ()))
+            for wan_id in result.get('devices_changed', ()):
+                if wan_id in keys:
+                    device_keys.setdefault(wan_id, set()).update(keys[wan_id])
+                else:
+                    devices_reload.append(wan_id)
+    # Avant les versions : un ETag lu ensuite ne précède jamais l'instantané publié
+    snapshots.apply(db, wans=changed + touched, devices=devices_reload, device_keys=device_keys,
+                    removed=removed)
+    changed = list(dict.fromkeys(changed))
+    notify_wans_changed(db, changed)
+    # last_seen seul : nouvelle version (ETags, deltas) sans événement SSE
+    touched = set(touched).difference(changed)
+    if touched:
+        changes.bump(*touched)
+    if devices_changed:
+        changes.bump_devices(*dict.fromkeys(devices_changed))
+    for result in results:
+        if not result:
+            continue
+        for client_id, metadata in result.get('registered', ()):
+            registry.set(client_id, metadata)
+        for client_id in result.get('removed', ()):
+            registry.remove(client_id)
+            liveness.forget(client_id)
+            changes.remove(client_id)
+            fleet.remove(client_id)
+            events.publish('wan_removed', {'client_id': client_id})
+        for client_id, fields in result.get('aggregates', ()):
+            fleet.update(client_id, **fields)
+        reloaded = result.get('reloaded')
+        if reloaded:
+            changes.bump(*reloaded)
+            changes.bump_devices(*reloaded)
+        if 'aggregates_reload' in result:
+            drift = fleet.load(result['aggregates_reload'])
+            if drift:
+                logger.warning(f"Agrégats recalculés, {len(drift)} WAN(s) en écart : {', '.join(drift[:10])}")
+        for event, data in result.get('events', ()):
+            events.publish(event, data)
+
+# Battements de cœur regroupés en mémoire et métadonnées connues des WANs
+heartbeats = HeartbeatBuffer()
+registry = WanRegistry()
+
+# Échéances de présence : remplace le balayage périodique de la table wans
+liveness = LivenessTracker(default_timeout=LIVENESS_TIMEOUT)
+
+# Totaux par site et de la flotte, mis à jour après chaque écriture
+fleet = FleetAggregates()
+
+# Instantané des WANs et appareils servi aux lectures, republié après chaque écriture
+snapshots = ReadModel()
+
+# Rédacteur unique : les routes d'ingestion valident puis mettent en file
+writer = WriteBehindQueue(
+    db_pool,
+    maxsize=INGEST_QUEUE_SIZE,
+    batch_size=INGEST_BATCH_SIZE,
+    flush_interval=INGEST_FLUSH_INTERVAL,
+    on_commit=after_write_commit,
+)
+
+# Délestage des tempêtes d'ingestion (redémarrage du serveur : tous les clients à la fois)
+admission = AdmissionControl(
+    rate=ADMISSION_CLIENT_RATE,
+    burst=ADMISSION_CLIENT_BURST,
+    max_concurrent=ADMISSION_MAX_CONCURRENT,
+    retry_after=ADMISSION_RETRY_AFTER,
+    pressure=lambda: writer.depth >= writer.capacity * ADMISSION_QUEUE_HIGH_WATER,
+)
+
+def enqueue_write(fn, label):
+    """Met une écriture en file et construit la réponse HTTP"""
+    try:
+        op = writer.submit(fn, label)
+    except QueueFull as e:
+        logger.warning(f"{str(e)}, {label} refusé")
+        return jsonify({'error': 'Serveur saturé, réessayez plus tard'}), 503, {'Retry-After': str(admission.retry_after())}
+    if INGEST_DURABILITY == 'commit':
+        result = op.wait(INGEST_COMMIT_TIMEOUT) or {}
+        return jsonify({'success': True, **result.get('response', {})})
+    return jsonify({'success': True, 'queued': True}), 202
 
 def init_db():
-    """Initialise la base de données"""
+    """Initialise la base de données et applique les migrations en attente"""
+    global search_fts
     try:
         with get_db() as db:
-            db.execute('''
-                CREATE TABLE IF NOT EXISTS wans (
-                    client_id TEXT PRIMARY KEY,
-                    name TEXT NOT NULL,
-                    ip TEXT NOT NULL,
-                    subnet TEXT NOT NULL,
-                    location TEXT NOT NULL,
-                    hostname TEXT NOT NULL,
-                    status TEXT DEFAULT 'offline',
-                    last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    latency REAL,
-                    cpu_load REAL
-                )
-            ''')
-            
-            db.execute('''
-                CREATE TABLE IF NOT EXISTS devices (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    wan_id TEXT NOT NULL,
-                    mac TEXT NOT NULL,
-                    ip TEXT NOT NULL,
-                    hostname TEXT,
-                    last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    open_ports TEXT,
-                    FOREIGN KEY (wan_id) REFERENCES wans (client_id)
-                )
-            ''')
-            db.commit()
-            logger.info("Base de données initialisée avec succès")
+            applied = migrate(db)
+            if applied:
+                logger.info(f"Migrations appliquées : {applied}")
+            logger.info(f"Base de données initialisée avec succès (schéma v{schema_version(db)})")
+
+            registry.load(db)
+            fleet.load(FleetAggregates.read(db))
+            snapshot = snapshots.load(db)
+            logger.info(f"Instantané de lecture chargé : {snapshot.counts()}")
+            liveness.bootstrap(
+                (row['client_id'], True, row['last_seen_ts'], row['liveness_timeout'])
+                for row in db.execute(SQL_ONLINE_WANS)
+            )
+
+            search_fts = search.has_index(db)
+            if not search_fts:
+                logger.warning("Index de recherche absent : recherches par sous-chaîne sans index")
+
+            problems = check_query_plans(db, {**HOT_QUERIES, **(SEARCH_INDEX_QUERIES if search_fts else {})})
+            for name, plan in problems.items():
+                logger.warning(f"Requête {name} sans index : {' | '.join(plan)}")
     except Exception as e:
         logger.error(f"Erreur lors de l'initialisation de la base de données: {str(e)}")
         raise
@@ -93,12 +555,31 @@ def get_server_ip():
         return 'localhost'
 
 # Routes principales
+def with_snapshot(snapshot, response):
+    """Ajoute à une réponse la version de l'instantané qui l'a produite"""
+    response = app.make_response(response)
+    response.headers['X-Snapshot-Version'] = str(snapshot.version)
+    return response
+
 @app.route('/')
 def index():
-    """Page d'accueil"""
-    with get_db() as db:
-        wans = db.execute('SELECT * FROM wans').fetchall()
-        return render_template('index.html', wans=wans, server_ip=get_server_ip())
+    """Page d'accueil, servie depuis l'instantané de lecture (sans accès à la base)"""
+    snapshot = snapshots.current
+    started = time.perf_counter()
+    wans = snapshot.dashboard()
+    view_ms = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    html = render_template('index.html', wans=wans, server_ip=get_server_ip())
+    render_ms = (time.perf_counter() - started) * 1000
+
+    logger.debug(
+        f"Tableau de bord : {len(wans)} WANs, instantané v{snapshot.version}, "
+        f"vue {view_ms:.1f} ms, rendu {render_ms:.1f} ms"
+    )
+    response = with_snapshot(snapshot, html)
+    response.headers['Server-Timing'] = f"snapshot;dur={view_ms:.1f}, render;dur={render_ms:.1f}"
+    return response
 
 @app.route('/changelog')
 def changelog():
@@ -117,23 +598,63 @@ def changelog():
 
 @app.route('/wan/<client_id>')
 def wan_devices(client_id):
-    """Affiche les appareils d'un WAN"""
-    with get_db() as db:
-        wan = db.execute('SELECT * FROM wans WHERE client_id = ?', (client_id,)).fetchone()
-        if not wan:
+    """Affiche les appareils d'un WAN (page par page, mêmes paramètres que l'API)"""
+    snapshot = snapshots.current
+    try:
+        query = listing.DEVICES.parse(request.args)
+        wan = snapshot.wan(client_id)
+        if wan is None:
             return "WAN non trouvé", 404
-            
-        devices = db.execute('SELECT * FROM devices WHERE wan_id = ?', (client_id,)).fetchall()
-        return render_template('devices.html', wan=wan, devices=devices)
+        devices, next_cursor = snapshot.devices_page(client_id, query)
+    except InvalidQuery as e:
+        return str(e), 400
+    next_url = next_page_url(next_cursor) if next_cursor else None
+    return with_snapshot(snapshot, render_template('devices.html', wan=wan, devices=devices, next_url=next_url))
+
+def next_page_url(cursor):
+    """URL de la page suivante : mêmes paramètres, nouveau curseur"""
+    args = request.args.to_dict()
+    args['cursor'] = cursor
+    return url_for(request.endpoint, **request.view_args, **args)
+
+def paginated(items, next_cursor):
+    """Résultat de `build()` pour une liste : en-têtes Link et X-Next-Cursor"""
+    if not next_cursor:
+        return items
+    return items, {'Link': f'<{next_page_url(next_cursor)}>; rel="next"', 'X-Next-Cursor': next_cursor}
+
+def list_devices(query, scope=None):
+    """Page d'appareils avec `open_ports` décodé"""
+    with get_db() as db:
+        devices, next_cursor = listing.DEVICES.page(db, query, scope)
+    for device in devices:
+        device['open_ports'] = ports.decode_ports(device['open_ports'])
+    return devices, next_cursor
 
 # Routes API
 @app.route('/api/wans')
 def get_wans():
-    """Récupère la liste des WANs"""
+    """Liste des WANs, paginée par curseur
+
+    Paramètres : `limit` (100 par défaut, 1000 au plus), `cursor` (en-tête
+    X-Next-Cursor ou lien `next` de la page précédente), `sort` (client_id,
+    name, location, last_seen ; préfixe `-` pour l'ordre décroissant) et les
+    filtres `status`, `location`, `hostname` et `ip` (préfixes).
+    """
     try:
-        with get_db() as db:
-            wans = db.execute('SELECT * FROM wans').fetchall()
-            return jsonify([dict(wan) for wan in wans])
+        query = listing.WANS.parse(request.args)
+    except InvalidQuery as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Version lue avant l'instantané : l'instantané est publié avant la version
+    # (after_write_commit), il n'est donc jamais plus ancien qu'elle
+    version = changes.version
+    snapshot = snapshots.current
+    try:
+        return with_snapshot(snapshot, conditional_json(
+            ('wans', query.key), version, lambda: paginated(*snapshot.wans_page(query))))
+    except InvalidQuery as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Erreur lors de la récupération des WANs: {str(e)}")
         return jsonify({'error': 'Erreur serveur'}), 500
@@ -141,37 +662,423 @@ def get_wans():
 @app.route('/api/wans/<client_id>')
 def get_wan(client_id):
     """Récupère les détails d'un WAN"""
+    version = changes.version_of(client_id)
+    snapshot = snapshots.current
     try:
-        with get_db() as db:
-            wan = db.execute('SELECT * FROM wans WHERE client_id = ?', (client_id,)).fetchone()
-            if not wan:
-                return jsonify({'error': 'WAN non trouvé'}), 404
-            return jsonify(dict(wan))
+        return with_snapshot(snapshot, conditional_json(
+            ('wan', client_id), version, lambda: snapshot.wan(client_id)))
     except Exception as e:
         logger.error(f"Erreur lors de la récupération du WAN: {str(e)}")
         return jsonify({'error': 'Erreur serveur'}), 500
 
+@app.route('/api/wans/<client_id>/devices')
+def get_wan_devices(client_id):
+    """Appareils d'un WAN, paginés par curseur
+
+    Paramètres : `limit`, `cursor`, `sort` (ip, mac, last_seen, id) et les
+    filtres `status` (up, gone), `hostname`, `ip`, `mac` (préfixes), `port`
+    (port ouvert) et `has_open_ports`.
+    """
+    try:
+        query = listing.DEVICES.parse(request.args)
+    except InvalidQuery as e:
+        return jsonify({'error': str(e)}), 400
+
+    version = changes.devices_version_of(client_id)
+    snapshot = snapshots.current
+
+    def build():
+        page = snapshot.devices_page(client_id, query)
+        return paginated(*page) if page is not None else None
+
+    try:
+        return with_snapshot(snapshot, conditional_json(
+            ('devices', client_id, query.key), version, build))
+    except InvalidQuery as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Erreur lors de la récupération des appareils du WAN: {str(e)}")
+        return jsonify({'error': 'Erreur serveur'}), 500
+
+@app.route('/api/devices')
+def get_devices():
+    """Appareils de toute la flotte, paginés par curseur
+
+    Mêmes paramètres que /api/wans/<client_id>/devices, plus le filtre `wan_id`.
+    """
+    try:
+        query = listing.DEVICES.parse(request.args)
+    except InvalidQuery as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        return conditional_json(('devices', query.key), changes.version,
+                                lambda: paginated(*list_devices(query)))
+    except Exception as e:
+        logger.error(f"Erreur lors de la récupération des appareils: {str(e)}")
+        return jsonify({'error': 'Erreur serveur'}), 500
+
+@app.route('/api/search')
+def search_devices():
+    """Recherche d'appareils dans toute la flotte
+
+    `q` : MAC ou début de MAC (aa:bb:cc), IP ou préfixe (10.1.), réseau
+    CIDR (10.1.0.0/16), début de nom d'hôte (printer*) ou sous-chaîne du
+    nom d'hôte, du fabricant, de la MAC ou de l'IP. `type` force la forme
+    (mac, ip, cidr, hostname, text) ; filtres `status` et `wan_id`.
+    """
+    try:
+        query = search.parse(request.args, fts=search_fts)
+    except InvalidQuery as e:
+        return jsonify({'error': str(e)}), 400
+
+    def build():
+        with get_db() as db:
+            devices, truncated = search.run(db, query)
+        for device in devices:
+            device['open_ports'] = ports.decode_ports(device['open_ports'])
+        return {
+            'query': query.q,
+            'type': query.kind,
+            'count': len(devices),
+            'truncated': truncated,
+            'results': devices,
+        }
+
+    try:
+        return conditional_json(('search', query.key), changes.version, build)
+    except Exception as e:
+        logger.error(f"Erreur lors de la recherche d'appareils: {str(e)}")
+        return jsonify({'error': 'Erreur serveur'}), 500
+
+export_slots = threading.BoundedSemaphore(EXPORT_MAX_CONCURRENT)
+
+@app.route('/api/export/<dataset>')
+def export_inventory(dataset):
+    """Export en flux de l'inventaire : `wans`, `devices` ou `all`
+
+    Paramètres : `format` (ndjson par défaut, ou csv) et les filtres des
+    listes (`status`, `wan_id`, `location`, `ip`, `port`...). Les lignes sont
+    lues sur un instantané cohérent de la base et envoyées au fil de l'eau.
+    """
+    try:
+        query = export.parse(dataset, request.args)
+    except InvalidQuery as e:
+        return jsonify({'error': str(e)}), 400
+    if not export_slots.acquire(blocking=False):
+        return jsonify({'error': "Trop d'exports en cours, réessayez plus tard"}), 503, {'Retry-After': '10'}
+    try:
+        db = db_pool.acquire()
+    except Exception as e:
+        export_slots.release()
+        logger.error(f"Erreur lors de l'export de l'inventaire: {str(e)}")
+        return jsonify({'error': 'Erreur serveur'}), 500
+
+    def generate():
+        try:
+            yield from export.stream(db, query)
+        except Exception as e:
+            # Les en-têtes sont déjà partis : le flux est simplement interrompu
+            logger.error(f"Export {dataset} interrompu: {str(e)}")
+            raise
+
+    def release():
+        db_pool.release(db)
+        export_slots.release()
+
+    response = Response(generate(), mimetype=query.mimetype, headers={
+        'Content-Disposition': f'attachment; filename="{query.filename(time.strftime("%Y%m%d-%H%M%S"))}"',
+        'Cache-Control': 'no-store',
+        'X-Accel-Buffering': 'no',
+    })
+    # Appelé à la fermeture de la réponse, même si le flux n'a jamais été lu
+    response.call_on_close(release)
+    return response
+
+@app.route('/api/ports/top')
+def top_ports():
+    """Ports les plus exposés de la flotte (`limit`, `protocol`)"""
+    try:
+        limit = ports.parse_limit(request.args.get('limit'), 20)
+        protocol = ports.parse_protocol(request.args['protocol']) if request.args.get('protocol') else None
+    except InvalidQuery as e:
+        return jsonify({'error': str(e)}), 400
+
+    def build():
+        with get_db() as db:
+            return ports.top_ports(db, limit, protocol)
+
+    try:
+        return conditional_json(('ports_top', limit, protocol), changes.version, build)
+    except Exception as e:
+        logger.error(f"Erreur lors du calcul des ports exposés: {str(e)}")
+        return jsonify({'error': 'Erreur serveur'}), 500
+
+@app.route('/api/ports/<int:port>/devices')
+def port_devices(port):
+    """Appareils présents exposant un port (`protocol`, `limit`, `cursor`)"""
+    try:
+        ports.parse_port(port)
+        protocol = ports.parse_protocol(request.args.get('protocol'))
+        limit = ports.parse_limit(request.args.get('limit'))
+        cursor = request.args.get('cursor')
+    except InvalidQuery as e:
+        return jsonify({'error': str(e)}), 400
+
+    def build():
+        with get_db() as db:
+            return paginated(*ports.port_devices(db, port, protocol, limit, cursor))
+
+    try:
+        return conditional_json(('ports_devices', port, protocol, limit, cursor), changes.version, build)
+    except InvalidQuery as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Erreur lors de la récupération des appareils du port {port}: {str(e)}")
+        return jsonify({'error': 'Erreur serveur'}), 500
+
+@app.route('/api/ports/exposure')
+def port_exposure():
+    """Appareils exposés et ports ouverts par WAN
+
+    `port` (répétable, `445` ou `161/udp`) restreint aux ports indiqués.
+    """
+    try:
+        specs = tuple(sorted({ports.parse_port_spec(value) for value in request.args.getlist('port')}))
+        limit = ports.parse_limit(request.args.get('limit'))
+    except InvalidQuery as e:
+        return jsonify({'error': str(e)}), 400
+
+    def build():
+        with get_db() as db:
+            return ports.wan_exposure(db, specs, limit)
+
+    try:
+        return conditional_json(('ports_exposure', specs, limit), changes.version, build)
+    except Exception as e:
+        logger.error(f"Erreur lors du calcul de l'exposition des WANs: {str(e)}")
+        return jsonify({'error': 'Erreur serveur'}), 500
+
+@app.route('/api/wans/<client_id>/ports')
+def get_wan_ports(client_id):
+    """Ports ouverts d'un WAN et nombre d'appareils qui les exposent"""
+    def build():
+        if client_id not in registry:
+            return None
+        with get_db() as db:
+            return ports.wan_ports(db, client_id)
+
+    try:
+        return conditional_json(('wan_ports', client_id), changes.devices_version_of(client_id), build)
+    except Exception as e:
+        logger.error(f"Erreur lors de la récupération des ports du WAN: {str(e)}")
+        return jsonify({'error': 'Erreur serveur'}), 500
+
+@app.route('/api/wans/status')
+def get_wans_status():
+    """Statut groupé de la flotte (tous les WANs ou une liste d'IDs)
+
+    Paramètres : `ids` (liste séparée par des virgules), `since` et `epoch`
+    pour ne recevoir que les WANs modifiés depuis une version donnée.
+    """
+    try:
+        ids = [i for i in request.args.get('ids', '').split(',') if i]
+        since = request.args.get('since', type=int)
+        epoch = request.args.get('epoch')
+
+        # La version est lue avant la requête : une écriture concurrente
+        # sera renvoyée au prochain appel plutôt que perdue
+        version = changes.version
+        delta = changes.changed_since(since, epoch) if since is not None else None
+        removed = []
+
+        if delta is not None:
+            changed, removed = delta
+            if ids:
+                wanted = set(ids)
+                changed = [cid for cid in changed if cid in wanted]
+                removed = [cid for cid in removed if cid in wanted]
+            ids = changed
+
+        rows = []
+        if delta is None or ids:
+            columns = ', '.join(('client_id',) + STATUS_FIELDS)
+            with get_db() as db:
+                if ids:
+                    rows = select_in(db, f'SELECT {columns} FROM wans WHERE client_id IN ({{ids}})', ids)
+                else:
+                    rows = db.execute(f'SELECT {columns} FROM wans').fetchall()
+
+        return jsonify({
+            'epoch': changes.epoch,
+            'version': version,
+            'full': delta is None,
+            'fields': STATUS_FIELDS,
+            'wans': {row['client_id']: [row[f] for f in STATUS_FIELDS] for row in rows},
+            'removed': removed,
+        })
+    except Exception as e:
+        logger.error(f"Erreur lors de la récupération du statut des WANs: {str(e)}")
+        return jsonify({'error': 'Erreur serveur'}), 500
+
+@app.route('/api/fleet/summary')
+def fleet_summary():
+    """Totaux de la flotte et par site (WANs, appareils, latence, charge CPU)
+
+    Servis depuis les agrégats en mémoire, sans requête sur la base.
+    """
+    try:
+        return conditional_json(('fleet_summary',), fleet.version, fleet.summary)
+    except Exception as e:
+        logger.error(f"Erreur lors de la récupération du résumé de la flotte: {str(e)}")
+        return jsonify({'error': 'Erreur serveur'}), 500
+
+@app.route('/api/fleet/stats')
+def fleet_stats():
+    """Statistiques des agrégats (mises à jour, réconciliations, écarts)"""
+    return jsonify(fleet.stats())
+
+@app.route('/api/events')
+def event_stream():
+    """Flux SSE des changements de statut et d'appareils"""
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    subscription = events.subscribe(last_event_id)
+
+    def generate():
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                messages, overflowed = subscription.get(EVENTS_KEEPALIVE)
+                if overflowed:
+                    yield events.resync_message()
+                elif messages:
+                    yield ''.join(messages)
+                elif subscription.closed:
+                    # Arrêt du serveur : le client se reconnecte (après `retry`)
+                    break
+                else:
+                    # Commentaire de maintien de connexion (ignoré par EventSource)
+                    yield ': keepalive\n\n'
+        finally:
+            events.unsubscribe(subscription)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+@app.route('/api/events/stats')
+def event_stats():
+    """Statistiques du canal SSE"""
+    return jsonify(events.stats())
+
+@app.route('/api/ingest/stats')
+def ingest_stats():
+    """Statistiques de la file d'écriture"""
+    return jsonify(writer.stats())
+
+@app.route('/api/db/stats')
+def db_stats():
+    """Statistiques du pool de connexions"""
+    return jsonify(db_pool.stats())
+
+@app.route('/api/cache/stats')
+def cache_stats():
+    """Statistiques du cache des réponses JSON"""
+    return jsonify(responses.stats())
+
+@app.route('/api/snapshot/stats')
+def snapshot_stats():
+    """Statistiques de l'instantané de lecture (taille, version, ancienneté, reconstructions)"""
+    return jsonify(snapshots.stats())
+
+@app.route('/api/wans/<client_id>/metrics')
+def get_wan_metrics(client_id):
+    """Historique de latence et de CPU d'un WAN
+
+    Paramètres : `start` et `end` (timestamps Unix, 24 dernières heures par
+    défaut) et `points` (nombre maximal de points, 500 par défaut).
+    """
+    try:
+        # Fin exclue : la seconde en cours est incluse par défaut
+        end = request.args.get('end', type=int) or int(time.time()) + 1
+        start = request.args.get('start', type=int) or end - 86400
+        max_points = min(max(request.args.get('points', 500, type=int), 1), 5000)
+        if start >= end:
+            return jsonify({'error': 'Intervalle invalide'}), 400
+        # Une série vide doit signifier « pas d'échantillon », pas « WAN inconnu »
+        if snapshots.current.wan(client_id) is None:
+            return jsonify({'error': 'WAN non trouvé'}), 404
+
+        with get_db() as db:
+            series = metrics_history.query_range(
+                db, client_id, start, end, max_points=max_points, retention=METRICS_RETENTION
+            )
+        return jsonify(series)
+    except Exception as e:
+        logger.error(f"Erreur lors de la récupération de l'historique du WAN: {str(e)}")
+        return jsonify({'error': 'Erreur serveur'}), 500
+
 @app.route('/api/wans/<client_id>', methods=['DELETE'])
 def delete_wan(client_id):
     """Supprime un WAN"""
+    def write(db):
+        # Appareils, historique de métriques puis le WAN lui-même
+        maintenance.delete_wan(db, client_id)
+        return {'removed': [client_id]}
+
     try:
-        with get_db() as db:
-            # Supprime d'abord les appareils associés
-            db.execute('DELETE FROM devices WHERE wan_id = ?', (client_id,))
-            # Puis supprime le WAN
-            db.execute('DELETE FROM wans WHERE client_id = ?', (client_id,))
-            db.commit()
-            logger.info(f"WAN supprimé avec succès : {client_id}")
-            return jsonify({'success': True})
+        writer.submit(write, 'delete_wan').wait(INGEST_COMMIT_TIMEOUT)
+        logger.info(f"WAN supprimé avec succès : {client_id}")
+        return jsonify({'success': True})
+    except QueueFull:
+        return jsonify({'error': 'Serveur saturé, réessayez plus tard'}), 503, {'Retry-After': str(admission.retry_after())}
     except Exception as e:
         logger.error(f"Erreur lors de la suppression du WAN : {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+def write_registration(data):
+    """Écriture différée de l'enregistrement d'un WAN
+
+    Met à jour les seules colonnes d'enregistrement : latence et charge CPU
+    sont conservées (un INSERT OR REPLACE les effaçait).
+    """
+    metadata = WanRegistry.metadata(data)
+
+    def write(db):
+        # Vérifie si le WAN existe déjà
+        existing = db.execute('SELECT client_id FROM wans WHERE client_id = ?', 
+                           (data['client_id'],)).fetchone()
+        
+        if existing:
+            logger.info(f"Mise à jour du WAN existant : {data['client_id']}")
+        else:
+            logger.info(f"Création d'un nouveau WAN : {data['client_id']}")
+        
+        # Mise à jour ou insertion du WAN
+        db.execute('''
+            INSERT INTO wans 
+            (client_id, name, ip, subnet, location, hostname, liveness_timeout, status, last_seen)
+            VALUES (?, ?, ?, ?, ?, ?, ?, 'online', datetime('now'))
+            ON CONFLICT (client_id) DO UPDATE SET
+                name = excluded.name, ip = excluded.ip, subnet = excluded.subnet,
+                location = excluded.location, hostname = excluded.hostname,
+                liveness_timeout = excluded.liveness_timeout,
+                status = 'online', last_seen = excluded.last_seen
+        ''', (data['client_id'], *metadata))
+        return {
+            'changed': [data['client_id']],
+            'registered': [(data['client_id'], metadata)],
+            'aggregates': [(data['client_id'], {'create': True, 'location': data['location'], 'status': 'online'})],
+        }
+    return write
+
 @app.route('/api/register', methods=['POST'])
 def register_wan():
     """Enregistre un nouveau WAN"""
     try:
-        data = request.json
+        data = read_payload()
         if not data:
             logger.error("Aucune donnée JSON reçue")
             return jsonify({'error': 'Données JSON manquantes'}), 400
@@ -183,27 +1090,19 @@ def register_wan():
             logger.error(f"Champs manquants : {', '.join(missing_fields)}")
             return jsonify({'error': f'Champs manquants : {", ".join(missing_fields)}'}), 400
             
+        timeout = data.get('liveness_timeout')
+        if timeout is not None and (not isinstance(timeout, (int, float)) or not 1 <= timeout <= 3600):
+            return jsonify({'error': 'liveness_timeout doit être compris entre 1 et 3600 secondes'}), 400
+            
         try:
-            with get_db() as db:
-                # Vérifie si le WAN existe déjà
-                existing = db.execute('SELECT client_id FROM wans WHERE client_id = ?', 
-                                   (data['client_id'],)).fetchone()
-                
-                if existing:
-                    logger.info(f"Mise à jour du WAN existant : {data['client_id']}")
-                else:
-                    logger.info(f"Création d'un nouveau WAN : {data['client_id']}")
-                
-                # Mise à jour ou insertion du WAN
-                db.execute('''
-                    INSERT OR REPLACE INTO wans 
-                    (client_id, name, ip, subnet, location, hostname, status, last_seen)
-                    VALUES (?, ?, ?, ?, ?, ?, 'online', datetime('now'))
-                ''', (data['client_id'], data['name'], data['ip'], 
-                      data['subnet'], data['location'], data['hostname']))
-                db.commit()
-                
-            return jsonify({'success': True})
+            # Ré-enregistrement identique : un simple battement de cœur suffit
+            if registry.get(data['client_id']) == WanRegistry.metadata(data):
+                heartbeats.touch(data['client_id'])
+                liveness.touch(data['client_id'], timeout=timeout)
+                return jsonify({'success': True, 'unchanged': True})
+            response = enqueue_write(write_registration(data), 'register')
+            liveness.touch(data['client_id'], timeout=timeout)
+            return response
         except sqlite3.Error as e:
             logger.error(f"Erreur SQLite lors de l'enregistrement du WAN: {str(e)}")
             return jsonify({'error': 'Erreur de base de données'}), 500
@@ -212,85 +1111,349 @@ def register_wan():
         logger.error(f"Erreur lors de l'enregistrement du WAN: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/heartbeat', methods=['POST'])
+def heartbeat():
+    """Signale qu'un WAN est toujours actif (sans écriture immédiate)"""
+    data = read_payload() or {}
+    client_id = data.get('client_id') or data.get('wan_id')
+    if not client_id:
+        return jsonify({'error': 'client_id manquant'}), 400
+    if client_id not in registry:
+        # Le client doit se (ré)enregistrer, par exemple après une suppression
+        return jsonify({'error': 'WAN inconnu', 'register': True}), 404
+    heartbeats.touch(client_id)
+    liveness.touch(client_id)
+    return jsonify({'success': True})
+
+@app.route('/api/admission/stats')
+def admission_stats():
+    """Requêtes d'ingestion admises, refusées par motif et en cours"""
+    return jsonify(admission.stats())
+
+@app.route('/api/heartbeat/stats')
+def heartbeat_stats():
+    """Statistiques des battements de cœur et des échéances de présence"""
+    return jsonify({**heartbeats.stats(), 'liveness': liveness.stats()})
+
+def write_device_report(client_id, devices, network_stats):
+    """Écriture différée d'un rapport d'appareils"""
+    def write(db):
+        # Met à jour les statistiques du WAN
+        db.execute('''
+            UPDATE wans 
+            SET latency = ?, cpu_load = ?, last_seen = CURRENT_TIMESTAMP, status = 'online'
+            WHERE client_id = ?
+        ''', (network_stats.get('latency'), network_stats.get('cpu_load'), client_id))
+        
+        metrics_history.record_sample(
+            db, client_id, network_stats.get('latency'), network_stats.get('cpu_load')
+        )
+        
+        # N'écrit que les appareils nouveaux, modifiés ou disparus
+        counts = apply_device_report(db, client_id, devices, search_index=search_fts)
+        keys = counts.pop('keys')
+        logger.info(
+            f"Appareils mis à jour pour le WAN {client_id} : "
+            f"{counts['inserted']} ajoutés, {counts['updated']} modifiés, "
+            f"{counts['removed']} disparus, {counts['unchanged']} inchangés"
+        )
+        result = {'changed': [client_id], 'response': counts, 'aggregates': [(client_id, {
+            'status': 'online',
+            'latency': network_stats.get('latency'),
+            'cpu_load': network_stats.get('cpu_load'),
+            'devices_up': counts['present'],
+            'devices_gone': counts['absent'],
+        })]}
+        if counts['inserted'] or counts['updated'] or counts['removed']:
+            result['devices_changed'] = [client_id]
+            # L'instantané de lecture ne relit que ces appareils
+            result['device_keys'] = [(client_id, keys)]
+            result['events'] = [('devices', {'client_id': client_id, **counts})]
+        return result
+    return write
+
 @app.route('/api/devices/update', methods=['POST'])
 def update_devices():
     """Met à jour les appareils d'un WAN"""
     try:
-        data = request.get_json()
-        client_id = data.get('client_id')
+        data = read_payload() or {}
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Format de rapport invalide'}), 400
+        # Les clients Linux envoient leur identifiant sous la clé wan_id
+        client_id = data.get('client_id') or data.get('wan_id')
         devices = data.get('devices', [])
         network_stats = data.get('network_stats', {})
         
         if not client_id:
             return jsonify({'error': 'client_id manquant'}), 400
+        if (not isinstance(devices, list) or not all(isinstance(device, dict) for device in devices)
+                or not isinstance(network_stats, dict)):
+            return jsonify({'error': 'Format de rapport invalide'}), 400
+        ingest_devices.observe(len(devices))
             
-        with get_db() as db:
-            # Met à jour les statistiques du WAN
-            db.execute('''
-                UPDATE wans 
-                SET latency = ?, cpu_load = ?, last_seen = CURRENT_TIMESTAMP
-                WHERE client_id = ?
-            ''', (network_stats.get('latency'), network_stats.get('cpu_load'), client_id))
-            
-            # Supprime les anciens appareils
-            db.execute('DELETE FROM devices WHERE wan_id = ?', (client_id,))
-            
-            # Ajoute les nouveaux appareils
-            for device in devices:
-                open_ports = device.get('open_ports', [])
-                if isinstance(open_ports, list):
-                    open_ports_json = json.dumps(open_ports)
-                else:
-                    open_ports_json = '[]'
-                    
-                db.execute('''
-                    INSERT INTO devices (wan_id, mac, ip, hostname, open_ports)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (
-                    client_id,
-                    device.get('mac'),
-                    device.get('ip'),
-                    device.get('hostname'),
-                    open_ports_json
-                ))
-            
-            db.commit()
-            logger.info(f"Appareils mis à jour pour le WAN {client_id}")
-            return jsonify({'success': True})
+        response = enqueue_write(write_device_report(client_id, devices, network_stats), 'devices_update')
+        if client_id in registry:
+            liveness.touch(client_id)
+        return response
             
     except Exception as e:
         logger.error(f"Erreur lors de la mise à jour des appareils: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+        return jsonify({'error': 'Erreur serveur'}), 500
 
-def get_devices(client_id):
-    """Récupère les appareils d'un WAN"""
-    with get_db() as db:
-        devices = db.execute('''
-            SELECT * FROM devices 
-            WHERE wan_id = ?
-            ORDER BY ip
-        ''', (client_id,)).fetchall()
-        return [dict(device) for device in devices]
+def write_offline(expired):
+    """Écriture différée des passages hors ligne détectés en mémoire"""
+    def write(db):
+        db.executemany('''
+            UPDATE wans 
+            SET status = 'offline' 
+            WHERE client_id = ? AND status = 'online'
+        ''', [(client_id,) for client_id in expired])
+        return {'changed': expired, 'aggregates': [(client_id, {'status': 'offline'}) for client_id in expired]}
+    return write
 
-@app.context_processor
-def utility_processor():
-    return dict(get_devices=get_devices)
+def write_heartbeats(pending):
+    """Écriture différée des derniers battements de cœur"""
+    def write(db):
+        # Seuls les passages hors ligne -> en ligne sont des changements d'état
+        revived = [row['client_id'] for row in select_in(
+            db, "SELECT client_id FROM wans WHERE status != 'online' AND client_id IN ({ids})", pending
+        )]
+        db.executemany('''
+            UPDATE wans SET last_seen = ?, status = 'online' WHERE client_id = ?
+        ''', [
+            (time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(ts)), client_id)
+            for client_id, ts in pending.items()
+        ])
+        return {
+            'changed': revived,
+            'touched': list(pending),
+            'aggregates': [(client_id, {'status': 'online'}) for client_id in revived],
+        }
+    return write
+
+def flush_heartbeats():
+    """Écrit périodiquement les battements de cœur regroupés"""
+    while not services_stopping.wait(HEARTBEAT_FLUSH_INTERVAL):
+        pending = heartbeats.drain()
+        if not pending:
+            continue
+        try:
+            with background_duration.time('heartbeats'):
+                writer.submit(write_heartbeats(pending), 'heartbeats')
+        except QueueFull:
+            # Réinjecte les battements : ils seront retentés au prochain passage
+            for client_id, ts in pending.items():
+                heartbeats.touch(client_id, ts)
+            logger.warning("File d'écriture pleine, battements de cœur reportés")
+        except Exception as e:
+            logger.error(f"Erreur lors de l'écriture des battements de cœur: {str(e)}")
 
 def update_wan_status():
-    """Met à jour le statut des WANs"""
-    while True:
+    """Met à jour le statut des WANs
+
+    Attend la prochaine échéance de présence et n'écrit que les WANs
+    réellement expirés : aucun accès à la base tant que tout le monde
+    se manifeste à temps.
+    """
+    while not services_stopping.is_set():
         try:
-            with get_db() as db:
-                # Marquer comme hors ligne les WANs qui n'ont pas été vus depuis 10 secondes
-                db.execute('''
-                    UPDATE wans 
-                    SET status = 'offline' 
-                    WHERE datetime('now', '-10 seconds') > last_seen
-                ''')
-                db.commit()
+            liveness.wait(max_wait=1.0)
+            with background_duration.time('liveness'):
+                expired = liveness.expire()
+                if expired:
+                    logger.info(f"{len(expired)} WAN(s) passé(s) hors ligne")
+                    writer.submit(write_offline(expired), 'offline').wait(INGEST_COMMIT_TIMEOUT)
         except Exception as e:
             logger.error(f"Erreur lors de la mise à jour des statuts: {str(e)}")
-        time.sleep(5)  # Vérification toutes les 5 secondes
+            services_stopping.wait(1)
+
+def write_rollup(db):
+    """Écriture des agrégats de métriques et de leur rétention"""
+    return {
+        'written': metrics_history.rollup(db),
+        'deleted': metrics_history.apply_retention(db, METRICS_RETENTION),
+    }
+
+def rollup_metrics():
+    """Agrège l'historique des métriques et applique la rétention (par la file d'écriture)"""
+    while not services_stopping.is_set():
+        try:
+            with background_duration.time('rollup'):
+                result = writer.submit(write_rollup, 'rollup').wait(INGEST_COMMIT_TIMEOUT)
+            written, deleted = result['written'], result['deleted']
+            if any(written.values()) or any(deleted.values()):
+                logger.debug(f"Agrégats écrits : {written}, lignes purgées : {deleted}")
+        except QueueFull:
+            logger.warning("File d'écriture pleine, agrégation des métriques reportée")
+        except Exception as e:
+            logger.error(f"Erreur lors de l'agrégation des métriques: {str(e)}")
+        services_stopping.wait(METRICS_ROLLUP_INTERVAL)
+
+def write_reload_state(db):
+    """Relit depuis la base tout l'état en mémoire (registre, présence, instantané, agrégats)
+
+    Utilisé après un rechargement (`server.py --supervise`) : l'ancien
+    processus a validé des écritures entre le chargement de celui-ci et son
+    propre arrêt. Passe par la file d'écriture comme la réconciliation.
+    """
+    known = set(snapshots.current.records)
+    registry.load(db)
+    liveness.bootstrap(
+        (row['client_id'], True, row['last_seen_ts'], row['liveness_timeout'])
+        for row in db.execute(SQL_ONLINE_WANS)
+    )
+    snapshot = snapshots.load(db)
+    return {
+        'reloaded': list(snapshot.records),
+        'removed': sorted(known.difference(snapshot.records)),
+        'aggregates_reload': FleetAggregates.read(db),
+        'events': [('resync', {'reason': 'reload'})],
+    }
+
+def reload_state():
+    """Met l'état en mémoire à jour des écritures d'un autre processus (voir write_reload_state)"""
+    try:
+        writer.submit(write_reload_state, 'reload').wait(INGEST_COMMIT_TIMEOUT)
+        logger.info(f"État en mémoire relu depuis la base : {snapshots.current.counts()}")
+    except Exception as e:
+        logger.error(f"Erreur lors de la relecture de l'état en mémoire: {str(e)}")
+
+def reconcile_aggregates():
+    """Recalcule périodiquement les agrégats de la flotte depuis la base
+
+    La lecture passe par la file d'écriture : elle voit toutes les écritures
+    déjà validées et son résultat est appliqué dans l'ordre des commits, sans
+    écraser une mise à jour plus récente.
+    """
+    def write(db):
+        return {'aggregates_reload': FleetAggregates.read(db)}
+
+    while not services_stopping.wait(AGGREGATES_RECONCILE_INTERVAL):
+        try:
+            with background_duration.time('aggregates'):
+                writer.submit(write, 'aggregates').wait(INGEST_COMMIT_TIMEOUT)
+        except QueueFull:
+            logger.warning("File d'écriture pleine, réconciliation des agrégats reportée")
+        except Exception as e:
+            logger.error(f"Erreur lors de la réconciliation des agrégats: {str(e)}")
+
+maintenance_log = maintenance.MaintenanceLog()
+
+def write_purge_devices(before):
+    """Écriture de rétention : un lot d'appareils disparus avant `before`"""
+    def write(db):
+        deleted, remaining = maintenance.purge_gone_devices(db, before)
+        return {
+            'deleted': deleted,
+            'devices_changed': list(remaining),
+            'aggregates': [(wan_id, {'devices_gone': count}) for wan_id, count in remaining.items()],
+        }
+    return write
+
+def write_purge_wans(before):
+    """Écriture de rétention : un lot de WANs hors ligne depuis `before`"""
+    def write(db):
+        removed = maintenance.purge_stale_wans(db, before)
+        return {'deleted': len(removed), 'removed': removed}
+    return write
+
+def apply_retention():
+    """Supprime par lots les appareils disparus et les WANs abandonnés trop anciens
+
+    Chaque lot est une écriture de la file : les rapports des clients
+    s'intercalent entre deux lots.
+    """
+    deleted = {'devices': 0, 'wans': 0}
+    purges = [
+        ('devices', RETENTION_GONE_DEVICES_DAYS, write_purge_devices, maintenance.DELETE_BATCH),
+        ('wans', RETENTION_STALE_WANS_DAYS, write_purge_wans, maintenance.WAN_DELETE_BATCH),
+    ]
+    for kind, days, purge, batch in purges:
+        if days <= 0:
+            continue
+        before = maintenance.cutoff(days * 86400)
+        while True:
+            result = writer.submit(purge(before), f'retention_{kind}').wait(INGEST_COMMIT_TIMEOUT)
+            deleted[kind] += result['deleted']
+            if result['deleted'] < batch:
+                break
+    return deleted
+
+def write_vacuum(pages):
+    """Écriture de maintenance : une étape de vacuum incrémental"""
+    def write(db):
+        return {'freed': maintenance.incremental_vacuum(db, pages)}
+    return write
+
+def vacuum_database():
+    """Rend au système les pages libres par étapes courtes, puis tronque le WAL"""
+    with get_db() as db:
+        size = maintenance.database_size(db)
+    if size['auto_vacuum'] != 'incremental':
+        return {'skipped': "auto_vacuum désactivé : lancer « python maintenance.py vacuum --full » serveur arrêté"}
+    freed = 0
+    while freed < VACUUM_MAX_PAGES:
+        # Une étape courte par écriture de la file : les rapports s'intercalent
+        step = min(maintenance.VACUUM_PAGES, VACUUM_MAX_PAGES - freed)
+        pages = writer.submit(write_vacuum(step), 'vacuum').wait(INGEST_COMMIT_TIMEOUT)['freed']
+        freed += pages
+        if not pages:
+            break
+    # Le point de reprise ne modifie pas la base : hors de la file
+    with get_db() as db:
+        busy, wal_pages, copied = maintenance.checkpoint(db)
+    return {'freed_bytes': freed * size['page_size'], 'freed_pages': freed, 'checkpoint_busy': bool(busy)}
+
+def backup_database():
+    """Sauvegarde à chaud dans BACKUP_DIR et rotation des anciennes copies"""
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+    source = sqlite3.connect(DATABASE_PATH, timeout=DB_BUSY_TIMEOUT_MS / 1000.0)
+    try:
+        result = maintenance.backup(source, maintenance.backup_path(BACKUP_DIR))
+    finally:
+        source.close()
+    result['pruned'] = [os.path.basename(path) for path in maintenance.prune_backups(BACKUP_DIR, BACKUP_KEEP)]
+    return result
+
+def run_maintenance():
+    """Rétention, vacuum incrémental puis sauvegarde ; retourne le rapport
+
+    Lève MaintenanceError si une maintenance est déjà en cours.
+    """
+    steps = [('retention', apply_retention), ('vacuum', vacuum_database)]
+    if BACKUP_DIR:
+        steps.append(('backup', backup_database))
+    with maintenance_log.run() as report:
+        with get_db() as db:
+            report['size_before'] = maintenance.database_size(db)
+        for name, step in steps:
+            with maintenance_log.step(report, name):
+                report[name] = step()
+            maintenance_duration.observe(report['durations'][name], name)
+        with get_db() as db:
+            report['size_after'] = maintenance.database_size(db)
+        report['wal_bytes'] = maintenance.wal_size(DATABASE_PATH)
+    logger.info(
+        f"Maintenance terminée en {sum(report['durations'].values()):.1f}s : "
+        f"{report['size_before']['bytes']} -> {report['size_after']['bytes']} octets"
+    )
+    return report
+
+def maintenance_loop():
+    """Lance la maintenance une fois par MAINTENANCE_INTERVAL, dans la fenêtre creuse"""
+    window = maintenance.parse_window(MAINTENANCE_WINDOW)
+    last_run = None
+    while not services_stopping.wait(60):
+        # Marge : l'heure de passage glisse d'une vérification à l'autre
+        if last_run is not None and time.time() - last_run < MAINTENANCE_INTERVAL * 0.9:
+            continue
+        if not maintenance.in_window(window):
+            continue
+        last_run = time.time()
+        try:
+            run_maintenance()
+        except Exception as e:
+            logger.error(f"Erreur lors de la maintenance de la base: {str(e)}")
 
 def kill_process_on_port(port):
     """Tue le processus qui utilise un port spécifique"""
@@ -319,9 +1482,21 @@ def kill_process_on_port(port):
     return False
 
 def restart_server():
-    """Redémarre le serveur Flask"""
-    logging.info("Redémarrage du serveur...")
-    if kill_process_on_port(5000):
+    """Redémarre le serveur Flask
+
+    Sous le superviseur (`server.py --supervise`), demande un rechargement
+    sans interruption : un nouveau processus reprend le socket d'écoute et
+    ne remplace celui-ci qu'une fois en bonne santé. Sinon, l'ancien
+    processus est tué puis relancé (requêtes en cours perdues, port fermé
+    entre les deux).
+    """
+    supervisor = os.getenv('SEAHAWKS_SUPERVISOR_PID')
+    if supervisor:
+        logging.info("Rechargement du serveur demandé au superviseur...")
+        os.kill(int(supervisor), signal.SIGHUP)
+        return
+    logging.warning("Redémarrage sans superviseur (lancer « python server.py --supervise » pour un rechargement sans coupure)")
+    if kill_process_on_port(SERVER_PORT):
         logging.info("Ancien processus terminé, redémarrage...")
         subprocess.Popen([sys.executable, __file__])
         sys.exit(0)
@@ -332,7 +1507,7 @@ def check_for_updates():
     """Vérifie les mises à jour GitHub toutes les 5 minutes"""
     try:
         repo = git.Repo('.')
-        while True:
+        while not services_stopping.is_set():
             try:
                 # Fetch les dernières modifications
                 repo.remotes.origin.fetch()
@@ -357,7 +1532,7 @@ def check_for_updates():
             except Exception as e:
                 logging.error(f"Erreur lors de la vérification des mises à jour: {str(e)}")
                 
-            time.sleep(300)  # Attend 5 minutes
+            services_stopping.wait(300)  # Attend 5 minutes
             
     except Exception as e:
         logging.error(f"Erreur dans la boucle d'auto-update: {str(e)}")
@@ -375,18 +1550,382 @@ def from_json_filter(value):
     except:
         return []
 
+# Tâches de fond : une seule instance par processus, quel que soit le point d'entrée
+_services_lock = threading.Lock()
+_services_started = False
+_loops_started = False
+
+# Serveur HTTP de production (server.py), pour ses statistiques
+http_server = None
+
+# Demande d'arrêt des tâches de fond (arrêt ou rechargement du serveur)
+services_stopping = threading.Event()
+
+def start_background_services(defer_loops=False):
+    """Démarre la file d'écriture et les threads de fond (sans effet au second appel)
+
+    `defer_loops` : seule la file d'écriture démarre ; les threads de fond
+    attendent `take_over()` (rechargement, voir server.py).
+    """
+    global _services_started
+    with _services_lock:
+        if _services_started:
+            return False
+        _services_started = True
+
+    # Démarre le thread rédacteur de la file d'écriture
+    writer.start()
+    if not defer_loops:
+        start_background_loops()
+    return True
+
+def start_background_loops():
+    """Démarre les threads de fond (sans effet au second appel)"""
+    global _loops_started
+    with _services_lock:
+        if _loops_started:
+            return False
+        _loops_started = True
+
+    services = [
+        ('heartbeats', flush_heartbeats),       # écriture des battements de cœur
+        ('liveness', update_wan_status),        # mise à jour des statuts
+        ('rollup', rollup_metrics),             # agrégation des métriques
+        ('aggregates', reconcile_aggregates),   # réconciliation des agrégats
+        ('maintenance', maintenance_loop),      # rétention, vacuum, sauvegardes
+        ('auto-update', check_for_updates),     # auto-update
+    ]
+    for name, target in services:
+        threading.Thread(target=target, name=name, daemon=True).start()
+    logger.info(f"Tâches de fond démarrées : {', '.join(name for name, _ in services)}")
+    return True
+
+def take_over():
+    """Fin d'un rechargement, l'ancien processus arrêté : relit l'état puis démarre les threads de fond
+
+    Pendant le recouvrement, seul l'ancien processus fait tourner les
+    tâches périodiques (présence, agrégats, maintenance, mises à jour).
+    """
+    reload_state()
+    if not services_stopping.is_set():
+        start_background_loops()
+
+def prepare_shutdown():
+    """Début de l'arrêt : tâches de fond interrompues, flux SSE terminés
+
+    Les requêtes en cours continuent d'être servies ; les clients SSE se
+    reconnectent d'eux-mêmes (au nouveau processus lors d'un rechargement).
+    """
+    services_stopping.set()
+    events.close()
+
+def stop_background_services():
+    """Écrit les derniers battements de cœur puis vide la file d'écriture"""
+    pending = heartbeats.drain()
+    if pending:
+        try:
+            writer.submit(write_heartbeats(pending), 'heartbeats')
+        except QueueFull:
+            logger.warning(f"{len(pending)} battements de cœur perdus à l'arrêt")
+    writer.stop()
+
+@app.route('/api/health')
+def health():
+    """Santé du processus : base accessible, rédacteur actif, instantané chargé
+
+    Le superviseur n'envoie le trafic à un nouveau processus qu'après une
+    réponse 200. Un processus en cours d'arrêt (`draining`) partage encore
+    le socket avec son remplaçant : il reste en bonne santé.
+    """
+    checks = {
+        'writer': writer.running,
+        'snapshot': snapshots.current.version > 0,
+        'draining': services_stopping.is_set(),
+    }
+    try:
+        with get_db() as db:
+            db.execute('SELECT 1').fetchone()
+        checks['database'] = True
+    except Exception as e:
+        logger.error(f"Erreur lors du contrôle de santé de la base: {str(e)}")
+        checks['database'] = False
+    healthy = checks['database'] and checks['writer'] and checks['snapshot']
+    body = {'status': 'ok' if healthy else 'unavailable', 'version': VERSION, 'pid': os.getpid(), 'checks': checks}
+    return jsonify(body), 200 if healthy else 503
+
+@app.route('/api/server/stats')
+def server_stats():
+    """Statistiques du serveur HTTP (pool de threads)"""
+    if http_server is None:
+        return jsonify({'error': 'Serveur de production non utilisé'}), 404
+    return jsonify(http_server.stats())
+
+# Profilage à la demande (aucun coût hors capture)
+cpu_profiler = profiling.SamplingProfiler()
+memory_tracer = profiling.MemoryTracer()
+
+def admin_required(view):
+    """Réserve une route au porteur de ADMIN_TOKEN (en-tête Authorization: Bearer)"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not ADMIN_TOKEN:
+            return jsonify({'error': 'Administration désactivée (ADMIN_TOKEN non défini)'}), 404
+        scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+        if scheme.lower() != 'bearer' or not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+            return jsonify({'error': 'Jeton d\'administration invalide'}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+def query_number(name, default, minimum, maximum, kind=float):
+    """Paramètre numérique borné ; ValueError si invalide"""
+    value = kind(request.args.get(name, default))
+    if not minimum <= value <= maximum:
+        raise ValueError(f"{name} doit être compris entre {minimum} et {maximum}")
+    return value
+
+@app.route('/api/admin/profile/cpu')
+@admin_required
+def profile_cpu():
+    """Profil CPU de tous les threads pendant `seconds` secondes
+
+    format=json (résumé), collapsed (piles repliées pour flamegraph) ou
+    pstats (à ouvrir avec `python -m pstats` ou snakeviz).
+    """
+    try:
+        seconds = query_number('seconds', 10, 0.1, PROFILE_MAX_SECONDS)
+        interval = query_number('interval', PROFILE_INTERVAL, 0.001, 1)
+        top = query_number('top', 25, 1, 1000, int)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    output = request.args.get('format', 'json')
+    if output not in ('json', 'collapsed', 'pstats'):
+        return jsonify({'error': f"Format invalide : {output}"}), 400
+
+    try:
+        logger.info(f"Capture CPU de {seconds}s (intervalle {interval}s)")
+        profile = cpu_profiler.capture(seconds, interval)
+    except profiling.ProfilerError as e:
+        return jsonify({'error': str(e)}), 409
+    except Exception as e:
+        logger.error(f"Erreur lors du profilage CPU: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+    stamp = time.strftime('%Y%m%d-%H%M%S')
+    if output == 'collapsed':
+        return Response(profile.collapsed(), mimetype='text/plain', headers={
+            'Content-Disposition': f'attachment; filename=seahawks-cpu-{stamp}.folded'})
+    if output == 'pstats':
+        return Response(profile.pstats(), mimetype='application/octet-stream', headers={
+            'Content-Disposition': f'attachment; filename=seahawks-cpu-{stamp}.pstats'})
+    return jsonify(profile.summary(top))
+
+@app.route('/api/admin/memory')
+@admin_required
+def memory_status():
+    """État du traçage mémoire"""
+    return jsonify(memory_tracer.stats())
+
+@app.route('/api/admin/memory/start', methods=['POST'])
+@admin_required
+def memory_start():
+    """Démarre tracemalloc (`frames` : profondeur des piles enregistrées)"""
+    try:
+        frames = query_number('frames', 1, 1, 100, int)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    started = memory_tracer.start(frames)
+    logger.info(f"Traçage mémoire {'démarré' if started else 'déjà actif'}")
+    return jsonify({'started': started, **memory_tracer.stats()})
+
+@app.route('/api/admin/memory/stop', methods=['POST'])
+@admin_required
+def memory_stop():
+    """Arrête tracemalloc et libère les instantanés"""
+    stopped = memory_tracer.stop()
+    logger.info("Traçage mémoire arrêté")
+    return jsonify({'stopped': stopped})
+
+def memory_query():
+    top = query_number('top', 25, 1, 1000, int)
+    key = request.args.get('key', 'lineno')
+    if key not in ('lineno', 'filename', 'traceback'):
+        raise ValueError(f"Clé invalide : {key}")
+    return key, top
+
+@app.route('/api/admin/memory/snapshot')
+@admin_required
+def memory_snapshot():
+    """Instantané des allocations, qui devient la référence de /diff
+
+    format=raw : fichier chargeable avec `tracemalloc.Snapshot.load()`.
+    """
+    try:
+        key, top = memory_query()
+        snapshot = memory_tracer.snapshot()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except profiling.ProfilerError as e:
+        return jsonify({'error': str(e)}), 409
+
+    if request.args.get('format') == 'raw':
+        with tempfile.NamedTemporaryFile(suffix='.tracemalloc') as f:
+            snapshot.dump(f.name)
+            data = f.read()
+        return Response(data, mimetype='application/octet-stream', headers={
+            'Content-Disposition': f"attachment; filename=seahawks-mem-{time.strftime('%Y%m%d-%H%M%S')}.tracemalloc"})
+    return jsonify({**memory_tracer.stats(), 'top': profiling.top_allocations(snapshot, key, top)})
+
+@app.route('/api/admin/memory/diff')
+@admin_required
+def memory_diff():
+    """Évolution des allocations depuis le dernier instantané"""
+    try:
+        key, top = memory_query()
+        snapshot, baseline = memory_tracer.diff()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except profiling.ProfilerError as e:
+        return jsonify({'error': str(e)}), 409
+    return jsonify({**memory_tracer.stats(), 'top': profiling.top_differences(snapshot, baseline, key, top)})
+
+@app.route('/api/admin/maintenance')
+@admin_required
+def maintenance_status():
+    """Dernière maintenance de la base, totaux et taille actuelle"""
+    try:
+        with get_db() as db:
+            size = maintenance.database_size(db)
+        return jsonify({
+            **maintenance_log.stats(),
+            'size': {**size, 'wal_bytes': maintenance.wal_size(DATABASE_PATH)},
+            'window': MAINTENANCE_WINDOW,
+            'interval': MAINTENANCE_INTERVAL,
+        })
+    except Exception as e:
+        logger.error(f"Erreur lors de la lecture de l'état de maintenance: {str(e)}")
+        return jsonify({'error': 'Erreur serveur'}), 500
+
+@app.route('/api/admin/maintenance', methods=['POST'])
+@admin_required
+def maintenance_start():
+    """Lance une maintenance immédiate, hors fenêtre (suivi via GET)"""
+    if maintenance_log.running:
+        return jsonify({'error': 'Une maintenance est déjà en cours'}), 409
+
+    def run():
+        try:
+            run_maintenance()
+        except maintenance.MaintenanceError:
+            pass
+        except Exception as e:
+            logger.error(f"Erreur lors de la maintenance de la base: {str(e)}")
+
+    threading.Thread(target=run, name='maintenance-run', daemon=True).start()
+    logger.info("Maintenance de la base lancée à la demande")
+    return jsonify({'started': True}), 202
+
+@metrics.collector
+def collect_maintenance():
+    """Taille de la base et résultats des maintenances"""
+    with get_db() as db:
+        size = maintenance.database_size(db)
+    stats = maintenance_log.stats()
+    families = [
+        ('seahawks_db_size_bytes', 'gauge', 'Taille de la base par fichier', [
+            ({'file': 'main'}, size['bytes']),
+            ({'file': 'free'}, size['free_bytes']),
+            ({'file': 'wal'}, maintenance.wal_size(DATABASE_PATH)),
+        ]),
+        ('seahawks_maintenance_runs_total', 'counter', 'Maintenances de la base terminées',
+         [({}, stats['runs'])]),
+        ('seahawks_retention_deleted_total', 'counter', 'Lignes supprimées par la rétention',
+         [({'kind': kind}, count) for kind, count in stats['deleted'].items()]),
+    ]
+    backup = stats['last_backup']
+    if backup:
+        families.append(('seahawks_backup_size_bytes', 'gauge', 'Taille de la dernière sauvegarde',
+                         [({}, backup['bytes'])]))
+        families.append(('seahawks_backup_timestamp_seconds', 'gauge', 'Date de la dernière sauvegarde',
+                         [({}, backup['finished_at'])]))
+    return families
+
+@metrics.collector
+def collect_fleet():
+    """État du parc, lu dans les agrégats en mémoire"""
+    wans, devices, per_wan = fleet.counts()
+    families = [
+        ('seahawks_wans', 'gauge', 'WANs enregistrés par statut',
+         [({'status': status}, count) for status, count in wans.items()]),
+        ('seahawks_devices', 'gauge', 'Appareils connus par statut',
+         [({'status': status}, count) for status, count in devices.items()]),
+    ]
+    if METRICS_PER_WAN:
+        families.append(('seahawks_wan_devices_up', 'gauge', 'Appareils actifs par WAN',
+                         [({'wan_id': client_id}, count) for client_id, count in per_wan.items() if count]))
+    return families
+
+@metrics.collector
+def collect_internals():
+    """Statistiques internes déjà tenues par les composants (file, pool, cache, SSE)"""
+    queue = writer.stats()
+    pool = db_pool.stats()
+    cache = responses.stats()
+    stream = events.stats()
+    beats = heartbeats.stats()
+    presence = liveness.stats()
+    reads = snapshots.stats()
+    admitted = admission.stats()
+    families = [
+        ('seahawks_ingest_queue_depth', 'gauge', "Écritures en attente dans la file",
+         [({}, queue['depth'])]),
+        ('seahawks_ingest_writes_total', 'counter', 'Écritures traitées par la file, par issue',
+         [({'outcome': outcome}, queue[outcome]) for outcome in ('committed', 'failed', 'rejected')]),
+        ('seahawks_ingest_batches_total', 'counter', "Transactions d'écriture par lot",
+         [({}, queue['batches'])]),
+        ('seahawks_db_pool_connections', 'gauge', 'Connexions du pool par état',
+         [({'state': 'idle'}, pool['idle']), ({'state': 'in_use'}, pool['in_use'])]),
+        ('seahawks_db_pool_waits_total', 'counter', "Attentes d'une connexion libre",
+         [({}, pool['waits'])]),
+        ('seahawks_db_pool_timeouts_total', 'counter', "Attentes d'une connexion abandonnées",
+         [({}, pool['timeouts'])]),
+        ('seahawks_response_cache_lookups_total', 'counter', 'Consultations du cache des réponses',
+         [({'result': 'hit'}, cache['hits']), ({'result': 'miss'}, cache['misses'])]),
+        ('seahawks_response_cache_entries', 'gauge', 'Réponses en cache', [({}, cache['entries'])]),
+        ('seahawks_events_subscribers', 'gauge', 'Abonnés SSE connectés', [({}, stream['subscribers'])]),
+        ('seahawks_events_published_total', 'counter', 'Événements SSE publiés',
+         [({}, stream['published'])]),
+        ('seahawks_heartbeats_received_total', 'counter', 'Battements de cœur reçus',
+         [({}, beats['received'])]),
+        ('seahawks_heartbeats_pending', 'gauge', "Battements de cœur en attente d'écriture",
+         [({}, beats['pending'])]),
+        ('seahawks_liveness_expired_total', 'counter', 'Passages hors ligne détectés',
+         [({}, presence['expired'])]),
+        ('seahawks_aggregates_drifts_total', 'counter', 'Réconciliations des agrégats ayant trouvé un écart',
+         [({}, fleet.stats()['drifts'])]),
+        ('seahawks_admission_requests_total', 'counter', "Requêtes d'ingestion admises ou refusées, par motif",
+         [({'outcome': 'admitted'}, admitted['admitted'])]
+         + [({'outcome': reason}, count) for reason, count in admitted['rejected'].items()]),
+        ('seahawks_admission_in_flight', 'gauge', "Requêtes d'ingestion en cours", [({}, admitted['in_flight'])]),
+        ('seahawks_snapshot_builds_total', 'counter', "Instantanés de lecture publiés",
+         [({}, reads['builds'])]),
+        ('seahawks_snapshot_rows_read_total', 'counter', "Lignes relues pour construire les instantanés",
+         [({}, reads['rows_read'])]),
+    ]
+    if http_server is not None:
+        server = http_server.stats()
+        families.append(('seahawks_http_threads', 'gauge', 'Threads du serveur HTTP par état',
+                         [({'state': 'active'}, server['active']), ({'state': 'queued'}, server['queued'])]))
+    return families
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Métriques au format texte Prometheus"""
+    try:
+        return Response(metrics.render(), headers={'Content-Type': instrumentation.CONTENT_TYPE})
+    except Exception as e:
+        logger.error(f"Erreur lors de l'export des métriques: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 if __name__ == '__main__':
-    # Initialisation
-    init_db()
-    
-    # Démarre le thread de mise à jour des statuts
-    status_thread = threading.Thread(target=update_wan_status, daemon=True)
-    status_thread.start()
-    
-    # Démarre le thread d'auto-update
-    update_thread = threading.Thread(target=check_for_updates)
-    update_thread.daemon = True
-    update_thread.start()
-    
-    # Démarre l'application Flask
-    app.run(host='0.0.0.0', port=5000, debug=False)
+    import server
+    server.serve(sys.modules[__name__])
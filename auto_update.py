@@ -25,23 +25,28 @@ class AutoUpdater:
         self.last_commit = self.repo.head.commit.hexsha
 
     def _restart_app(self):
-        """Redémarre l'application Flask"""
+        """Recharge l'application, ou la démarre si elle ne tourne pas
+
+        Le superviseur (`server.py --supervise`) recharge sur SIGHUP sans
+        refuser de connexion ni interrompre de requête.
+        """
         try:
-            # Arrêt du processus existant s'il existe
-            if self.app_process:
-                logging.info("Arrêt de l'application...")
-                os.killpg(os.getpgid(self.app_process.pid), signal.SIGTERM)
-                self.app_process.wait()
+            if self.app_process and self.app_process.poll() is None:
+                logging.info("Rechargement de l'application...")
+                self.app_process.send_signal(signal.SIGHUP)
+                return
 
             # Démarrage de l'application
             logging.info("Démarrage de l'application...")
             self.app_process = subprocess.Popen(
-                ['python3', 'app.py'],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
+                ['python3', 'server.py', '--supervise'],
+                # Tube jamais lu : une fois plein, il bloquerait le serveur
+                # (journal dans seahawks.log)
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
                 preexec_fn=os.setsid  # Crée un nouveau groupe de processus
             )
-            logging.info("Application redémarrée avec succès")
+            logging.info("Application démarrée avec succès")
         except Exception as e:
             logging.error(f"Erreur lors du redémarrage de l'application: {str(e)}")
 
@@ -0,0 +1,489 @@
+"""
+Banc d'essai de charge de l'ingestion : une flotte de franchises simulée
+
+Démarre le serveur (app.py) sur une base temporaire, puis simule N clients
+virtuels qui envoient les mêmes requêtes que seahawks_client_linux.py :
+enregistrement, battements de cœur et rapports d'appareils périodiques
+(avec une part de changements configurable), pendant que des tableaux de
+bord interrogent les statuts. Mesure le débit, les latences p50/p95/p99,
+les taux d'erreur et la croissance de la base, et enregistre le tout en
+JSON pour comparer deux versions.
+
+    python benchmarks/ingest_load.py --clients 200 --devices 254 --duration 60 \\
+        --output resultats-3.2.json
+    python benchmarks/ingest_load.py --clients 200 --compare resultats-3.2.json
+
+Avec --server, la charge vise un serveur déjà démarré (la croissance de la
+base n'est alors pas mesurée).
+"""
+import argparse
+import heapq
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import wire  # noqa: E402
+
+VENDORS = {
+    '00:1a:11': 'Google', '3c:22:fb': 'Apple', 'f4:f5:d8': 'Google',
+    '00:50:56': 'VMware', 'b8:27:eb': 'Raspberry Pi', '00:1b:63': 'Apple',
+    'ac:de:48': 'Private', '00:0c:29': 'VMware', 'dc:a6:32': 'Raspberry Pi',
+    '00:15:5d': 'Microsoft',
+}
+LOCATIONS = ('Paris', 'Lyon', 'Marseille', 'Lille', 'Nantes', 'Bordeaux', 'Toulouse', 'Rennes')
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class VirtualClient:
+    """Franchise simulée : un WAN et son sous-réseau d'appareils"""
+
+    def __init__(self, index, devices, rng):
+        self.index = index
+        self.rng = rng
+        self.client_id = str(uuid.UUID(int=rng.getrandbits(128)))
+        self.subnet = f'10.{index >> 8 & 255}.{index & 255}'
+        self.devices = [self._device(host) for host in range(1, devices + 1)]
+        self.sender = None
+
+    def _device(self, host):
+        oui = self.rng.choice(list(VENDORS))
+        return {
+            'ip': f'{self.subnet}.{host}',
+            'hostname': 'Unknown',
+            'mac': oui + ':' + ':'.join(f'{self.rng.randrange(256):02x}' for _ in range(3)),
+            'vendor': VENDORS[oui],
+            'status': 'up',
+        }
+
+    def registration(self):
+        return {
+            'client_id': self.client_id,
+            'name': f'Franchise {self.index:05d}',
+            'location': LOCATIONS[self.index % len(LOCATIONS)],
+            'hostname': f'seahawks-{self.index:05d}',
+            'ip': f'{self.subnet}.254',
+            'subnet': f'{self.subnet}.0/24',
+        }
+
+    def report(self, churn):
+        """Rapport d'appareils, après avoir modifié une part `churn` du parc"""
+        for _ in range(round(len(self.devices) * churn)):
+            i = self.rng.randrange(len(self.devices))
+            change = self.rng.random()
+            if change < 0.4:
+                # Appareil remplacé (nouvelle MAC à la même adresse)
+                self.devices[i] = self._device(int(self.devices[i]['ip'].rsplit('.', 1)[1]))
+            elif change < 0.8:
+                self.devices[i]['status'] = 'down' if self.devices[i]['status'] == 'up' else 'up'
+            else:
+                self.devices[i]['hostname'] = f'host-{self.rng.randrange(10000)}.local'
+        return {'wan_id': self.client_id, 'devices': self.devices}
+
+
+class Recorder:
+    """Latences et issues par type de requête, partagées par tous les threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.lag = []
+        self.bytes_sent = defaultdict(int)
+
+    def record(self, operation, started, status, sent=0):
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.latencies[operation].append(elapsed)
+            self.statuses[operation][status] += 1
+            self.bytes_sent[operation] += sent
+
+    def late(self, seconds):
+        with self._lock:
+            self.lag.append(seconds)
+
+    def reset(self):
+        with self._lock:
+            self.latencies.clear()
+            self.statuses.clear()
+            self.lag.clear()
+            self.bytes_sent.clear()
+
+    def summary(self, duration):
+        with self._lock:
+            operations = {}
+            for operation, values in sorted(self.latencies.items()):
+                values = sorted(values)
+                statuses = dict(self.statuses[operation])
+                errors = sum(count for status, count in statuses.items()
+                             if not isinstance(status, int) or status >= 400)
+                operations[operation] = {
+                    'requests': len(values),
+                    'throughput': round(len(values) / duration, 2),
+                    'errors': errors,
+                    'error_rate': round(errors / len(values), 4),
+                    'statuses': {str(status): count for status, count in sorted(statuses.items(), key=str)},
+                    'latency_ms': {
+                        'p50': round(percentile(values, 0.50) * 1000, 2),
+                        'p95': round(percentile(values, 0.95) * 1000, 2),
+                        'p99': round(percentile(values, 0.99) * 1000, 2),
+                        'max': round(values[-1] * 1000, 2),
+                    },
+                    'bytes_sent': self.bytes_sent[operation],
+                }
+            total = sum(op['requests'] for op in operations.values())
+            errors = sum(op['errors'] for op in operations.values())
+            lag = sorted(self.lag)
+            return {
+                'requests': total,
+                'throughput': round(total / duration, 2),
+                'errors': errors,
+                'error_rate': round(errors / total, 4) if total else None,
+                # Retard des envois sur leur échéance : le générateur (ou le serveur) sature
+                'schedule_lag_ms': {
+                    'p50': round(percentile(lag, 0.50) * 1000, 2) if lag else None,
+                    'p99': round(percentile(lag, 0.99) * 1000, 2) if lag else None,
+                },
+                'operations': operations,
+            }
+
+
+def call(recorder, operation, send):
+    """Exécute `send()` et enregistre sa latence et son statut (ou l'exception)"""
+    started = time.perf_counter()
+    try:
+        response = send()
+    except requests.RequestException as e:
+        recorder.record(operation, started, type(e).__name__)
+        return None
+    sent = len(response.request.body or b'') if response.request is not None else 0
+    recorder.record(operation, started, response.status_code, sent)
+    return response
+
+
+class ClientWorker(threading.Thread):
+    """Exécute les envois d'un groupe de clients virtuels à leur échéance"""
+
+    def __init__(self, url, clients, args, recorder, stop):
+        super().__init__(daemon=True)
+        self.url = url
+        self.clients = clients
+        self.args = args
+        self.recorder = recorder
+        self.stop = stop
+        self.session = requests.Session()
+        for client in clients:
+            # Une session (et ses connexions persistantes) par thread
+            client.sender.http = self.session
+
+    def run(self):
+        rng = random.Random(id(self))
+        now = time.monotonic()
+        schedule = []
+        for client in self.clients:
+            # Phases aléatoires : les clients réels ne démarrent pas ensemble
+            schedule.append((now + rng.uniform(0, self.args.heartbeat_interval), client.index, 'heartbeat', client))
+            schedule.append((now + rng.uniform(0, self.args.report_interval), client.index, 'devices', client))
+        heapq.heapify(schedule)
+
+        while not self.stop.is_set():
+            due, index, operation, client = schedule[0]
+            wait = due - time.monotonic()
+            if wait > 0:
+                self.stop.wait(wait)
+                continue
+            self.recorder.late(-wait)
+            if operation == 'heartbeat':
+                response = call(self.recorder, 'heartbeat', lambda: self.session.post(
+                    f'{self.url}/api/heartbeat', json={'client_id': client.client_id}, timeout=self.args.timeout))
+                if response is not None and response.status_code == 404:
+                    call(self.recorder, 'register', lambda: client.sender.post(
+                        f'{self.url}/api/register', client.registration(), timeout=self.args.timeout))
+                interval = self.args.heartbeat_interval
+            else:
+                report = client.report(self.args.churn)
+                call(self.recorder, 'devices', lambda: client.sender.post(
+                    f'{self.url}/api/devices/update', report, timeout=self.args.timeout))
+                interval = self.args.report_interval
+            heapq.heapreplace(schedule, (due + interval, index, operation, client))
+
+
+class Poller(threading.Thread):
+    """Tableau de bord ouvert : statuts groupés et, périodiquement, liste des WANs"""
+
+    def __init__(self, url, args, recorder, stop):
+        super().__init__(daemon=True)
+        self.url = url
+        self.args = args
+        self.recorder = recorder
+        self.stop = stop
+        self.session = requests.Session()
+
+    def run(self):
+        epoch = version = etag = None
+        polls = 0
+        while not self.stop.is_set():
+            params = {'epoch': epoch, 'since': version} if epoch is not None else {}
+            response = call(self.recorder, 'status', lambda: self.session.get(
+                f'{self.url}/api/wans/status', params=params, timeout=self.args.timeout))
+            if response is not None and response.status_code == 200:
+                data = response.json()
+                epoch, version = data['epoch'], data['version']
+
+            if polls % self.args.page_every == 0:
+                headers = {'If-None-Match': etag} if etag else {}
+                response = call(self.recorder, 'wans', lambda: self.session.get(
+                    f'{self.url}/api/wans', headers=headers, timeout=self.args.timeout))
+                if response is not None and response.status_code == 200:
+                    etag = response.headers.get('ETag')
+                call(self.recorder, 'dashboard', lambda: self.session.get(
+                    f'{self.url}/', timeout=self.args.timeout))
+            polls += 1
+            self.stop.wait(self.args.poll_interval)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(workdir, threads):
+    """Lance app.py sur une base temporaire ; retourne (processus, url, chemin de la base)"""
+    port = free_port()
+    database = os.path.join(workdir, 'bench.db')
+    env = dict(
+        os.environ,
+        DATABASE_PATH=database,
+        LOG_FILE=os.path.join(workdir, 'seahawks.log'),
+        LOG_LEVEL='WARNING',
+        SERVER_HOST='127.0.0.1',
+        SERVER_PORT=str(port),
+        SERVER_THREADS=str(threads),
+    )
+    # Répertoire courant hors du dépôt : la boucle d'auto-update ne trouve
+    # pas de dépôt git et s'arrête au lieu d'aller chercher des mises à jour
+    # Sortie dans un fichier : un tube non lu finirait par bloquer le serveur
+    output = os.path.join(workdir, 'server.out')
+    with open(output, 'wb') as f:
+        process = subprocess.Popen([sys.executable, os.path.join(ROOT, 'app.py')], cwd=workdir, env=env,
+                                   stdout=f, stderr=subprocess.STDOUT)
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            with open(output, encoding='utf-8', errors='replace') as f:
+                raise RuntimeError(f"Le serveur s'est arrêté : {f.read()[-2000:]}")
+        try:
+            requests.get(f'{url}/api/server/stats', timeout=1)
+            return process, url, database
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("Le serveur n'a pas démarré en 30 s")
+
+
+def database_size(path):
+    if path is None:
+        return None
+    return sum(os.path.getsize(path + suffix) for suffix in ('', '-wal') if os.path.exists(path + suffix))
+
+
+def server_stats(url):
+    stats = {}
+    for name in ('ingest', 'db', 'cache', 'heartbeat', 'server'):
+        try:
+            response = requests.get(f'{url}/api/{name}/stats', timeout=5)
+            if response.ok:
+                stats[name] = response.json()
+        except requests.RequestException:
+            pass
+    return stats
+
+
+def server_version():
+    with open(os.path.join(ROOT, 'app.py'), encoding='utf-8') as f:
+        match = re.search(r"^VERSION = '([^']+)'", f.read(), re.MULTILINE)
+    version = match.group(1) if match else None
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return version, commit
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    workdir = None
+    process = None
+    database = None
+    url = args.server.rstrip('/') if args.server else None
+    if url is None:
+        workdir = tempfile.mkdtemp(prefix='seahawks-bench-')
+        process, url, database = start_server(workdir, args.server_threads)
+    try:
+        recorder = Recorder()
+        clients = [VirtualClient(i, args.devices, rng) for i in range(args.clients)]
+
+        # Phase 1 : enregistrement de la flotte
+        print(f"Enregistrement de {args.clients} clients sur {url}...")
+        session = requests.Session()
+        started = time.perf_counter()
+        for client in clients:
+            client.sender = wire.ReportSender(session)
+            call(recorder, 'register', lambda: client.sender.post(
+                f'{url}/api/register', client.registration(), timeout=args.timeout))
+        registration = recorder.summary(time.perf_counter() - started)
+        size_before = database_size(database)
+
+        # Phase 2 : régime établi
+        print(f"Charge pendant {args.duration:g} s ({args.workers} threads clients, {args.pollers} tableaux de bord)...")
+        recorder.reset()
+        stop = threading.Event()
+        threads = [ClientWorker(url, clients[i::args.workers], args, recorder, stop)
+                   for i in range(min(args.workers, args.clients))]
+        threads += [Poller(url, args, recorder, stop) for _ in range(args.pollers)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        stop.wait(args.duration)
+        stop.set()
+        for thread in threads:
+            thread.join(args.timeout + 1)
+        elapsed = time.perf_counter() - started
+        steady = recorder.summary(elapsed)
+        stats = server_stats(url)
+        size_after = database_size(database)
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(15)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if workdir is not None:
+            if args.keep:
+                print(f"Base et journal conservés dans {workdir}")
+            else:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+    version, commit = server_version()
+    reports = steady['operations'].get('devices', {}).get('requests', 0)
+    return {
+        'version': version,
+        'commit': commit,
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'parameters': {key: value for key, value in vars(args).items()
+                       if key not in ('output', 'compare', 'keep')},
+        'registration': registration,
+        'steady': steady,
+        'database': {
+            'bytes_after_registration': size_before,
+            'bytes_after_run': size_after,
+            'growth_bytes': size_after - size_before if database else None,
+            'growth_per_report': round((size_after - size_before) / reports, 1) if database and reports else None,
+        },
+        'server': stats,
+    }
+
+
+def print_summary(result):
+    steady = result['steady']
+    print(f"\nSeahawks {result['version']} ({result['commit']}) - "
+          f"{steady['requests']} requêtes, {steady['throughput']} req/s, "
+          f"erreurs {steady['errors']} ({(steady['error_rate'] or 0) * 100:.2f} %)")
+    print(f"{'opération':<10} {'requêtes':>9} {'req/s':>8} {'erreurs':>8} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name, op in steady['operations'].items():
+        latency = op['latency_ms']
+        print(f"{name:<10} {op['requests']:>9} {op['throughput']:>8} {op['errors']:>8} "
+              f"{latency['p50']:>8} {latency['p95']:>8} {latency['p99']:>8}")
+    lag = steady['schedule_lag_ms']
+    print(f"retard des envois : p50 {lag['p50']} ms, p99 {lag['p99']} ms")
+    database = result['database']
+    if database['growth_bytes'] is not None:
+        print(f"base : {database['bytes_after_run']} octets "
+              f"(+{database['growth_bytes']}, {database['growth_per_report']} par rapport)")
+
+
+def print_comparison(result, baseline):
+    """Écart relatif avec un résultat précédent, par opération"""
+    print(f"\nComparaison avec {baseline['version']} ({baseline['commit']}, {baseline['date']}) :")
+    if baseline['parameters'] != result['parameters']:
+        print("  attention : paramètres différents")
+    print(f"{'opération':<10} {'req/s':>16} {'p95 ms':>18} {'p99 ms':>18}")
+
+    def delta(old, new):
+        if old in (None, 0) or new is None:
+            return f'{new}'
+        return f'{new} ({(new - old) / old * 100:+.0f} %)'
+
+    for name, op in result['steady']['operations'].items():
+        old = baseline['steady']['operations'].get(name)
+        if old is None:
+            continue
+        print(f"{name:<10} {delta(old['throughput'], op['throughput']):>16} "
+              f"{delta(old['latency_ms']['p95'], op['latency_ms']['p95']):>18} "
+              f"{delta(old['latency_ms']['p99'], op['latency_ms']['p99']):>18}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Charge d'ingestion d'une flotte de franchises simulée")
+    parser.add_argument('--clients', type=int, default=100, help='Nombre de clients virtuels (WANs)')
+    parser.add_argument('--devices', type=int, default=254, help="Appareils par client")
+    parser.add_argument('--churn', type=float, default=0.05,
+                        help="Part des appareils modifiés à chaque rapport (0 à 1)")
+    parser.add_argument('--duration', type=float, default=60, help='Durée de la charge en secondes')
+    parser.add_argument('--report-interval', type=float, default=60,
+                        help='Intervalle des rapports d\'appareils par client, en secondes')
+    parser.add_argument('--heartbeat-interval', type=float, default=5,
+                        help='Intervalle des battements de cœur par client, en secondes')
+    parser.add_argument('--pollers', type=int, default=5, help='Tableaux de bord ouverts')
+    parser.add_argument('--poll-interval', type=float, default=5, help='Intervalle de rafraîchissement des tableaux de bord')
+    parser.add_argument('--page-every', type=int, default=6,
+                        help='Liste des WANs et page d\'accueil toutes les N interrogations des statuts')
+    parser.add_argument('--workers', type=int, default=16, help='Threads d\'envoi des clients virtuels')
+    parser.add_argument('--timeout', type=float, default=30, help='Délai maximal par requête')
+    parser.add_argument('--seed', type=int, default=0, help='Graine des données générées')
+    parser.add_argument('--server', help='URL d\'un serveur déjà démarré (sinon app.py est lancé)')
+    parser.add_argument('--server-threads', type=int, default=32, help='SERVER_THREADS du serveur lancé')
+    parser.add_argument('--keep', action='store_true', help='Conserver la base et le journal temporaires')
+    parser.add_argument('--output', help='Fichier JSON des résultats')
+    parser.add_argument('--compare', help='Résultats JSON précédents à comparer')
+    args = parser.parse_args()
+
+    result = run(args)
+    print_summary(result)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+        print(f"\nRésultats enregistrés dans {args.output}")
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            print_comparison(result, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Banc d'essai des encodages de rapports : octets transmis et coût CPU
+
+Génère des listes d'appareils réalistes (préfixes MAC de fabricants connus,
+ports ouverts courants, noms d'hôtes) et compare, pour chaque taille :
+JSON brut, JSON gzip/deflate, binaire brut et binaire gzip.
+
+    python benchmarks/wire_codec.py --sizes 254 4094 65534 --repeat 5
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import wire  # noqa: E402
+
+VENDORS = {
+    '00:1a:11': 'Google', '3c:22:fb': 'Apple', 'f4:f5:d8': 'Google',
+    '00:50:56': 'VMware', 'b8:27:eb': 'Raspberry Pi', '00:1b:63': 'Apple',
+    'ac:de:48': 'Private', '00:0c:29': 'VMware', 'dc:a6:32': 'Raspberry Pi',
+    '00:15:5d': 'Microsoft',
+}
+COMMON_PORTS = [22, 53, 80, 139, 443, 445, 631, 3389, 5353, 8080, 8443, 9100]
+PREFIXES = ('pc', 'laptop', 'printer', 'phone', 'cam', 'nas', 'srv', 'ap')
+
+
+def make_report(count, seed=0):
+    """Rapport d'appareils d'un sous-réseau de `count` hôtes"""
+    rng = random.Random(seed)
+    ouis = list(VENDORS)
+    devices = []
+    for i in range(count):
+        oui = rng.choice(ouis)
+        mac = oui + ':' + ':'.join(f'{rng.randrange(256):02x}' for _ in range(3))
+        devices.append({
+            'mac': mac,
+            'ip': f'10.{(i >> 16) & 255}.{(i >> 8) & 255}.{(i & 255) or 1}',
+            'hostname': f'{rng.choice(PREFIXES)}-{i:05d}.site.local' if rng.random() < 0.7 else '',
+            'vendor': VENDORS[oui],
+            'status': 'up',
+            'open_ports': sorted(rng.sample(COMMON_PORTS, rng.randint(0, 5))),
+        })
+    return {
+        'wan_id': 'b6c1f0d2-5a1e-4a7e-9a4c-2f0b1c3d4e5f',
+        'devices': devices,
+        'network_stats': {'latency': 12.5, 'cpu_load': 37.0},
+    }
+
+
+def measure(fn, repeat):
+    """Meilleur temps (ms) sur `repeat` exécutions, et le résultat"""
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000, result
+
+
+def run(sizes, repeat, level):
+    formats = [
+        ('json', False, None),
+        ('json+deflate', False, 'deflate'),
+        ('json+gzip', False, 'gzip'),
+        ('binaire', True, None),
+        ('binaire+gzip', True, 'gzip'),
+    ]
+    print(f"{'appareils':>9} {'format':<13} {'octets':>10} {'ratio':>6} "
+          f"{'encodage ms':>12} {'décodage ms':>12}")
+    for size in sizes:
+        report = make_report(size)
+        baseline = None
+        for name, binary, encoding in formats:
+            encode_ms, (body, headers) = measure(
+                lambda: wire.encode_body(report, binary, encoding, level), repeat
+            )
+            decode_ms, decoded = measure(
+                lambda: wire.decode_body(body, headers['Content-Type'], headers.get('Content-Encoding')),
+                repeat,
+            )
+            assert decoded == report, name
+            baseline = baseline or len(body)
+            print(f"{size:>9} {name:<13} {len(body):>10} {len(body) / baseline:>6.2f} "
+                  f"{encode_ms:>12.2f} {decode_ms:>12.2f}")
+        print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare les encodages de rapports d'appareils")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[254, 4094, 65534],
+                        help="Nombres d'appareils par rapport (/24, /20, /16 par défaut)")
+    parser.add_argument('--repeat', type=int, default=5, help='Exécutions par mesure')
+    parser.add_argument('--level', type=int, default=6, help='Niveau de compression')
+    args = parser.parse_args()
+    run(args.sizes, args.repeat, args.level)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Suivi des versions de changement des WANs
+"""
+import threading
+import uuid
+from collections import OrderedDict
+
+
+class ChangeTracker:
+    """Compteur de versions monotone, par WAN et pour toute la flotte
+
+    Chaque écriture incrémente la version globale et l'attribue aux WANs
+    modifiés. Un client qui connaît la version N peut ainsi demander
+    uniquement les WANs modifiés depuis N. L'`epoch` change à chaque
+    démarrage du serveur : une version issue d'un autre epoch n'a plus de
+    sens et impose un rechargement complet.
+    """
+
+    def __init__(self, tombstone_limit=10000):
+        self.epoch = uuid.uuid4().hex[:12]
+        self.tombstone_limit = tombstone_limit
+        self._lock = threading.Lock()
+        self._version = 0
+        self._wan_versions = {}
+        self._device_versions = {}
+        self._removed = OrderedDict()
+        # Les suppressions plus anciennes que cette version ont été oubliées
+        self._oldest_valid = 0
+
+    @property
+    def version(self):
+        return self._version
+
+    def version_of(self, client_id):
+        """Version du dernier changement connu d'un WAN (0 si aucun)"""
+        return self._wan_versions.get(client_id, 0)
+
+    def devices_version_of(self, client_id):
+        """Version du dernier changement connu des appareils d'un WAN (0 si aucun)"""
+        return self._device_versions.get(client_id, 0)
+
+    def bump_devices(self, *client_ids):
+        """Enregistre un changement dans les appareils d'un ou plusieurs WANs"""
+        with self._lock:
+            self._version += 1
+            for client_id in client_ids:
+                self._device_versions[client_id] = self._version
+            return self._version
+
+    def bump(self, *client_ids):
+        """Enregistre un changement sur un ou plusieurs WANs"""
+        with self._lock:
+            self._version += 1
+            for client_id in client_ids:
+                self._wan_versions[client_id] = self._version
+                self._removed.pop(client_id, None)
+            return self._version
+
+    def remove(self, client_id):
+        """Enregistre la suppression d'un WAN"""
+        with self._lock:
+            self._version += 1
+            self._wan_versions.pop(client_id, None)
+            # La version de suppression invalide aussi la liste d'appareils
+            self._device_versions[client_id] = self._version
+            self._removed[client_id] = self._version
+            self._removed.move_to_end(client_id)
+            while len(self._removed) > self.tombstone_limit:
+                _, version = self._removed.popitem(last=False)
+                self._oldest_valid = version
+            return self._version
+
+    def changed_since(self, since, epoch=None):
+        """Retourne (modifiés, supprimés) depuis `since`, ou None si un rechargement complet est nécessaire"""
+        if epoch is not None and epoch != self.epoch:
+            return None
+        with self._lock:
+            if since < self._oldest_valid or since > self._version:
+                return None
+            changed = [cid for cid, v in self._wan_versions.items() if v > since]
+            removed = [cid for cid, v in self._removed.items() if v > since]
+            return changed, removed
@@ -0,0 +1,197 @@
+"""
+Pool de connexions SQLite pour le serveur Seahawks
+"""
+import sqlite3
+import threading
+import time
+import logging
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+SYNCHRONOUS_LEVELS = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+AUTO_VACUUM_MODES = ('NONE', 'FULL', 'INCREMENTAL')
+
+
+class PoolTimeout(sqlite3.OperationalError):
+    """Levée quand aucune connexion ne se libère dans le délai imparti"""
+
+
+class ConnectionPool:
+    """Pool borné de connexions SQLite en mode WAL
+
+    Les connexions sont créées à la demande jusqu'à `max_size`, puis
+    réutilisées : les PRAGMA (WAL, busy_timeout, synchronous) ne sont
+    appliqués qu'une fois par connexion et le cache de requêtes préparées
+    de sqlite3 (`cached_statements`) survit d'une requête HTTP à l'autre.
+    """
+
+    def __init__(self, path, max_size=8, acquire_timeout=10.0,
+                 busy_timeout_ms=5000, synchronous='NORMAL',
+                 cached_statements=256, connection_factory=sqlite3.Connection, auto_vacuum=None):
+        synchronous = synchronous.upper()
+        if synchronous not in SYNCHRONOUS_LEVELS:
+            raise ValueError(f"Niveau synchronous invalide : {synchronous}")
+        if auto_vacuum is not None:
+            auto_vacuum = auto_vacuum.upper()
+            if auto_vacuum not in AUTO_VACUUM_MODES:
+                raise ValueError(f"Mode auto_vacuum invalide : {auto_vacuum}")
+
+        self.path = path
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.busy_timeout_ms = busy_timeout_ms
+        self.synchronous = synchronous
+        self.cached_statements = cached_statements
+        self.connection_factory = connection_factory
+        self.auto_vacuum = auto_vacuum
+
+        self._idle = deque()
+        self._cond = threading.Condition(threading.Lock())
+        self._size = 0
+        self._closed = False
+
+        # Statistiques exposées par stats()
+        self._created = 0
+        self._acquired = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._errors = 0
+        self._wait_time = 0.0
+
+    def _connect(self):
+        """Ouvre et configure une nouvelle connexion"""
+        db = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout_ms / 1000.0,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+            factory=self.connection_factory,
+        )
+        db.row_factory = sqlite3.Row
+        if self.auto_vacuum:
+            # Pris en compte seulement par une base neuve, et avant le passage en WAL
+            db.execute(f'PRAGMA auto_vacuum={self.auto_vacuum}')
+        mode = db.execute('PRAGMA journal_mode=WAL').fetchone()[0]
+        if mode.lower() != 'wal':
+            logger.warning(f"Mode WAL indisponible pour {self.path} (mode actuel : {mode})")
+        db.execute(f'PRAGMA busy_timeout={int(self.busy_timeout_ms)}')
+        db.execute(f'PRAGMA synchronous={self.synchronous}')
+        db.execute('PRAGMA temp_store=MEMORY')
+        return db
+
+    def acquire(self):
+        """Emprunte une connexion au pool (bloque si le pool est saturé)"""
+        started = time.monotonic()
+        deadline = started + self.acquire_timeout
+        waited = False
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise sqlite3.ProgrammingError("Pool de connexions fermé")
+                if self._idle:
+                    db = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    db = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeout(
+                        f"Aucune connexion disponible après {self.acquire_timeout}s"
+                    )
+                waited = True
+                self._cond.wait(remaining)
+            self._acquired += 1
+            if waited:
+                self._waits += 1
+                self._wait_time += time.monotonic() - started
+
+        if db is None:
+            try:
+                db = self._connect()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._created += 1
+        return db
+
+    def release(self, db, discard=False):
+        """Rend une connexion au pool"""
+        if not discard and db.in_transaction:
+            try:
+                db.rollback()
+            except sqlite3.Error:
+                discard = True
+        with self._cond:
+            if discard or self._closed:
+                self._size -= 1
+            else:
+                self._idle.append(db)
+            self._cond.notify()
+        if discard or self._closed:
+            try:
+                db.close()
+            except sqlite3.Error:
+                pass
+
+    @contextmanager
+    def connection(self):
+        """Fournit une connexion : commit en sortie normale, rollback sur erreur"""
+        db = self.acquire()
+        discard = False
+        try:
+            yield db
+            if db.in_transaction:
+                db.commit()
+        except BaseException:
+            with self._cond:
+                self._errors += 1
+            try:
+                db.rollback()
+            except sqlite3.Error:
+                # Une connexion qui ne sait plus annuler ne retourne pas dans le pool
+                discard = True
+            raise
+        finally:
+            self.release(db, discard=discard)
+
+    def stats(self):
+        """Retourne les statistiques du pool"""
+        with self._cond:
+            return {
+                'path': self.path,
+                'max_size': self.max_size,
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'created': self._created,
+                'acquired': self._acquired,
+                'waits': self._waits,
+                'timeouts': self._timeouts,
+                'errors': self._errors,
+                'avg_wait_ms': round(self._wait_time * 1000 / self._waits, 3) if self._waits else 0.0,
+                'synchronous': self.synchronous,
+                'busy_timeout_ms': self.busy_timeout_ms,
+                'cached_statements': self.cached_statements,
+            }
+
+    def close(self):
+        """Ferme toutes les connexions inactives et refuse les nouveaux emprunts"""
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for db in idle:
+            try:
+                db.close()
+            except sqlite3.Error:
+                pass
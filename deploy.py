@@ -1,9 +1,11 @@
 import os
 import sys
-import shutil
+import sqlite3
 import subprocess
 from pathlib import Path
 
+import maintenance
+
 def check_python_version():
     """Vérifie la version de Python"""
     if sys.version_info < (3, 8):
@@ -34,8 +36,59 @@ SERVER_URL=http://localhost:5000
 # Configuration du client
 LOCATION=Bureau Principal
 
+# Serveur HTTP (pool de threads ; chaque flux SSE ouvert occupe un thread)
+SERVER_PORT=5000
+SERVER_THREADS=32
+SERVER_BACKLOG=128
+SERVER_KEEPALIVE=5
+# Rechargement sans coupure (server.py --supervise, kill -HUP) : drainage et démarrage, en secondes
+SERVER_DRAIN_TIMEOUT=30
+SERVER_READY_TIMEOUT=60
+
+# Métriques Prometheus (/metrics) : une série par WAN pour les appareils actifs
+METRICS_PER_WAN=true
+
+# Réconciliation des agrégats de la flotte (/api/fleet/summary) avec la base, en secondes
+AGGREGATES_RECONCILE_INTERVAL=300
+
+# Exports simultanés de l'inventaire (/api/export/...)
+EXPORT_MAX_CONCURRENT=2
+
+# Maintenance de la base : fenêtre creuse (heure locale), rétention en jours (0 : jamais)
+MAINTENANCE_WINDOW=02:00-05:00
+RETENTION_GONE_DEVICES_DAYS=30
+RETENTION_STALE_WANS_DAYS=0
+BACKUP_DIR=backups
+BACKUP_KEEP=7
+
+# Routes d'administration (profilage) : laisser vide pour les désactiver
+ADMIN_TOKEN=
+
 # Configuration de la base de données
 DATABASE_PATH=wans.db
+DB_POOL_SIZE=8
+DB_BUSY_TIMEOUT_MS=5000
+DB_SYNCHRONOUS=NORMAL
+
+# File d'écriture (async : réponse 202, commit : réponse après validation)
+INGEST_DURABILITY=async
+INGEST_BATCH_SIZE=200
+INGEST_FLUSH_INTERVAL=0.05
+
+# Admission de l'ingestion : requêtes/s et rafale par client (429), requêtes
+# simultanées et remplissage de la file d'écriture (503), Retry-After de base
+ADMISSION_CLIENT_RATE=0.5
+ADMISSION_CLIENT_BURST=10
+ADMISSION_MAX_CONCURRENT=16
+ADMISSION_QUEUE_HIGH_WATER=0.8
+ADMISSION_RETRY_AFTER=2
+# Nombre de proxys inverses de confiance (X-Forwarded-For) : l'admission est
+# alors comptée par adresse réelle du client et non par adresse du proxy
+TRUSTED_PROXIES=0
+
+# Compression des réponses (octets) et taille maximale d'un rapport décompressé
+WIRE_COMPRESS_MIN_SIZE=1024
+WIRE_MAX_BODY_SIZE=67108864
 
 # Configuration du logging
 LOG_LEVEL=INFO
@@ -46,7 +99,13 @@ def setup_database():
     """Configure la base de données"""
     if os.path.exists('wans.db'):
         backup_path = 'wans.db.backup'
-        shutil.copy2('wans.db', backup_path)
+        # API de sauvegarde SQLite : copie cohérente même si le serveur écrit
+        # (une copie du fichier pouvait mêler deux états et ignorait le WAL)
+        source = sqlite3.connect('wans.db')
+        try:
+            maintenance.backup(source, backup_path)
+        finally:
+            source.close()
         print(f"Base de données sauvegardée dans {backup_path}")
 
 def main():
@@ -97,7 +97,7 @@ def main():
     print(f"Déploiement du client Seahawks pour {args.location}...")
     
     # Copie des fichiers nécessaires
-    files_to_copy = ['seahawks_client.py', 'network_scanner.py', 'network_monitor.py']
+    files_to_copy = ['seahawks_client.py', 'wire.py', 'network_scanner.py', 'network_monitor.py']
     for file in files_to_copy:
         src = os.path.join('..', file)
         if os.path.exists(src):
@@ -0,0 +1,165 @@
+"""
+Ingestion différentielle des rapports d'appareils
+"""
+import ipaddress
+import json
+
+import ports
+import search
+
+# Colonnes comparées pour détecter un changement d'appareil
+COMPARED_FIELDS = ('mac', 'ip', 'hostname', 'vendor', 'open_ports')
+
+SELECT_WAN_DEVICES = '''
+    SELECT id, device_key, mac, ip, hostname, vendor, open_ports, status
+    FROM devices WHERE wan_id = ?
+'''
+
+UPSERT_DEVICE = '''
+    INSERT INTO devices (wan_id, device_key, mac, ip, ip_num, hostname, vendor, open_ports,
+                         status, first_seen, last_seen, gone_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'up', CURRENT_TIMESTAMP, CURRENT_TIMESTAMP, NULL)
+    ON CONFLICT (wan_id, device_key) DO UPDATE SET
+        mac = excluded.mac,
+        ip = excluded.ip,
+        ip_num = excluded.ip_num,
+        hostname = excluded.hostname,
+        vendor = excluded.vendor,
+        open_ports = excluded.open_ports,
+        status = 'up',
+        last_seen = CURRENT_TIMESTAMP,
+        gone_at = NULL
+'''
+
+# Identifiants des appareils insérés par un rapport
+SELECT_DEVICE_IDS = '''
+    SELECT id, device_key FROM devices
+    WHERE wan_id = ? AND device_key IN (SELECT value FROM json_each(?))
+'''
+
+MARK_GONE = '''
+    UPDATE devices
+    SET status = 'gone', gone_at = CURRENT_TIMESTAMP
+    WHERE id = ?
+'''
+
+
+def device_key(mac, ip):
+    """Clé d'identité d'un appareil dans son WAN : MAC si connue, sinon IP"""
+    mac = (mac or '').strip().lower()
+    if mac and mac != 'unknown':
+        return mac
+    return f"ip:{ip}"
+
+
+def ipv4_number(ip):
+    """Adresse IPv4 sous forme d'entier (recherche par réseau CIDR), None sinon"""
+    try:
+        return int(ipaddress.IPv4Address(ip))
+    except ValueError:
+        return None
+
+
+def normalize_device(device):
+    """Convertit un appareil reçu du client en ligne comparable à la base
+
+    Retourne None pour un appareil inexploitable (sans IP).
+    """
+    ip = device.get('ip')
+    if not ip:
+        return None
+    open_ports = device.get('open_ports', [])
+    return {
+        'mac': device.get('mac') or 'Unknown',
+        'ip': ip,
+        'hostname': device.get('hostname'),
+        'vendor': device.get('vendor'),
+        'open_ports': json.dumps(open_ports) if isinstance(open_ports, list) else '[]',
+    }
+
+
+def _write_ports(db, wan_id, existing, port_changes):
+    """Réécrit les lignes de device_ports des appareils `port_changes` {clé: open_ports}"""
+    ids = {key: existing[key]['id'] for key in port_changes if key in existing}
+    inserted = [key for key in port_changes if key not in ids]
+    if inserted:
+        ids.update((key, device_id) for device_id, key in
+                   db.execute(SELECT_DEVICE_IDS, (wan_id, json.dumps(inserted))))
+    db.executemany(ports.DELETE_DEVICE_PORTS, [(ids[key],) for key in port_changes if key in existing])
+    db.executemany(ports.INSERT_PORT, [
+        (ids[key], port, protocol, wan_id, service, version)
+        for key, open_ports in port_changes.items()
+        for (port, protocol), (service, version) in ports.normalize_ports(json.loads(open_ports)).items()
+    ])
+
+
+def apply_device_report(db, wan_id, devices, search_index=False):
+    """Applique un rapport complet d'appareils en n'écrivant que les différences
+
+    Les appareils nouveaux ou modifiés sont insérés/mis à jour en un seul
+    executemany ; les appareils absents du rapport sont marqués `gone` au
+    lieu d'être supprimés, ce qui conserve leur `first_seen`.
+    `search_index` : reporte aussi les changements dans l'index de recherche.
+    Retourne les compteurs inserted/updated/removed/unchanged, le nombre
+    d'appareils présents (`present`) et disparus (`absent`) du WAN après le
+    rapport, et les clés des appareils écrits (`keys`).
+    """
+    existing = {
+        row['device_key']: row
+        for row in db.execute(SELECT_WAN_DEVICES, (wan_id,))
+    }
+
+    # Un même appareil peut apparaître deux fois dans un rapport : le dernier l'emporte
+    incoming = {}
+    for device in devices:
+        row = normalize_device(device)
+        if row is not None:
+            incoming[device_key(row['mac'], row['ip'])] = row
+
+    upserts = []
+    reindex, unindex = [], []
+    # Appareils dont les ports ouverts sont à réécrire dans device_ports
+    port_changes = {}
+    inserted = updated = 0
+    for key, row in incoming.items():
+        old = existing.get(key)
+        if old is None:
+            inserted += 1
+            reindex.append(key)
+        elif old['status'] != 'up' or any(old[f] != row[f] for f in COMPARED_FIELDS):
+            updated += 1
+            if any(old[f] != row[f] for f in ('hostname', 'vendor', 'ip')):
+                reindex.append(key)
+                unindex.append([old['id']] + [old[f] for f in search.INDEXED_FIELDS])
+        else:
+            continue
+        if old is None or old['status'] != 'up' or old['open_ports'] != row['open_ports']:
+            port_changes[key] = row['open_ports']
+        upserts.append((wan_id, key, row['mac'], row['ip'], ipv4_number(row['ip']),
+                        row['hostname'], row['vendor'], row['open_ports']))
+
+    gone_keys = [key for key, row in existing.items() if key not in incoming and row['status'] == 'up']
+    gone = [(existing[key]['id'],) for key in gone_keys]
+
+    if upserts:
+        db.executemany(UPSERT_DEVICE, upserts)
+    if gone:
+        db.executemany(MARK_GONE, gone)
+        db.executemany(ports.DELETE_DEVICE_PORTS, gone)
+    if port_changes:
+        _write_ports(db, wan_id, existing, port_changes)
+    if search_index:
+        if unindex:
+            db.execute(search.UNINDEX_DEVICES, (json.dumps(unindex),))
+        if reindex:
+            db.execute(search.INDEX_DEVICES, (wan_id, json.dumps(reindex)))
+
+    return {
+        'inserted': inserted,
+        'updated': updated,
+        'removed': len(gone),
+        'unchanged': len(incoming) - inserted - updated,
+        'present': len(incoming),
+        'absent': len(existing) + inserted - len(incoming),
+        'keys': [upsert[1] for upsert in upserts] + gone_keys,
+    }
@@ -0,0 +1,137 @@
+"""
+Diffusion des changements d'état en Server-Sent Events
+"""
+import json
+import threading
+import uuid
+from collections import deque
+
+
+def format_event(event_id, event, data):
+    """Sérialise un message au format text/event-stream"""
+    payload = json.dumps(data, separators=(',', ':'))
+    return f"id: {event_id}\nevent: {event}\ndata: {payload}\n\n"
+
+
+class Subscription:
+    """File bornée d'événements destinée à un client"""
+
+    def __init__(self, maxlen):
+        self.maxlen = maxlen
+        self.overflowed = False
+        # Fermée par le serveur (arrêt) : le flux se termine, le client se reconnecte
+        self.closed = False
+        self._queue = deque()
+        self._cond = threading.Condition(threading.Lock())
+
+    def push(self, message):
+        with self._cond:
+            if self.overflowed:
+                return
+            if len(self._queue) >= self.maxlen:
+                # Client trop lent : on vide sa file et on lui demande un rechargement
+                self._queue.clear()
+                self.overflowed = True
+            else:
+                self._queue.append(message)
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify()
+
+    def get(self, timeout):
+        """Retourne les messages en attente (liste vide après `timeout` secondes)"""
+        with self._cond:
+            if not self._queue and not self.overflowed and not self.closed:
+                self._cond.wait(timeout)
+            messages = list(self._queue)
+            self._queue.clear()
+            overflowed, self.overflowed = self.overflowed, False
+        return messages, overflowed
+
+
+class EventBroker:
+    """Publie les événements vers les abonnés et garde un historique pour la reprise
+
+    Les identifiants sont de la forme `<epoch>-<numéro>` : un client qui se
+    reconnecte avec Last-Event-ID reçoit les événements manqués tant qu'ils
+    sont encore dans l'historique, sinon un événement `resync`.
+    """
+
+    def __init__(self, history=1000, subscriber_buffer=256):
+        self.epoch = uuid.uuid4().hex[:8]
+        self.subscriber_buffer = subscriber_buffer
+        self._history = deque(maxlen=history)
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._published = 0
+        self._overflows = 0
+        self._closed = False
+
+    def resync_message(self):
+        """Message demandant au client de recharger l'état complet"""
+        return format_event(f"{self.epoch}-{self._seq}", 'resync', {'reason': 'history'})
+
+    def publish(self, event, data):
+        """Publie un événement à tous les abonnés"""
+        with self._lock:
+            self._seq += 1
+            message = format_event(f"{self.epoch}-{self._seq}", event, data)
+            self._history.append((self._seq, message))
+            self._published += 1
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            was_overflowed = subscription.overflowed
+            subscription.push(message)
+            if subscription.overflowed and not was_overflowed:
+                self._overflows += 1
+        return self._seq
+
+    def _parse_last_id(self, last_event_id):
+        epoch, _, seq = (last_event_id or '').partition('-')
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def subscribe(self, last_event_id=None):
+        """Crée un abonnement, en rejouant les événements manqués si possible"""
+        subscription = Subscription(self.subscriber_buffer)
+        with self._lock:
+            if self._closed:
+                subscription.close()
+            self._subscribers.add(subscription)
+            if last_event_id:
+                last_seq = self._parse_last_id(last_event_id)
+                oldest = self._history[0][0] if self._history else self._seq + 1
+                if last_seq is None or last_seq < oldest - 1 or last_seq > self._seq:
+                    subscription.push(self.resync_message())
+                else:
+                    for seq, message in self._history:
+                        if seq > last_seq:
+                            subscription.push(message)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def close(self):
+        """Termine tous les flux, présents et à venir (arrêt ou rechargement du serveur)"""
+        with self._lock:
+            self._closed = True
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription.close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'subscribers': len(self._subscribers),
+                'published': self._published,
+                'history': len(self._history),
+                'overflows': self._overflows,
+                'last_event_id': f"{self.epoch}-{self._seq}",
+            }
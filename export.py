@@ -0,0 +1,189 @@
+"""
+Export en flux de l'inventaire (WANs et appareils) au format NDJSON ou CSV
+
+    python export.py devices --format csv --status up -o appareils.csv
+    python export.py all > inventaire.ndjson
+
+Les lignes sont lues par paquets sur un curseur SQLite et écrites au fur et
+à mesure : la mémoire utilisée ne dépend pas de la taille de la flotte.
+Tout l'export est lu dans une même transaction de lecture, donc sur un
+instantané cohérent de la base (en WAL, les écritures continuent pendant
+ce temps ; le WAL ne peut en revanche pas être recyclé avant la fin de
+l'export).
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sqlite3
+import sys
+
+import listing
+from listing import InvalidQuery
+from ports import decode_ports
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+DATASETS = ('wans', 'devices', 'all')
+# Lignes lues par fetchmany et écrites par morceau de réponse
+CHUNK_SIZE = 500
+
+WAN_COLUMNS = ('client_id', 'name', 'ip', 'subnet', 'location', 'hostname', 'status',
+               'latency', 'cpu_load', 'liveness_timeout', 'last_seen')
+DEVICE_COLUMNS = ('id', 'wan_id', 'mac', 'ip', 'hostname', 'vendor', 'open_ports', 'status',
+                  'first_seen', 'last_seen', 'gone_at')
+
+# Tables exportées : (liste dont les filtres et la clé d'ordre sont repris, colonnes)
+TABLES = {
+    'wans': (listing.WANS, WAN_COLUMNS),
+    'devices': (listing.DEVICES, DEVICE_COLUMNS),
+}
+
+
+class ExportQuery:
+    """Export validé : jeu de données, format et filtres de chaque table"""
+
+    __slots__ = ('dataset', 'format', 'filters')
+
+    def __init__(self, dataset, format, filters):
+        self.dataset = dataset
+        self.format = format
+        self.filters = filters
+
+    @property
+    def tables(self):
+        return ('wans', 'devices') if self.dataset == 'all' else (self.dataset,)
+
+    @property
+    def mimetype(self):
+        return FORMATS[self.format]
+
+    def filename(self, stamp):
+        extension = 'csv' if self.format == 'csv' else 'ndjson'
+        return f'seahawks-{self.dataset}-{stamp}.{extension}'
+
+
+def parse(dataset, args):
+    """Valide le jeu de données, `format` et les filtres des listes (`status`, `wan_id`...)
+
+    Avec `all`, un filtre s'applique aux tables qui le connaissent (`status`
+    n'a pas les mêmes valeurs pour les WANs et les appareils : il est refusé).
+    """
+    if dataset not in DATASETS:
+        raise InvalidQuery(f"Jeu de données invalide : {dataset} (possibles : {', '.join(DATASETS)})")
+    format = args.get('format') or 'ndjson'
+    if format not in FORMATS:
+        raise InvalidQuery(f"Format invalide : {format} (possibles : {', '.join(FORMATS)})")
+    if format == 'csv' and dataset == 'all':
+        raise InvalidQuery("Le format csv n'exporte qu'une table à la fois (wans ou devices)")
+    if dataset == 'all' and args.get('status'):
+        raise InvalidQuery("Le filtre status n'est pas applicable à l'export all")
+
+    query = ExportQuery(dataset, format, {})
+    for table in query.tables:
+        target = TABLES[table][0]
+        filters = {}
+        for name, build in target.filters.items():
+            value = args.get(name)
+            if value:
+                build(value)
+                filters[name] = value
+        query.filters[table] = filters
+    return query
+
+
+def _select(table, filters):
+    target, columns = TABLES[table]
+    where, params = [], []
+    for name, value in filters.items():
+        clause, values = target.filters[name](value)
+        where.append(clause)
+        params.extend(values)
+    sql = f"SELECT {', '.join(columns)} FROM {target.table}"
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    # Ordre de la clé primaire : parcours de la table sans tri
+    return sql + f' ORDER BY {target.key}', params
+
+
+def _chunks(cursor):
+    """Lignes du curseur par paquets de CHUNK_SIZE"""
+    return iter(lambda: cursor.fetchmany(CHUNK_SIZE), [])
+
+
+def _ndjson(table, rows, tagged):
+    lines = []
+    for row in rows:
+        record = dict(zip(TABLES[table][1], row))
+        if table == 'devices':
+            record['open_ports'] = decode_ports(record['open_ports'])
+        if tagged:
+            record = {'type': table[:-1], **record}
+        lines.append(json.dumps(record, ensure_ascii=False, separators=(',', ':')))
+    return '\n'.join(lines) + '\n'
+
+
+def stream(db, query):
+    """Générateur des morceaux (str) de l'export, dans une transaction de lecture
+
+    `db` reste occupée jusqu'à la fin (ou l'abandon) du générateur.
+    """
+    db.execute('BEGIN')
+    try:
+        for table in query.tables:
+            cursor = db.execute(*_select(table, query.filters[table]))
+            try:
+                if query.format == 'csv':
+                    buffer = io.StringIO()
+                    writer = csv.writer(buffer)
+                    writer.writerow(TABLES[table][1])
+                    for rows in _chunks(cursor):
+                        writer.writerows(rows)
+                        yield buffer.getvalue()
+                        buffer.seek(0)
+                        buffer.truncate()
+                    # En-tête seul si aucune ligne
+                    if buffer.tell():
+                        yield buffer.getvalue()
+                else:
+                    for rows in _chunks(cursor):
+                        yield _ndjson(table, rows, tagged=query.dataset == 'all')
+            finally:
+                cursor.close()
+    finally:
+        db.rollback()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export de l'inventaire Seahawks (NDJSON ou CSV)")
+    parser.add_argument('dataset', choices=DATASETS, help='Table exportée (all : WANs puis appareils, NDJSON)')
+    parser.add_argument('--db', default=None, help='Base SQLite (DATABASE_PATH, wans.db par défaut)')
+    parser.add_argument('--format', choices=FORMATS, default='ndjson')
+    parser.add_argument('-o', '--output', help='Fichier de sortie (sortie standard par défaut)')
+    for name in sorted(set(listing.WANS.filters) | set(listing.DEVICES.filters)):
+        parser.add_argument(f"--{name.replace('_', '-')}", dest=name, help=f'Filtre {name} des listes')
+    args = parser.parse_args()
+
+    try:
+        query = parse(args.dataset, vars(args))
+    except InvalidQuery as e:
+        parser.error(str(e))
+
+    path = args.db or os.getenv('DATABASE_PATH', 'wans.db')
+    # Lecture seule : l'export ne prend jamais le verrou d'écriture
+    db = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    output = open(args.output, 'w', encoding='utf-8', newline='') if args.output else sys.stdout
+    try:
+        for chunk in stream(db, query):
+            output.write(chunk)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
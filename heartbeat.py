@@ -0,0 +1,80 @@
+"""
+Battements de cœur des clients, regroupés en mémoire avant écriture
+"""
+import threading
+import time
+
+# Champs d'enregistrement dont la modification justifie une écriture
+REGISTRATION_FIELDS = ('name', 'ip', 'subnet', 'location', 'hostname', 'liveness_timeout')
+
+
+class HeartbeatBuffer:
+    """Derniers battements reçus, par client, en attente d'écriture
+
+    Plusieurs battements d'un même client entre deux vidages ne produisent
+    qu'une seule mise à jour de `wans.last_seen`.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._received = 0
+        self._flushed = 0
+
+    def touch(self, client_id, ts=None):
+        with self._lock:
+            self._pending[client_id] = ts if ts is not None else time.time()
+            self._received += 1
+
+    def drain(self):
+        """Retourne et vide les battements en attente {client_id: timestamp}"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._flushed += len(pending)
+        return pending
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pending': len(self._pending),
+                'received': self._received,
+                'flushed': self._flushed,
+            }
+
+
+class WanRegistry:
+    """Métadonnées d'enregistrement connues de chaque WAN
+
+    Permet de répondre à un ré-enregistrement identique sans écrire, et de
+    savoir si un battement provient d'un WAN connu.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wans = {}
+
+    @staticmethod
+    def metadata(data):
+        keys = data.keys()
+        return tuple(data[field] if field in keys else None for field in REGISTRATION_FIELDS)
+
+    def load(self, db):
+        """Charge les métadonnées de tous les WANs enregistrés"""
+        columns = ', '.join(('client_id',) + REGISTRATION_FIELDS)
+        wans = {row['client_id']: self.metadata(row) for row in db.execute(f'SELECT {columns} FROM wans')}
+        with self._lock:
+            self._wans = wans
+
+    def get(self, client_id):
+        return self._wans.get(client_id)
+
+    def __contains__(self, client_id):
+        return client_id in self._wans
+
+    def set(self, client_id, metadata):
+        with self._lock:
+            self._wans[client_id] = metadata
+
+    def remove(self, client_id):
+        with self._lock:
+            self._wans.pop(client_id, None)
@@ -0,0 +1,219 @@
+"""
+File d'écriture différée : un seul thread rédacteur regroupe les écritures par transaction
+"""
+import queue
+import threading
+import time
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFull(Exception):
+    """Levée quand la file d'écriture est pleine (le client doit réessayer plus tard)"""
+
+
+class WriterStopped(QueueFull):
+    """Levée quand la file est fermée (arrêt du serveur) : même réponse qu'une file pleine"""
+
+
+class WriteOp:
+    """Écriture en attente : `fn(db)` est exécutée par le thread rédacteur"""
+
+    __slots__ = ('fn', 'label', 'enqueued_at', 'done', 'result', 'error')
+
+    def __init__(self, fn, label):
+        self.fn = fn
+        self.label = label
+        self.enqueued_at = time.monotonic()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def wait(self, timeout=None):
+        """Attend le commit de l'écriture et retourne son résultat"""
+        if not self.done.wait(timeout):
+            raise TimeoutError(f"Écriture {self.label} non validée après {timeout}s")
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class WriteBehindQueue:
+    """File bornée vidée par un thread rédacteur unique
+
+    Le rédacteur prend jusqu'à `batch_size` écritures (ou ce qui arrive
+    pendant `flush_interval` secondes) et les exécute dans une seule
+    transaction : le coût du commit/fsync est partagé par tout le lot.
+    Chaque écriture a son propre SAVEPOINT, l'échec de l'une n'annule pas
+    les autres. `on_commit(db, results)` est appelé après chaque commit
+    avec les résultats des écritures réussies.
+    """
+
+    def __init__(self, pool, maxsize=10000, batch_size=200, flush_interval=0.05,
+                 on_commit=None, latency_window=1000):
+        self.pool = pool
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.on_commit = on_commit
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stopping = threading.Event()
+
+        self._stats_lock = threading.Lock()
+        self._latencies = deque(maxlen=latency_window)
+        self._enqueued = 0
+        self._rejected = 0
+        self._committed = 0
+        self._failed = 0
+        self._batches = 0
+        self._max_depth = 0
+        self._commit_time = 0.0
+
+    def start(self):
+        """Démarre le thread rédacteur (sans effet s'il tourne déjà), y compris après `stop()`"""
+        with self._start_lock:
+            self._stopping.clear()
+            self._start()
+
+    def _start(self):
+        # Appelé sous _start_lock
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='ingest-writer', daemon=True)
+            self._thread.start()
+
+    @property
+    def depth(self):
+        """Écritures en attente"""
+        return self._queue.qsize()
+
+    @property
+    def capacity(self):
+        return self._queue.maxsize
+
+    @property
+    def running(self):
+        """Le thread rédacteur tourne-t-il ?"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def submit(self, fn, label='write'):
+        """Met une écriture en file ; lève QueueFull si la file est saturée
+
+        Démarre le rédacteur au besoin, sauf une fois `stop()` appelé :
+        lève alors WriterStopped. Une écriture acceptée avant `stop()` est
+        toujours exécutée (le rédacteur vide la file avant de s'arrêter).
+        """
+        op = WriteOp(fn, label)
+        with self._start_lock:
+            if self._stopping.is_set():
+                with self._stats_lock:
+                    self._rejected += 1
+                raise WriterStopped("File d'écriture fermée (arrêt du serveur)")
+            self._start()
+            try:
+                self._queue.put_nowait(op)
+            except queue.Full:
+                with self._stats_lock:
+                    self._rejected += 1
+                raise QueueFull(f"File d'écriture pleine ({self._queue.maxsize} éléments)")
+        with self._stats_lock:
+            self._enqueued += 1
+            self._max_depth = max(self._max_depth, self._queue.qsize())
+        return op
+
+    def _next_batch(self):
+        try:
+            first = self._queue.get(timeout=0.5)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0
+                             else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not (self._stopping.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if batch:
+                self._execute(batch)
+
+    def _execute(self, batch):
+        started = time.monotonic()
+        results = []
+        try:
+            with self.pool.connection() as db:
+                db.execute('BEGIN IMMEDIATE')
+                for op in batch:
+                    db.execute('SAVEPOINT write_op')
+                    try:
+                        op.result = op.fn(db)
+                        results.append(op.result)
+                    except Exception as e:
+                        db.execute('ROLLBACK TO write_op')
+                        op.error = e
+                        logger.error(f"Écriture {op.label} en échec : {str(e)}")
+                    db.execute('RELEASE write_op')
+                db.commit()
+                if self.on_commit and results:
+                    try:
+                        self.on_commit(db, results)
+                    except Exception as e:
+                        logger.error(f"Erreur après le commit du lot : {str(e)}")
+        except Exception as e:
+            logger.error(f"Échec du lot de {len(batch)} écritures : {str(e)}")
+            for op in batch:
+                if op.error is None:
+                    op.error = e
+
+        finished = time.monotonic()
+        failed = sum(1 for op in batch if op.error is not None)
+        with self._stats_lock:
+            self._batches += 1
+            self._committed += len(batch) - failed
+            self._failed += failed
+            self._commit_time += finished - started
+            self._latencies.extend(finished - op.enqueued_at for op in batch)
+        for op in batch:
+            op.done.set()
+
+    def flush(self, timeout=None):
+        """Attend que toutes les écritures déjà en file soient validées"""
+        marker = self.submit(lambda db: None, label='flush')
+        marker.wait(timeout)
+
+    def stop(self, timeout=10.0):
+        """Vide la file puis arrête le thread rédacteur ; `submit()` refuse ensuite toute écriture"""
+        with self._start_lock:
+            self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self):
+        with self._stats_lock:
+            latencies = sorted(self._latencies)
+            batches = self._batches
+            return {
+                'depth': self._queue.qsize(),
+                'max_depth': self._max_depth,
+                'capacity': self._queue.maxsize,
+                'enqueued': self._enqueued,
+                'rejected': self._rejected,
+                'committed': self._committed,
+                'failed': self._failed,
+                'batches': batches,
+                'avg_batch_size': round((self._committed + self._failed) / batches, 2) if batches else 0.0,
+                'avg_commit_ms': round(self._commit_time * 1000 / batches, 3) if batches else 0.0,
+                'latency_ms': {
+                    'p50': round(latencies[len(latencies) // 2] * 1000, 3) if latencies else None,
+                    'p95': round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 3) if latencies else None,
+                    'max': round(latencies[-1] * 1000, 3) if latencies else None,
+                },
+            }
@@ -0,0 +1,252 @@
+"""
+Métriques au format texte Prometheus (histogrammes, jauges)
+
+Les histogrammes sont découpés par thread : chaque thread incrémente ses
+propres valeurs sans verrou, et l'export additionne les parts de tous les
+threads. Les parts des threads terminés sont fusionnées lors de l'export
+pour ne pas s'accumuler.
+"""
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Secondes : de la requête servie depuis le cache à l'écriture par lot
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Octets : battement de cœur isolé jusqu'à l'inventaire d'un /16
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+COUNT_BUCKETS = (0, 1, 10, 50, 100, 250, 1000, 5000, 25000, 65536)
+
+
+_INF_BUCKET = 'le="+Inf"'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Histogramme cumulatif : chaque part est [compte par seau..., somme, total]
+
+    Chaque thread écrit dans sa propre part {labels: comptes} ; l'export
+    additionne les parts de tous les threads.
+    """
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []
+        self._retired = {}
+
+    def _shard(self):
+        shard = getattr(self._local, 'values', None)
+        if shard is None:
+            shard = self._local.values = {}
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def observe(self, value, *labels):
+        shard = self._shard()
+        counts = shard.get(labels)
+        if counts is None:
+            counts = shard[labels] = [0] * (len(self.buckets) + 2)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        counts[-2] += value
+        counts[-1] += 1
+
+    @contextmanager
+    def time(self, *labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    @staticmethod
+    def _merge(target, values):
+        for labels, counts in values.items():
+            counts = list(counts)
+            existing = target.get(labels)
+            if existing is None:
+                target[labels] = counts
+            else:
+                for i, value in enumerate(counts):
+                    existing[i] += value
+
+    def _snapshot(self):
+        with self._lock:
+            alive = []
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    alive.append((thread, shard))
+                else:
+                    # Plus aucune écriture possible : fusion définitive
+                    self._merge(self._retired, shard)
+            self._shards = alive
+            total = {}
+            self._merge(total, self._retired)
+            for _, shard in alive:
+                # dict.copy() est atomique vis-à-vis du GIL
+                self._merge(total, shard.copy())
+        return total
+
+    def collect(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for labels, counts in sorted(self._snapshot().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = f'le="{_number(float(bound))}"'
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}')
+            # Les observations au-delà du dernier seau ne figurent que dans le total
+            lines.append(f'{self.name}_bucket{_labels(self.labelnames, labels, _INF_BUCKET)} {counts[-1]}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, labels)} {_number(counts[-2])}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, labels)} {counts[-1]}')
+        return lines
+
+
+class Registry:
+    """Métriques déclarées et collecteurs appelés à chaque export"""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, fn):
+        """Enregistre `fn()` qui retourne [(nom, type, aide, [(labels dict, valeur)])]
+
+        Pour les valeurs lues à l'export (jauges, statistiques existantes).
+        """
+        self._collectors.append(fn)
+        return fn
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.collect())
+        for fn in self._collectors:
+            for name, kind, documentation, samples in fn():
+                lines.append(f'# HELP {name} {documentation}')
+                lines.append(f'# TYPE {name} {kind}')
+                for labels, value in samples:
+                    if value is None:
+                        continue
+                    lines.append(f'{name}{_labels(labels.keys(), labels.values())} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+# --- Requêtes SQLite ----------------------------------------------------------------
+
+_OPERATION = re.compile(r'^\s*(SELECT|INSERT|REPLACE|UPDATE|DELETE|WITH|\w+)', re.IGNORECASE)
+_TABLE = {
+    'SELECT': re.compile(r'\bFROM\s+(\w+)', re.IGNORECASE),
+    'WITH': re.compile(r'\bFROM\s+(\w+)', re.IGNORECASE),
+    'INSERT': re.compile(r'\bINTO\s+(\w+)', re.IGNORECASE),
+    'REPLACE': re.compile(r'\bINTO\s+(\w+)', re.IGNORECASE),
+    'UPDATE': re.compile(r'^\s*UPDATE\s+(?:OR\s+\w+\s+)?(\w+)', re.IGNORECASE),
+    'DELETE': re.compile(r'\bFROM\s+(\w+)', re.IGNORECASE),
+}
+_statement_cache = {}
+
+
+def statement_labels(sql):
+    """(opération, table) d'une requête, pour des étiquettes de cardinalité bornée"""
+    labels = _statement_cache.get(sql)
+    if labels is None:
+        match = _OPERATION.match(sql)
+        operation = match.group(1).upper() if match else ''
+        table = _TABLE.get(operation)
+        match = table.search(sql) if table else None
+        labels = (operation, match.group(1).lower() if match else '')
+        if len(_statement_cache) < 4096:
+            _statement_cache[sql] = labels
+    return labels
+
+
+def timed_connection_factory(histogram):
+    """Classe de connexion sqlite3 qui mesure `execute` et `executemany`
+
+    Pour un SELECT, la mesure couvre l'exécution jusqu'à la première ligne ;
+    la lecture des lignes suivantes (fetchall) n'est pas comptée.
+    """
+    class TimedConnection(sqlite3.Connection):
+        def execute(self, sql, *args):
+            started = time.perf_counter()
+            try:
+                return super().execute(sql, *args)
+            finally:
+                histogram.observe(time.perf_counter() - started, *statement_labels(sql))
+
+        def executemany(self, sql, *args):
+            started = time.perf_counter()
+            try:
+                return super().executemany(sql, *args)
+            finally:
+                histogram.observe(time.perf_counter() - started, *statement_labels(sql))
+
+    return TimedConnection
+
+
+class WSGIMetrics:
+    """Intergiciel WSGI : durée et statut de chaque requête, par route
+
+    La durée va de la réception à la fin de l'appel de l'application ; pour
+    une réponse en flux (SSE), l'envoi du flux n'est pas compté. La route est
+    le gabarit Flask (`/api/wans/<client_id>`) déposé dans l'environnement
+    par l'application, ce qui borne le nombre de séries.
+    """
+
+    ROUTE_KEY = 'seahawks.route'
+
+    def __init__(self, wsgi_app, histogram):
+        self.wsgi_app = wsgi_app
+        self.histogram = histogram
+
+    def __call__(self, environ, start_response):
+        started = time.perf_counter()
+        status = ['500']
+
+        def record_status(status_line, headers, exc_info=None):
+            status[0] = status_line.split(' ', 1)[0]
+            return start_response(status_line, headers, exc_info)
+
+        try:
+            return self.wsgi_app(environ, record_status)
+        finally:
+            self.histogram.observe(
+                time.perf_counter() - started,
+                environ.get(self.ROUTE_KEY, '<unmatched>'),
+                environ.get('REQUEST_METHOD', ''),
+                status[0],
+            )
@@ -0,0 +1,221 @@
+"""
+Listes paginées par curseur (pagination par clé) des WANs et des appareils
+"""
+import base64
+import json
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+
+class InvalidQuery(ValueError):
+    """Paramètre de liste invalide (filtre, tri, limite ou curseur)"""
+
+
+def encode_cursor(sort, values):
+    """Curseur opaque : tri utilisé et clé de la dernière ligne renvoyée"""
+    raw = json.dumps({'s': sort, 'v': list(values)}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, sort):
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        data = json.loads(raw)
+        values = data['v']
+    except (ValueError, TypeError, KeyError):
+        raise InvalidQuery("Curseur invalide") from None
+    if data.get('s') != sort or not isinstance(values, list) or len(values) != 2:
+        raise InvalidQuery("Curseur invalide pour ce tri")
+    return values
+
+
+def prefix_range(column, prefix):
+    """Filtre « commence par » exprimé en intervalle, utilisable par un index
+
+    Contrairement à LIKE (insensible à la casse), `col >= 'abc' AND col < 'abd'`
+    est résolu par une recherche dans l'index de la colonne.
+    """
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    return f'{column} >= ? AND {column} < ?', (prefix, upper)
+
+
+def _choice(column, allowed):
+    def build(value):
+        if value not in allowed:
+            raise InvalidQuery(f"Valeur invalide pour {column} : {value}")
+        return f'{column} = ?', (value,)
+    return build
+
+
+def _equals(column):
+    return lambda value: (f'{column} = ?', (value,))
+
+
+def _prefix(column):
+    return lambda value: prefix_range(column, value)
+
+
+# Les ports ouverts (table device_ports, voir ports.py) ne concernent que
+# les appareils présents
+def _port(value):
+    try:
+        port = int(value)
+    except ValueError:
+        raise InvalidQuery(f"Port invalide : {value}") from None
+    if not 0 < port < 65536:
+        raise InvalidQuery(f"Port invalide : {value}")
+    return 'EXISTS (SELECT 1 FROM device_ports WHERE device_id = devices.id AND port = ?)', (port,)
+
+
+def _has_open_ports(value):
+    if value in ('1', 'true', 'yes'):
+        return 'EXISTS (SELECT 1 FROM device_ports WHERE device_id = devices.id)', ()
+    if value in ('0', 'false', 'no'):
+        return 'NOT EXISTS (SELECT 1 FROM device_ports WHERE device_id = devices.id)', ()
+    raise InvalidQuery(f"Valeur invalide pour has_open_ports : {value}")
+
+
+class ListQuery:
+    """Requête de liste validée ; `key` identifie la page pour le cache"""
+
+    __slots__ = ('sort', 'descending', 'limit', 'after', 'filters', 'key')
+
+    def __init__(self, sort, descending, limit, after, filters):
+        self.sort = sort
+        self.descending = descending
+        self.limit = limit
+        self.after = after
+        self.filters = filters
+        self.key = (sort, descending, limit, tuple(after or ()), tuple(sorted(filters.items())))
+
+
+class Listing:
+    """Liste paginable d'une table : clé unique, tris et filtres autorisés
+
+    Chaque tri porte sur une colonne non nulle départagée par la clé unique :
+    la page suivante commence après `(valeur, clé)` de la dernière ligne,
+    ce qui correspond à une recherche dans l'index `(colonne, clé)` au lieu
+    d'un OFFSET qui relit toutes les lignes précédentes.
+
+    `columns` : colonnes publiques renvoyées (toutes si None). Les colonnes
+    internes servant au tri (device_key pour `mac`) sont lues pour le curseur
+    puis retirées des lignes.
+    """
+
+    def __init__(self, table, key, sorts, filters, default_sort, columns=None):
+        self.table = table
+        self.key = key
+        self.sorts = sorts
+        self.filters = filters
+        self.default_sort = default_sort
+        self.columns = columns
+
+    def public(self, row):
+        """Ligne réduite aux colonnes publiques"""
+        if self.columns is None:
+            return row
+        return {column: row[column] for column in self.columns}
+
+    def parse(self, args):
+        """Valide les paramètres de requête (`args` : dictionnaire de chaînes)"""
+        sort = args.get('sort') or self.default_sort
+        descending = sort.startswith('-')
+        sort = sort.lstrip('-')
+        if sort not in self.sorts:
+            raise InvalidQuery(f"Tri invalide : {sort} (possibles : {', '.join(self.sorts)})")
+
+        try:
+            limit = int(args.get('limit', DEFAULT_LIMIT))
+        except ValueError:
+            raise InvalidQuery("limit doit être un entier") from None
+        limit = min(max(limit, 1), MAX_LIMIT)
+
+        filters = {}
+        for name in self.filters:
+            value = args.get(name)
+            if value:
+                # Valide dès maintenant pour répondre 400 plutôt qu'échouer en SQL
+                self.filters[name](value)
+                filters[name] = value
+
+        cursor = args.get('cursor')
+        after = decode_cursor(cursor, args.get('sort') or self.default_sort) if cursor else None
+        return ListQuery(sort, descending, limit, after, filters)
+
+    def sql(self, query, scope=None):
+        """Construit (sql, paramètres) ; `scope` : filtres d'égalité imposés {colonne: valeur}"""
+        column = self.sorts[query.sort]
+        where, params = [], []
+        for name, value in (scope or {}).items():
+            where.append(f'{name} = ?')
+            params.append(value)
+        for name, value in query.filters.items():
+            clause, values = self.filters[name](value)
+            where.append(clause)
+            params.extend(values)
+        if query.after is not None:
+            if column == self.key:
+                where.append(f"{self.key} {'<' if query.descending else '>'} ?")
+                params.append(query.after[1])
+            else:
+                where.append(f"({column}, {self.key}) {'<' if query.descending else '>'} (?, ?)")
+                params.extend(query.after)
+
+        direction = 'DESC' if query.descending else 'ASC'
+        order = f'{self.key} {direction}' if column == self.key else f'{column} {direction}, {self.key} {direction}'
+        selected = '*'
+        if self.columns is not None:
+            extra = [name for name in (column, self.key) if name not in self.columns]
+            selected = ', '.join(self.columns + tuple(dict.fromkeys(extra)))
+        sql = f'SELECT {selected} FROM {self.table}'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += f' ORDER BY {order} LIMIT {query.limit + 1}'
+        return sql, params
+
+    def page(self, db, query, scope=None):
+        """Retourne (lignes, curseur de la page suivante ou None)"""
+        sql, params = self.sql(query, scope)
+        rows = [dict(row) for row in db.execute(sql, params)]
+        next_cursor = None
+        if len(rows) > query.limit:
+            rows = rows[:query.limit]
+            last = rows[-1]
+            sort = ('-' if query.descending else '') + query.sort
+            next_cursor = encode_cursor(sort, (last[self.sorts[query.sort]], last[self.key]))
+        return [self.public(row) for row in rows], next_cursor
+
+
+WANS = Listing(
+    table='wans',
+    key='client_id',
+    sorts={'client_id': 'client_id', 'name': 'name', 'location': 'location', 'last_seen': 'last_seen'},
+    filters={
+        'status': _choice('status', ('online', 'offline')),
+        'location': _equals('location'),
+        'hostname': _prefix('hostname'),
+        'ip': _prefix('ip'),
+    },
+    default_sort='client_id',
+)
+
+DEVICES = Listing(
+    table='devices',
+    key='id',
+    sorts={'ip': 'ip', 'mac': 'device_key', 'last_seen': 'last_seen', 'id': 'id'},
+    filters={
+        'wan_id': _equals('wan_id'),
+        'status': _choice('status', ('up', 'gone')),
+        'hostname': _prefix('hostname'),
+        'ip': _prefix('ip'),
+        # device_key est la MAC en minuscules
+        'mac': lambda value: prefix_range('device_key', value.lower()),
+        'port': _port,
+        'has_open_ports': _has_open_ports,
+    },
+    default_sort='ip',
+    # Sans device_key ni ip_num (colonnes internes d'identité et de tri)
+    columns=('id', 'wan_id', 'mac', 'ip', 'hostname', 'vendor', 'status',
+             'open_ports', 'first_seen', 'last_seen', 'gone_at'),
+)
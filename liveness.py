@@ -0,0 +1,127 @@
+"""
+Suivi en mémoire de la présence des WANs (échéances en tas)
+"""
+import heapq
+import threading
+import time
+
+
+class _Entry:
+    __slots__ = ('deadline', 'timeout', 'online', 'queued')
+
+    def __init__(self, deadline, timeout, online):
+        self.deadline = deadline
+        self.timeout = timeout
+        self.online = online
+        # Échéance actuellement présente dans le tas (None si absente)
+        self.queued = None
+
+
+class LivenessTracker:
+    """Échéances de présence par client_id, sans balayage de la base
+
+    Chaque WAN en ligne a au plus une entrée dans un tas trié par échéance.
+    Un battement ne fait que repousser l'échéance en mémoire ; quand une
+    entrée arrive à terme avec une échéance repoussée, elle est simplement
+    réinsérée. Seules les vraies expirations sont renvoyées à l'appelant,
+    qui persiste alors les passages hors ligne.
+    """
+
+    def __init__(self, default_timeout=10.0):
+        self.default_timeout = default_timeout
+        self._cond = threading.Condition(threading.Lock())
+        self._entries = {}
+        self._heap = []
+        self._expired_total = 0
+        self._revived_total = 0
+
+    def _schedule(self, client_id, entry):
+        """Place l'échéance dans le tas si elle n'y est pas déjà (appelé sous verrou)"""
+        if entry.queued is None:
+            entry.queued = entry.deadline
+            wake = not self._heap or entry.deadline < self._heap[0][0]
+            heapq.heappush(self._heap, (entry.deadline, client_id))
+            if wake:
+                self._cond.notify()
+
+    def touch(self, client_id, now=None, timeout=None):
+        """Enregistre un signe de vie ; retourne True si le WAN repasse en ligne"""
+        now = now if now is not None else time.time()
+        with self._cond:
+            entry = self._entries.get(client_id)
+            if entry is None:
+                entry = _Entry(0, timeout or self.default_timeout, False)
+                self._entries[client_id] = entry
+            elif timeout:
+                entry.timeout = timeout
+            revived = not entry.online
+            entry.online = True
+            entry.deadline = now + entry.timeout
+            self._schedule(client_id, entry)
+            if revived:
+                self._revived_total += 1
+            return revived
+
+    def forget(self, client_id):
+        """Oublie un WAN supprimé (son entrée dans le tas sera ignorée)"""
+        with self._cond:
+            self._entries.pop(client_id, None)
+
+    def bootstrap(self, wans, now=None, grace=None):
+        """Initialise l'état depuis la base : [(client_id, online, last_seen_ts, timeout)]
+
+        Les WANs en ligne reçoivent au moins `grace` secondes (leur délai par
+        défaut) après le démarrage pour se manifester.
+        """
+        now = now if now is not None else time.time()
+        with self._cond:
+            for client_id, online, last_seen, timeout in wans:
+                timeout = timeout or self.default_timeout
+                entry = _Entry(0, timeout, online)
+                self._entries[client_id] = entry
+                if online:
+                    entry.deadline = max((last_seen or 0) + timeout, now + (grace or timeout))
+                    self._schedule(client_id, entry)
+
+    def expire(self, now=None):
+        """Retourne les WANs dont l'échéance est dépassée et les marque hors ligne"""
+        now = now if now is not None else time.time()
+        expired = []
+        with self._cond:
+            while self._heap and self._heap[0][0] <= now:
+                queued, client_id = heapq.heappop(self._heap)
+                entry = self._entries.get(client_id)
+                if entry is None or entry.queued != queued:
+                    # Entrée d'un WAN oublié ou déjà replanifiée
+                    continue
+                entry.queued = None
+                if not entry.online:
+                    continue
+                if entry.deadline > now:
+                    # Échéance repoussée depuis l'insertion : on la replanifie
+                    self._schedule(client_id, entry)
+                    continue
+                entry.online = False
+                expired.append(client_id)
+            self._expired_total += len(expired)
+        return expired
+
+    def wait(self, max_wait):
+        """Attend la prochaine échéance (ou `max_wait` secondes au plus)"""
+        with self._cond:
+            delay = max_wait
+            if self._heap:
+                delay = min(max_wait, max(0.0, self._heap[0][0] - time.time()))
+            if delay > 0:
+                self._cond.wait(delay)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'tracked': len(self._entries),
+                'online': sum(1 for e in self._entries.values() if e.online),
+                'scheduled': len(self._heap),
+                'expired': self._expired_total,
+                'revived': self._revived_total,
+                'next_deadline_in': round(self._heap[0][0] - time.time(), 3) if self._heap else None,
+            }
@@ -0,0 +1,333 @@
+"""
+Maintenance de la base : rétention, vacuum incrémental et sauvegardes à chaud
+
+    python maintenance.py backup [-o sauvegarde.db]
+    python maintenance.py vacuum [--full]
+    python maintenance.py size
+
+Le serveur enchaîne ces opérations dans sa fenêtre creuse (voir
+`run_maintenance` dans app.py) ; les suppressions et le vacuum avancent par
+lots courts pour ne jamais retenir longtemps le verrou d'écriture.
+
+Le vacuum incrémental suppose `auto_vacuum = INCREMENTAL`, qui ne peut être
+choisi qu'à la création de la base (avant le passage en WAL, voir
+`ConnectionPool`) ou par un VACUUM complet : `python maintenance.py vacuum
+--full`, serveur arrêté, convertit une base existante.
+"""
+import argparse
+import glob
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Lignes supprimées par écriture de rétention
+DELETE_BATCH = 1000
+# WANs supprimés par écriture (avec leurs appareils et leur historique)
+WAN_DELETE_BATCH = 50
+# Pages libérées par étape de vacuum incrémental
+VACUUM_PAGES = 1000
+# Pages copiées par étape de sauvegarde, et attente quand la base est verrouillée
+BACKUP_PAGES = 1024
+BACKUP_SLEEP = 0.01
+# Redémarrages tolérés (base modifiée pendant la copie) avant une copie en une étape
+BACKUP_MAX_RESTARTS = 3
+BACKUP_PREFIX = 'wans-'
+
+AUTO_VACUUM_MODES = ('none', 'full', 'incremental')
+
+SQL_DELETE_WAN_DEVICES = 'DELETE FROM devices WHERE wan_id = ?'
+# Appareils disparus depuis la date limite (index (status, wan_id, ip))
+SQL_EXPIRED_DEVICES = "SELECT id, wan_id FROM devices WHERE status = 'gone' AND gone_at < ? LIMIT ?"
+SQL_GONE_COUNT = "SELECT COUNT(*) FROM devices WHERE status = 'gone' AND wan_id = ?"
+# WANs hors ligne sans nouvelles depuis la date limite (index (status, client_id))
+SQL_STALE_WANS = "SELECT client_id FROM wans WHERE status = 'offline' AND last_seen < ? LIMIT ?"
+
+
+class MaintenanceError(RuntimeError):
+    """Opération impossible dans l'état courant (maintenance déjà en cours...)"""
+
+
+def cutoff(age, now=None):
+    """Date limite (format de CURRENT_TIMESTAMP, UTC) il y a `age` secondes"""
+    now = now if now is not None else time.time()
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(now - age))
+
+
+def delete_wan(db, client_id):
+    """Supprime un WAN, ses appareils et son historique de métriques
+
+    Les triggers des appareils purgent l'index de recherche et les ports.
+    """
+    db.execute(SQL_DELETE_WAN_DEVICES, (client_id,))
+    db.execute('DELETE FROM wan_samples WHERE wan_id = ?', (client_id,))
+    db.execute('DELETE FROM wan_rollups WHERE wan_id = ?', (client_id,))
+    db.execute('DELETE FROM wans WHERE client_id = ?', (client_id,))
+
+
+def purge_gone_devices(db, before, limit=DELETE_BATCH):
+    """Supprime au plus `limit` appareils disparus avant `before`
+
+    Retourne (nombre supprimé, {wan_id: appareils disparus restants}).
+    """
+    rows = db.execute(SQL_EXPIRED_DEVICES, (before, limit)).fetchall()
+    db.executemany('DELETE FROM devices WHERE id = ?', [(row['id'],) for row in rows])
+    remaining = {
+        wan_id: db.execute(SQL_GONE_COUNT, (wan_id,)).fetchone()[0]
+        for wan_id in sorted({row['wan_id'] for row in rows})
+    }
+    return len(rows), remaining
+
+
+def purge_stale_wans(db, before, limit=WAN_DELETE_BATCH):
+    """Supprime au plus `limit` WANs hors ligne depuis `before` ; retourne leurs identifiants"""
+    client_ids = [row['client_id'] for row in db.execute(SQL_STALE_WANS, (before, limit))]
+    for client_id in client_ids:
+        delete_wan(db, client_id)
+    return client_ids
+
+
+def database_size(db):
+    """Taille du fichier principal, pages libres et mode de vacuum"""
+    page_size = db.execute('PRAGMA page_size').fetchone()[0]
+    pages = db.execute('PRAGMA page_count').fetchone()[0]
+    free = db.execute('PRAGMA freelist_count').fetchone()[0]
+    mode = db.execute('PRAGMA auto_vacuum').fetchone()[0]
+    return {
+        'bytes': pages * page_size,
+        'free_bytes': free * page_size,
+        'page_size': page_size,
+        'pages': pages,
+        'free_pages': free,
+        'auto_vacuum': AUTO_VACUUM_MODES[mode],
+    }
+
+
+def wal_size(path):
+    try:
+        return os.path.getsize(path + '-wal')
+    except OSError:
+        return 0
+
+
+def incremental_vacuum(db, pages=VACUUM_PAGES):
+    """Rend au système au plus `pages` pages libres ; retourne le nombre rendu
+
+    Utilisable dans une transaction (écriture de la file du serveur) :
+    execute() ne fait avancer la PRAGMA que d'une page, elle est donc
+    répétée (quelques microsecondes par page).
+    """
+    before = db.execute('PRAGMA freelist_count').fetchone()[0]
+    for _ in range(min(int(pages), before)):
+        db.execute('PRAGMA incremental_vacuum(1)')
+    return before - db.execute('PRAGMA freelist_count').fetchone()[0]
+
+
+def checkpoint(db):
+    """Recopie le WAL dans la base et le tronque ; retourne (bloqué, pages du WAL, pages recopiées)"""
+    return tuple(db.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchone())
+
+
+class _Restarted(Exception):
+    pass
+
+
+def backup(source, path, pages=BACKUP_PAGES, sleep=BACKUP_SLEEP, max_restarts=BACKUP_MAX_RESTARTS):
+    """Copie cohérente de `source` (connexion ouverte) vers `path` par l'API de sauvegarde
+
+    La copie avance par `pages` pages en relâchant la base entre deux étapes.
+    Une écriture par une autre connexion la fait recommencer : au-delà de
+    `max_restarts` reprises, la copie est refaite en une seule étape (une
+    transaction de lecture, qui ne bloque pas les écritures en WAL). Le
+    fichier n'apparaît sous `path` qu'une fois complet.
+    """
+    started = time.perf_counter()
+    temporary = path + '.tmp'
+    if os.path.exists(temporary):
+        os.remove(temporary)
+    state = {'remaining': None, 'restarts': 0, 'steps': 0}
+
+    def progress(status, remaining, total):
+        state['steps'] += 1
+        # Sans reprise, le nombre de pages restantes diminue à chaque étape
+        if state['remaining'] is not None and remaining >= state['remaining']:
+            state['restarts'] += 1
+            if state['restarts'] > max_restarts:
+                raise _Restarted()
+        state['remaining'] = remaining
+
+    single_step = False
+    target = sqlite3.connect(temporary)
+    try:
+        try:
+            source.backup(target, pages=pages, progress=progress, sleep=sleep)
+        except _Restarted:
+            logger.info(f"Sauvegarde relancée {state['restarts']} fois : copie en une étape")
+            single_step = True
+            source.backup(target, pages=-1)
+        target.execute('PRAGMA journal_mode=DELETE')
+    finally:
+        target.close()
+    os.replace(temporary, path)
+    return {
+        'path': path,
+        'bytes': os.path.getsize(path),
+        'steps': state['steps'],
+        'restarts': state['restarts'],
+        'single_step': single_step,
+        'duration': round(time.perf_counter() - started, 3),
+        'finished_at': time.time(),
+    }
+
+
+def backup_path(directory, now=None):
+    stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(now))
+    return os.path.join(directory, f'{BACKUP_PREFIX}{stamp}.db')
+
+
+def prune_backups(directory, keep):
+    """Supprime les sauvegardes les plus anciennes au-delà de `keep` ; retourne les fichiers supprimés"""
+    backups = sorted(glob.glob(os.path.join(directory, f'{BACKUP_PREFIX}*.db')))
+    removed = backups[:-keep] if keep > 0 else []
+    for path in removed:
+        os.remove(path)
+    return removed
+
+
+def parse_window(value):
+    """`02:00-05:00` -> (minute de début, minute de fin) en heure locale ; None si vide"""
+    if not value:
+        return None
+    try:
+        bounds = []
+        for part in value.split('-'):
+            hours, _, minutes = part.strip().partition(':')
+            bounds.append(int(hours) * 60 + int(minutes or 0))
+        start, end = bounds
+    except ValueError:
+        raise ValueError(f"Fenêtre de maintenance invalide : {value} (attendu HH:MM-HH:MM)") from None
+    return start, end
+
+
+def in_window(window, now=None):
+    """La fenêtre (éventuellement à cheval sur minuit) contient-elle l'heure locale ?"""
+    if window is None:
+        return True
+    local = time.localtime(now)
+    minute = local.tm_hour * 60 + local.tm_min
+    start, end = window
+    return start <= minute < end if start <= end else minute >= start or minute < end
+
+
+class MaintenanceLog:
+    """Rapport de la dernière maintenance et totaux depuis le démarrage
+
+    `run()` empêche deux maintenances simultanées et fournit le rapport à
+    compléter : une entrée par étape et sa durée dans `durations`.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._running = False
+        self._last = None
+        self._runs = 0
+        self._deleted = Counter()
+        self._last_backup = None
+
+    @property
+    def running(self):
+        return self._running
+
+    @contextmanager
+    def run(self):
+        with self._lock:
+            if self._running:
+                raise MaintenanceError("Une maintenance est déjà en cours")
+            self._running = True
+        report = {'started_at': time.time(), 'durations': {}}
+        try:
+            yield report
+        finally:
+            report['finished_at'] = time.time()
+            with self._lock:
+                self._running = False
+                self._last = report
+                self._runs += 1
+                retention = report.get('retention') or {}
+                for kind in ('devices', 'wans'):
+                    self._deleted[kind] += retention.get(kind, 0)
+                if 'bytes' in (report.get('backup') or {}):
+                    self._last_backup = report['backup']
+
+    @contextmanager
+    def step(self, report, name):
+        """Exécute une étape : son échec est consigné sans interrompre les suivantes"""
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            logger.error(f"Maintenance, étape {name} en échec : {str(e)}")
+            report[name] = {'error': str(e)}
+        finally:
+            report['durations'][name] = round(time.perf_counter() - started, 3)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'running': self._running,
+                'runs': self._runs,
+                'deleted': dict(self._deleted),
+                'last_backup': self._last_backup,
+                'last': self._last,
+            }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Maintenance de la base Seahawks')
+    parser.add_argument('command', choices=('backup', 'vacuum', 'size'))
+    parser.add_argument('--db', default=None, help='Base SQLite (DATABASE_PATH, wans.db par défaut)')
+    parser.add_argument('-o', '--output', help='Fichier de sauvegarde (backups/wans-<date>.db par défaut)')
+    parser.add_argument('--full', action='store_true',
+                        help='VACUUM complet (serveur arrêté) : active aussi le vacuum incrémental')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    path = args.db or os.getenv('DATABASE_PATH', 'wans.db')
+    if not os.path.exists(path):
+        parser.error(f"Base introuvable : {path}")
+    db = sqlite3.connect(path)
+    try:
+        if args.command == 'backup':
+            output = args.output or backup_path(os.getenv('BACKUP_DIR') or 'backups')
+            os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+            result = backup(db, output)
+            print(f"Sauvegarde écrite dans {result['path']} ({result['bytes']} octets, {result['duration']}s)")
+        elif args.command == 'vacuum':
+            before = database_size(db)
+            if args.full:
+                db.execute('PRAGMA auto_vacuum = INCREMENTAL')
+                db.execute('VACUUM')
+            else:
+                while True:
+                    # Une transaction par étape : pas de synchronisation par page
+                    db.execute('BEGIN IMMEDIATE')
+                    freed = incremental_vacuum(db)
+                    db.commit()
+                    if not freed:
+                        break
+            checkpoint(db)
+            after = database_size(db)
+            print(f"{before['bytes']} -> {after['bytes']} octets (auto_vacuum : {after['auto_vacuum']})")
+        else:
+            print({**database_size(db), 'wal_bytes': wal_size(path)})
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
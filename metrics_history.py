@@ -0,0 +1,294 @@
+"""
+Historique de latence et de charge CPU des WANs, avec agrégats par résolution
+"""
+import math
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+METRICS = ('latency', 'cpu_load')
+
+# (nom, durée d'un bucket en secondes, source des agrégats)
+RESOLUTIONS = (
+    ('1m', 60, 'raw'),
+    ('1h', 3600, '1m'),
+    ('1d', 86400, '1h'),
+)
+
+DEFAULT_RETENTION = {
+    'raw': 2 * 86400,
+    '1m': 8 * 86400,
+    '1h': 90 * 86400,
+    '1d': 730 * 86400,
+}
+
+# En dessous de cette fenêtre, les échantillons bruts sont renvoyés tels quels
+RAW_QUERY_WINDOW = 900
+
+
+def create_tables(db):
+    """Tables de l'historique (appelée par les migrations)"""
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS wan_samples (
+            wan_id TEXT NOT NULL,
+            ts INTEGER NOT NULL,
+            latency REAL,
+            cpu_load REAL,
+            PRIMARY KEY (wan_id, ts)
+        ) WITHOUT ROWID
+    ''')
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS wan_rollups (
+            wan_id TEXT NOT NULL,
+            resolution TEXT NOT NULL,
+            bucket INTEGER NOT NULL,
+            samples INTEGER NOT NULL,
+            latency_min REAL, latency_avg REAL, latency_max REAL, latency_p95 REAL,
+            cpu_load_min REAL, cpu_load_avg REAL, cpu_load_max REAL, cpu_load_p95 REAL,
+            PRIMARY KEY (wan_id, resolution, bucket)
+        ) WITHOUT ROWID
+    ''')
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS rollup_state (
+            resolution TEXT PRIMARY KEY,
+            rolled_until INTEGER NOT NULL
+        )
+    ''')
+    # Purge par ancienneté, toutes séries confondues
+    db.execute('CREATE INDEX IF NOT EXISTS idx_wan_samples_ts ON wan_samples (ts)')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_wan_rollups_bucket ON wan_rollups (resolution, bucket)')
+
+
+def record_sample(db, wan_id, latency, cpu_load, ts=None):
+    """Enregistre un échantillon brut (ignoré si aucune mesure n'est fournie)"""
+    if latency is None and cpu_load is None:
+        return False
+    db.execute(
+        'INSERT OR REPLACE INTO wan_samples (wan_id, ts, latency, cpu_load) VALUES (?, ?, ?, ?)',
+        (wan_id, int(ts if ts is not None else time.time()), latency, cpu_load),
+    )
+    return True
+
+
+def percentile(values, q):
+    """Percentile par rang le plus proche d'une liste de valeurs"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q * len(ordered)))
+    return ordered[rank - 1]
+
+
+def _summarize_raw(values):
+    """(min, avg, max, p95) d'une série d'échantillons bruts"""
+    values = [v for v in values if v is not None]
+    if not values:
+        return (None, None, None, None)
+    return (min(values), sum(values) / len(values), max(values), percentile(values, 0.95))
+
+
+def _summarize_rollups(children, metric):
+    """Agrège des buckets fins en un bucket plus grossier
+
+    Min, max et moyenne (pondérée par le nombre d'échantillons) sont exacts ;
+    le p95 est approché par le 95e percentile pondéré des p95 des buckets fins.
+    """
+    rows = [c for c in children if c[f'{metric}_avg'] is not None]
+    if not rows:
+        return (None, None, None, None)
+    total = sum(c['samples'] for c in rows)
+    avg = sum(c[f'{metric}_avg'] * c['samples'] for c in rows) / total
+    weighted = sorted((c[f'{metric}_p95'], c['samples']) for c in rows)
+    threshold = 0.95 * total
+    running = 0
+    p95 = weighted[-1][0]
+    for value, weight in weighted:
+        running += weight
+        if running >= threshold:
+            p95 = value
+            break
+    return (min(c[f'{metric}_min'] for c in rows), avg, max(c[f'{metric}_max'] for c in rows), p95)
+
+
+def _rolled_until(db, resolution):
+    row = db.execute('SELECT rolled_until FROM rollup_state WHERE resolution = ?', (resolution,)).fetchone()
+    return row[0] if row else None
+
+
+def _write_buckets(db, resolution, buckets):
+    db.executemany(f'''
+        INSERT OR REPLACE INTO wan_rollups (wan_id, resolution, bucket, samples,
+            latency_min, latency_avg, latency_max, latency_p95,
+            cpu_load_min, cpu_load_avg, cpu_load_max, cpu_load_p95)
+        VALUES (?, '{resolution}', ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', buckets)
+
+
+def rollup(db, now=None):
+    """Calcule les buckets clos de chaque résolution depuis le dernier passage
+
+    Retourne le nombre de buckets écrits par résolution.
+    """
+    now = int(now if now is not None else time.time())
+    written = {}
+    for name, size, source in RESOLUTIONS:
+        end = now // size * size
+        start = _rolled_until(db, name)
+        if start is None:
+            if source == 'raw':
+                first = db.execute('SELECT MIN(ts) FROM wan_samples').fetchone()[0]
+            else:
+                first = db.execute('SELECT MIN(bucket) FROM wan_rollups WHERE resolution = ?',
+                                   (source,)).fetchone()[0]
+            if first is None:
+                continue
+            start = first // size * size
+        if start >= end:
+            written[name] = 0
+            continue
+
+        groups = {}
+        if source == 'raw':
+            rows = db.execute('''
+                SELECT wan_id, ts, latency, cpu_load FROM wan_samples
+                WHERE ts >= ? AND ts < ? ORDER BY wan_id, ts
+            ''', (start, end))
+            for row in rows:
+                groups.setdefault((row['wan_id'], row['ts'] // size * size), []).append(row)
+            buckets = [
+                (wan_id, bucket, len(samples),
+                 *_summarize_raw([s['latency'] for s in samples]),
+                 *_summarize_raw([s['cpu_load'] for s in samples]))
+                for (wan_id, bucket), samples in groups.items()
+            ]
+        else:
+            rows = db.execute('''
+                SELECT * FROM wan_rollups
+                WHERE resolution = ? AND bucket >= ? AND bucket < ?
+                ORDER BY wan_id, bucket
+            ''', (source, start, end))
+            for row in rows:
+                groups.setdefault((row['wan_id'], row['bucket'] // size * size), []).append(row)
+            buckets = [
+                (wan_id, bucket, sum(c['samples'] for c in children),
+                 *_summarize_rollups(children, 'latency'),
+                 *_summarize_rollups(children, 'cpu_load'))
+                for (wan_id, bucket), children in groups.items()
+            ]
+
+        _write_buckets(db, name, buckets)
+        db.execute('INSERT OR REPLACE INTO rollup_state (resolution, rolled_until) VALUES (?, ?)',
+                   (name, end))
+        written[name] = len(buckets)
+    return written
+
+
+def apply_retention(db, retention=None, now=None):
+    """Supprime les données plus anciennes que la rétention de chaque résolution"""
+    retention = {**DEFAULT_RETENTION, **(retention or {})}
+    now = int(now if now is not None else time.time())
+    deleted = {}
+    cursor = db.execute('DELETE FROM wan_samples WHERE ts < ?', (now - retention['raw'],))
+    deleted['raw'] = cursor.rowcount
+    for name, _, _ in RESOLUTIONS:
+        cursor = db.execute('DELETE FROM wan_rollups WHERE resolution = ? AND bucket < ?',
+                            (name, now - retention[name]))
+        deleted[name] = cursor.rowcount
+    return deleted
+
+
+def choose_resolution(start, end, max_points, retention=None, now=None):
+    """Choisit la résolution la plus fine qui tient dans `max_points` et couvre `start`
+
+    Retourne 'raw', '1m', '1h' ou '1d'.
+    """
+    retention = {**DEFAULT_RETENTION, **(retention or {})}
+    now = int(now if now is not None else time.time())
+    window = max(0, end - start)
+    if window <= RAW_QUERY_WINDOW and start >= now - retention['raw']:
+        return 'raw'
+    for name, size, _ in RESOLUTIONS:
+        if window / size <= max_points and start >= now - retention[name]:
+            return name
+    return RESOLUTIONS[-1][0]
+
+
+# Colonnes d'un point agrégé (bucket renommé en ts)
+ROLLUP_FIELDS = ('ts', 'samples',
+                 'latency_min', 'latency_avg', 'latency_max', 'latency_p95',
+                 'cpu_load_min', 'cpu_load_avg', 'cpu_load_max', 'cpu_load_p95')
+
+
+def _summarize_points(points, size, summarize):
+    """Regroupe des points (clé `ts`) en buckets de `size` secondes"""
+    groups = {}
+    for point in points:
+        groups.setdefault(point['ts'] // size * size, []).append(point)
+    return [summarize(bucket, children) for bucket, children in sorted(groups.items())]
+
+
+def _from_samples(bucket, samples):
+    return dict(zip(ROLLUP_FIELDS, (
+        bucket, len(samples),
+        *_summarize_raw([s['latency'] for s in samples]),
+        *_summarize_raw([s['cpu_load'] for s in samples]))))
+
+
+def _from_rollups(bucket, children):
+    return dict(zip(ROLLUP_FIELDS, (
+        bucket, sum(c['samples'] for c in children),
+        *_summarize_rollups(children, 'latency'),
+        *_summarize_rollups(children, 'cpu_load'))))
+
+
+def _rollup_points(db, wan_id, resolution, start, end):
+    """Buckets d'un WAN sur [start, end), y compris ceux que `rollup` n'a pas encore écrits
+
+    Au-delà de `rolled_until` (bucket en cours, passage d'agrégation à venir),
+    les buckets sont calculés à la volée depuis la résolution plus fine,
+    elle-même complétée de la même façon jusqu'aux échantillons bruts.
+    """
+    size, source = next((size, source) for name, size, source in RESOLUTIONS if name == resolution)
+    rows = db.execute('''
+        SELECT bucket AS ts, samples,
+            latency_min, latency_avg, latency_max, latency_p95,
+            cpu_load_min, cpu_load_avg, cpu_load_max, cpu_load_p95
+        FROM wan_rollups
+        WHERE wan_id = ? AND resolution = ? AND bucket >= ? AND bucket < ?
+        ORDER BY bucket
+    ''', (wan_id, resolution, start, end)).fetchall()
+    points = [dict(row) for row in rows]
+
+    # Premier bucket entier de la fenêtre non couvert par l'agrégation
+    tail = max(_rolled_until(db, resolution) or 0, -(-start // size) * size)
+    if tail < end:
+        if source == 'raw':
+            samples = db.execute('''
+                SELECT ts, latency, cpu_load FROM wan_samples
+                WHERE wan_id = ? AND ts >= ? AND ts < ? ORDER BY ts
+            ''', (wan_id, tail, end)).fetchall()
+            points += _summarize_points(samples, size, _from_samples)
+        else:
+            children = _rollup_points(db, wan_id, source, tail, end)
+            points += _summarize_points(children, size, _from_rollups)
+    return points
+
+
+def query_range(db, wan_id, start, end, max_points=500, retention=None):
+    """Série d'un WAN sur [start, end), à la résolution adaptée à la fenêtre
+
+    Le nombre de points renvoyés est borné par `max_points`. Aux résolutions
+    agrégées, le bucket en cours (non encore agrégé) est inclus, partiel.
+    """
+    resolution = choose_resolution(start, end, max_points, retention)
+    if resolution == 'raw':
+        rows = db.execute('''
+            SELECT ts, latency, cpu_load FROM wan_samples
+            WHERE wan_id = ? AND ts >= ? AND ts < ?
+            ORDER BY ts LIMIT ?
+        ''', (wan_id, start, end, max_points)).fetchall()
+        points = [dict(row) for row in rows]
+    else:
+        points = _rollup_points(db, wan_id, resolution, start, end)[:max_points]
+    return {'wan_id': wan_id, 'resolution': resolution, 'start': start, 'end': end, 'points': points}
@@ -0,0 +1,204 @@
+"""
+Migrations versionnées du schéma de la base Seahawks
+"""
+import logging
+
+from device_ingest import device_key, ipv4_number
+import metrics_history
+import ports
+import search
+
+logger = logging.getLogger(__name__)
+
+
+def _create_base_tables(db):
+    """Tables d'origine (identiques au schéma des versions 3.x)"""
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS wans (
+            client_id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            ip TEXT NOT NULL,
+            subnet TEXT NOT NULL,
+            location TEXT NOT NULL,
+            hostname TEXT NOT NULL,
+            status TEXT DEFAULT 'offline',
+            last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            latency REAL,
+            cpu_load REAL
+        )
+    ''')
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS devices (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            wan_id TEXT NOT NULL,
+            mac TEXT NOT NULL,
+            ip TEXT NOT NULL,
+            hostname TEXT,
+            last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            open_ports TEXT,
+            FOREIGN KEY (wan_id) REFERENCES wans (client_id)
+        )
+    ''')
+
+
+def _add_columns(db, table, columns):
+    """Ajoute les colonnes absentes (les bases antérieures aux migrations peuvent déjà les avoir)"""
+    existing = {row[1] for row in db.execute(f'PRAGMA table_info({table})')}
+    for name, definition in columns.items():
+        if name not in existing:
+            db.execute(f'ALTER TABLE {table} ADD COLUMN {name} {definition}')
+
+
+def _device_identity(db):
+    """Colonnes de l'ingestion différentielle et unicité (wan_id, device_key)"""
+    _add_columns(db, 'devices', {
+        'device_key': 'TEXT',
+        'status': "TEXT DEFAULT 'up'",
+        'first_seen': 'TIMESTAMP',
+        'gone_at': 'TIMESTAMP',
+    })
+    db.execute('UPDATE devices SET first_seen = last_seen WHERE first_seen IS NULL')
+
+    # Calcule la clé d'identité des anciennes lignes, puis supprime les doublons
+    rows = db.execute('SELECT id, mac, ip FROM devices WHERE device_key IS NULL').fetchall()
+    if rows:
+        db.executemany('UPDATE devices SET device_key = ? WHERE id = ?',
+                       [(device_key(mac, ip), row_id) for row_id, mac, ip in rows])
+        db.execute('''
+            DELETE FROM devices WHERE id NOT IN (
+                SELECT MAX(id) FROM devices GROUP BY wan_id, device_key
+            )
+        ''')
+    db.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_devices_wan_key
+        ON devices (wan_id, device_key)
+    ''')
+
+
+def _device_vendor(db):
+    """Fabricant de l'appareil, déjà présent dans le schéma de app_backup.py"""
+    _add_columns(db, 'devices', {'vendor': 'TEXT'})
+
+
+def _hot_query_indexes(db):
+    """Index des requêtes fréquentes de app.py"""
+    # Appareils d'un WAN triés par IP (page WAN, listes d'appareils)
+    db.execute('CREATE INDEX IF NOT EXISTS idx_devices_wan_ip ON devices (wan_id, ip)')
+    # Tableau de bord : appareils présents groupés par WAN, sans tri temporaire
+    db.execute('CREATE INDEX IF NOT EXISTS idx_devices_status_wan_ip ON devices (status, wan_id, ip)')
+    # Balayage hors ligne : seuls les WANs en ligne sont indexés
+    db.execute('''
+        CREATE INDEX IF NOT EXISTS idx_wans_online_last_seen
+        ON wans (last_seen) WHERE status = 'online'
+    ''')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_wans_last_seen ON wans (last_seen)')
+
+
+def _listing_indexes(db):
+    """Index de la pagination par clé : (colonne de tri, clé unique) pour chaque tri"""
+    for column in ('name', 'location', 'status', 'last_seen'):
+        db.execute(f'CREATE INDEX IF NOT EXISTS idx_wans_{column}_id ON wans ({column}, client_id)')
+    # Remplacé par idx_wans_last_seen_id, qui départage les ex aequo
+    db.execute('DROP INDEX IF EXISTS idx_wans_last_seen')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_wans_hostname ON wans (hostname)')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_wans_ip ON wans (ip)')
+
+    # Les index d'appareils contiennent implicitement `id` (rowid) en dernière colonne
+    db.execute('CREATE INDEX IF NOT EXISTS idx_devices_wan_last_seen ON devices (wan_id, last_seen)')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_devices_wan_hostname ON devices (wan_id, hostname)')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_devices_ip ON devices (ip)')
+
+
+def _liveness_timeout(db):
+    """Délai d'expiration de présence propre à chaque WAN (NULL : délai par défaut)"""
+    _add_columns(db, 'wans', {'liveness_timeout': 'REAL'})
+
+
+def _device_search(db):
+    """Recherche d'appareils dans toute la flotte (voir search.py)"""
+    _add_columns(db, 'devices', {'ip_num': 'INTEGER'})
+    rows = db.execute('SELECT id, ip FROM devices WHERE ip_num IS NULL').fetchall()
+    numbers = [(ipv4_number(ip), row_id) for row_id, ip in rows]
+    db.executemany('UPDATE devices SET ip_num = ? WHERE id = ?',
+                   [(number, row_id) for number, row_id in numbers if number is not None])
+    # Réseaux CIDR : intervalle d'adresses
+    db.execute('CREATE INDEX IF NOT EXISTS idx_devices_ip_num ON devices (ip_num)')
+    # MAC dans toute la flotte (idx_devices_wan_key commence par wan_id)
+    db.execute('CREATE INDEX IF NOT EXISTS idx_devices_key ON devices (device_key)')
+    search.create_index(db)
+
+
+# (version, description, fonction) : ne jamais modifier une migration publiée,
+# toujours en ajouter une nouvelle à la fin
+MIGRATIONS = [
+    (1, "Tables wans et devices", _create_base_tables),
+    (2, "Identité des appareils pour l'ingestion différentielle", _device_identity),
+    (3, "Colonne vendor des appareils", _device_vendor),
+    (4, "Index des requêtes fréquentes", _hot_query_indexes),
+    (5, "Historique de latence et de charge CPU", metrics_history.create_tables),
+    (6, "Délai de présence par WAN", _liveness_timeout),
+    (7, "Index de la pagination des listes", _listing_indexes),
+    (8, "Index de recherche des appareils", _device_search),
+    (9, "Ports ouverts en table normalisée", ports.create_tables),
+]
+
+
+def schema_version(db):
+    """Version du schéma enregistrée dans la base (PRAGMA user_version)"""
+    return db.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(db, migrations=MIGRATIONS):
+    """Applique les migrations en attente, chacune dans sa propre transaction
+
+    Retourne la liste des versions appliquées.
+    """
+    if db.in_transaction:
+        db.commit()
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    current = schema_version(db)
+    applied = []
+    for version, description, upgrade in migrations:
+        if version <= current:
+            continue
+        logger.info(f"Migration du schéma vers la version {version} : {description}")
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            upgrade(db)
+            db.execute('INSERT OR REPLACE INTO schema_migrations (version, description) VALUES (?, ?)',
+                       (version, description))
+            db.execute(f'PRAGMA user_version = {int(version)}')
+            db.commit()
+        except Exception:
+            db.rollback()
+            logger.error(f"Échec de la migration {version}, schéma laissé en version {current}")
+            raise
+        current = version
+        applied.append(version)
+    return applied
+
+
+def explain(db, sql, params=()):
+    """Retourne les lignes `detail` de EXPLAIN QUERY PLAN"""
+    return [row[3] for row in db.execute(f'EXPLAIN QUERY PLAN {sql}', params)]
+
+
+def check_query_plans(db, queries):
+    """Vérifie que les requêtes passent par un index plutôt qu'un parcours complet
+
+    `queries` associe un nom à (sql, paramètres). Retourne un dictionnaire
+    {nom: détails du plan} pour chaque requête qui parcourt une table sans index.
+    """
+    problems = {}
+    for name, (sql, params) in queries.items():
+        plan = explain(db, sql, params)
+        if any(detail.startswith('SCAN') and 'INDEX' not in detail for detail in plan):
+            problems[name] = plan
+    return problems
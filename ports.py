@@ -0,0 +1,196 @@
+"""
+Ports ouverts des appareils, en table normalisée, et requêtes d'exposition
+
+`device_ports` contient une ligne par (appareil, port, protocole) pour les
+appareils présents (`status = 'up'`) : elle est réécrite par l'ingestion
+quand les ports d'un appareil changent et vidée quand il disparaît. La
+colonne `devices.open_ports` garde le détail envoyé par le client pour
+l'affichage.
+"""
+import json
+
+from listing import InvalidQuery, decode_cursor, encode_cursor, DEFAULT_LIMIT, MAX_LIMIT
+
+PROTOCOLS = ('tcp', 'udp', 'sctp')
+
+INSERT_PORT = '''
+    INSERT OR REPLACE INTO device_ports (device_id, port, protocol, wan_id, service, version)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+DELETE_DEVICE_PORTS = 'DELETE FROM device_ports WHERE device_id = ?'
+
+# Ports les plus exposés : parcours de l'index (port, protocol, wan_id) seul
+SQL_TOP_PORTS = '''
+    SELECT port, protocol, COUNT(*) AS devices, COUNT(DISTINCT wan_id) AS wans
+    FROM device_ports {where}
+    GROUP BY port, protocol
+    ORDER BY devices DESC, port, protocol
+    LIMIT ?
+'''
+
+# Appareils exposant un port, paginés par (wan_id, device_id) dans l'ordre de l'index
+SQL_PORT_DEVICES = '''
+    SELECT p.wan_id, p.device_id, p.service, p.version, w.name AS wan_name,
+           d.mac, d.ip, d.hostname, d.vendor, d.last_seen
+    FROM device_ports p
+    JOIN devices d ON d.id = p.device_id
+    LEFT JOIN wans w ON w.client_id = p.wan_id
+    WHERE p.port = ? AND p.protocol = ? {after}
+    ORDER BY p.wan_id, p.device_id
+    LIMIT ?
+'''
+
+# Exposition par WAN, éventuellement limitée à certains ports
+SQL_WAN_EXPOSURE = '''
+    SELECT p.wan_id, w.name AS wan_name, w.location AS wan_location,
+           COUNT(DISTINCT p.device_id) AS devices, COUNT(*) AS open_ports
+    FROM device_ports p LEFT JOIN wans w ON w.client_id = p.wan_id
+    {where}
+    GROUP BY p.wan_id
+    ORDER BY devices DESC, p.wan_id
+    LIMIT ?
+'''
+
+# Ports ouverts d'un WAN
+SQL_WAN_PORTS = '''
+    SELECT port, protocol, COUNT(*) AS devices
+    FROM device_ports WHERE wan_id = ?
+    GROUP BY port, protocol
+    ORDER BY devices DESC, port, protocol
+'''
+
+
+def create_tables(db):
+    """Table des ports ouverts et reprise des rapports existants (migration)"""
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS device_ports (
+            device_id INTEGER NOT NULL,
+            port INTEGER NOT NULL,
+            protocol TEXT NOT NULL,
+            wan_id TEXT NOT NULL,
+            service TEXT,
+            version TEXT,
+            PRIMARY KEY (device_id, port, protocol)
+        ) WITHOUT ROWID
+    ''')
+    # Ports les plus exposés, appareils par port, exposition filtrée par port
+    db.execute('CREATE INDEX IF NOT EXISTS idx_device_ports_port ON device_ports (port, protocol, wan_id)')
+    # Exposition d'un WAN
+    db.execute('CREATE INDEX IF NOT EXISTS idx_device_ports_wan ON device_ports (wan_id, port, protocol)')
+    db.execute('''
+        CREATE TRIGGER IF NOT EXISTS device_ports_cleanup AFTER DELETE ON devices BEGIN
+            DELETE FROM device_ports WHERE device_id = old.id;
+        END
+    ''')
+
+    rows = db.execute("SELECT id, wan_id, open_ports FROM devices WHERE status = 'up'").fetchall()
+    db.executemany(INSERT_PORT, [
+        (device_id, port, protocol, wan_id, service, version)
+        for device_id, wan_id, open_ports in rows
+        for (port, protocol), (service, version) in normalize_ports(decode_ports(open_ports)).items()
+    ])
+
+
+def decode_ports(value):
+    """Décode la colonne open_ports (texte JSON) ; liste vide si elle est invalide"""
+    if not value:
+        return []
+    try:
+        ports = json.loads(value)
+    except (TypeError, ValueError):
+        return []
+    return ports if isinstance(ports, list) else []
+
+
+def _text(value):
+    return str(value) if value not in (None, '') else None
+
+
+def normalize_ports(open_ports):
+    """{(port, protocole): (service, version)} d'une liste de ports reçue
+
+    Accepte des entiers (`[22, 80]`) ou des objets
+    (`{'port': 22, 'protocol': 'tcp', 'service': 'ssh', 'version': ..., 'state': 'open'}`).
+    Les ports invalides ou dont l'état n'est pas `open` sont ignorés.
+    """
+    ports = {}
+    if not isinstance(open_ports, list):
+        return ports
+    for entry in open_ports:
+        if isinstance(entry, dict):
+            if entry.get('state', 'open') != 'open':
+                continue
+            port = entry.get('port')
+            protocol = str(entry.get('protocol') or entry.get('proto') or 'tcp').lower()
+            details = (_text(entry.get('service') or entry.get('name')), _text(entry.get('version')))
+        else:
+            port, protocol, details = entry, 'tcp', (None, None)
+        try:
+            port = int(port)
+        except (TypeError, ValueError):
+            continue
+        if 0 < port < 65536 and protocol in PROTOCOLS:
+            ports[(port, protocol)] = details
+    return ports
+
+
+def parse_port(value):
+    try:
+        port = int(value)
+    except (TypeError, ValueError):
+        raise InvalidQuery(f"Port invalide : {value}") from None
+    if not 0 < port < 65536:
+        raise InvalidQuery(f"Port invalide : {value}")
+    return port
+
+
+def parse_protocol(value):
+    protocol = (value or 'tcp').lower()
+    if protocol not in PROTOCOLS:
+        raise InvalidQuery(f"Protocole invalide : {value} (possibles : {', '.join(PROTOCOLS)})")
+    return protocol
+
+
+def parse_port_spec(value):
+    """`445` ou `161/udp` -> (port, protocole)"""
+    port, _, protocol = value.partition('/')
+    return parse_port(port), parse_protocol(protocol)
+
+
+def parse_limit(value, default=DEFAULT_LIMIT):
+    try:
+        limit = int(value if value is not None else default)
+    except ValueError:
+        raise InvalidQuery("limit doit être un entier") from None
+    return min(max(limit, 1), MAX_LIMIT)
+
+
+def top_ports(db, limit, protocol=None):
+    where, params = ('WHERE protocol = ?', [protocol]) if protocol else ('', [])
+    return [dict(row) for row in db.execute(SQL_TOP_PORTS.format(where=where), params + [limit])]
+
+
+def port_devices(db, port, protocol, limit, cursor=None):
+    """Retourne (appareils exposant le port, curseur de la page suivante ou None)"""
+    after, params = '', [port, protocol]
+    if cursor:
+        after = 'AND (p.wan_id, p.device_id) > (?, ?)'
+        params.extend(decode_cursor(cursor, 'port'))
+    rows = [dict(row) for row in db.execute(SQL_PORT_DEVICES.format(after=after), params + [limit + 1])]
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor('port', (rows[-1]['wan_id'], rows[-1]['device_id']))
+
+
+def wan_exposure(db, ports, limit):
+    """Appareils exposés et ports ouverts par WAN ; `ports` : [(port, protocole)] ou vide pour tous"""
+    where, params = '', []
+    if ports:
+        where = 'WHERE ' + ' OR '.join('(p.port = ? AND p.protocol = ?)' for _ in ports)
+        params = [value for pair in ports for value in pair]
+    return [dict(row) for row in db.execute(SQL_WAN_EXPOSURE.format(where=where), params + [limit])]
+
+
+def wan_ports(db, wan_id):
+    return [dict(row) for row in db.execute(SQL_WAN_PORTS, (wan_id,))]
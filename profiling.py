@@ -0,0 +1,259 @@
+"""
+Profilage à la demande du serveur en cours d'exécution (CPU et mémoire)
+
+Rien n'est actif hors d'une capture : l'échantillonneur CPU tourne dans le
+thread qui le demande, le temps de la capture, et `tracemalloc` n'est
+démarré qu'explicitement. Le reste du temps, le coût est nul.
+"""
+import marshal
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+MAX_DEPTH = 128
+
+
+class ProfilerError(RuntimeError):
+    """Capture impossible dans l'état courant (déjà en cours, traçage inactif...)"""
+
+
+def _thread_names():
+    return {thread.ident: thread.name for thread in threading.enumerate()}
+
+
+def _stack(frame):
+    """Pile (racine -> feuille) de clés (fichier, ligne de définition, fonction)"""
+    stack = []
+    while frame is not None and len(stack) < MAX_DEPTH:
+        code = frame.f_code
+        stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+        frame = frame.f_back
+    stack.reverse()
+    return tuple(stack)
+
+
+def _label(key):
+    filename, line, name = key
+    return f'{name} ({os.path.basename(filename)}:{line})'
+
+
+class CpuProfile:
+    """Résultat d'une capture : nombre d'échantillons par (thread, pile)"""
+
+    def __init__(self, samples, ticks, duration, interval):
+        self.samples = samples
+        self.ticks = ticks
+        self.duration = duration
+        self.interval = interval
+
+    @property
+    def sample_time(self):
+        """Durée représentée par un échantillon, en secondes"""
+        return self.duration / self.ticks if self.ticks else self.interval
+
+    def collapsed(self):
+        """Format « piles repliées » (flamegraph.pl, speedscope) : `thread;f1;f2 n`"""
+        lines = []
+        for (thread, stack), count in sorted(self.samples.items()):
+            frames = ';'.join([thread] + [_label(key) for key in stack])
+            lines.append(f'{frames} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def pstats(self):
+        """Données au format de `pstats.Stats` (fichier marshal de cProfile)
+
+        Les temps sont estimés à partir des échantillons ; les nombres
+        d'appels ne sont pas connus et valent le nombre d'échantillons.
+        """
+        functions = {}
+        for (_, stack), count in self.samples.items():
+            if not stack:
+                continue
+            for key in set(stack):
+                entry = functions.setdefault(key, [0, 0, 0.0, 0.0, {}])
+                entry[0] += count
+                entry[1] += count
+                entry[3] += count
+            functions[stack[-1]][2] += count
+            for caller, callee in set(zip(stack, stack[1:])):
+                edge = functions[callee][4].setdefault(caller, [0, 0, 0.0, 0.0])
+                edge[0] += count
+                edge[1] += count
+                edge[3] += count
+            if len(stack) > 1:
+                functions[stack[-1]][4][stack[-2]][2] += count
+
+        unit = self.sample_time
+        stats = {}
+        for key, (cc, nc, tt, ct, callers) in functions.items():
+            stats[key] = (cc, nc, tt * unit, ct * unit, {
+                caller: (ecc, enc, ett * unit, ect * unit)
+                for caller, (ecc, enc, ett, ect) in callers.items()
+            })
+        return marshal.dumps(stats)
+
+    def summary(self, top=25):
+        """Fonctions les plus présentes, en temps propre et en temps cumulé"""
+        own, total, threads = Counter(), Counter(), Counter()
+        for (thread, stack), count in self.samples.items():
+            threads[thread] += count
+            if stack:
+                own[stack[-1]] += count
+                for key in set(stack):
+                    total[key] += count
+        unit = self.sample_time
+        return {
+            'duration': round(self.duration, 3),
+            'interval': self.interval,
+            'ticks': self.ticks,
+            'samples': sum(self.samples.values()),
+            'threads': {name: round(count * unit, 3) for name, count in threads.most_common()},
+            'self': [{'function': _label(key), 'seconds': round(count * unit, 3)}
+                     for key, count in own.most_common(top)],
+            'cumulative': [{'function': _label(key), 'seconds': round(count * unit, 3)}
+                           for key, count in total.most_common(top)],
+        }
+
+
+class SamplingProfiler:
+    """Profileur par échantillonnage de tous les threads du processus
+
+    À intervalle régulier, relève la pile de chaque thread avec
+    `sys._current_frames()`. Contrairement à cProfile, limité au thread qui
+    l'active, il voit les threads de fond (statuts, mises à jour, file
+    d'écriture) comme ceux des requêtes. Le temps mesuré est le temps réel :
+    un thread bloqué en attente apparaît dans sa fonction d'attente.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._lock.locked()
+
+    def capture(self, duration, interval=0.005):
+        """Échantillonne pendant `duration` secondes dans le thread appelant"""
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerError("Une capture CPU est déjà en cours")
+        try:
+            own = threading.get_ident()
+            names = _thread_names()
+            samples = Counter()
+            ticks = 0
+            started = time.perf_counter()
+            deadline = started + duration
+            while True:
+                for ident, frame in sys._current_frames().items():
+                    if ident == own:
+                        continue
+                    name = names.get(ident)
+                    if name is None:
+                        # Thread apparu depuis le dernier relevé des noms
+                        names = _thread_names()
+                        name = names.get(ident, str(ident))
+                    samples[(name, _stack(frame))] += 1
+                ticks += 1
+                now = time.perf_counter()
+                if now >= deadline:
+                    break
+                time.sleep(min(interval, deadline - now))
+            return CpuProfile(samples, ticks, time.perf_counter() - started, interval)
+        finally:
+            self._lock.release()
+
+
+class MemoryTracer:
+    """Instantanés `tracemalloc` et différences avec un instantané de référence
+
+    Le traçage alourdit chaque allocation : il n'est actif qu'entre `start()`
+    et `stop()`.
+    """
+
+    # Les allocations du traçage lui-même ne sont pas intéressantes
+    FILTERS = (
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._baseline = None
+        self._baseline_at = None
+
+    def start(self, frames=1):
+        """Démarre le traçage ; retourne False s'il était déjà actif"""
+        with self._lock:
+            if tracemalloc.is_tracing():
+                return False
+            tracemalloc.start(frames)
+            self._baseline = self._baseline_at = None
+            return True
+
+    def stop(self):
+        with self._lock:
+            was_tracing = tracemalloc.is_tracing()
+            tracemalloc.stop()
+            self._baseline = self._baseline_at = None
+            return was_tracing
+
+    def _take(self):
+        if not tracemalloc.is_tracing():
+            raise ProfilerError("Traçage mémoire inactif")
+        return tracemalloc.take_snapshot().filter_traces(self.FILTERS)
+
+    def snapshot(self):
+        """Prend un instantané, qui devient la référence des différences suivantes"""
+        with self._lock:
+            snapshot = self._take()
+            self._baseline = snapshot
+            self._baseline_at = time.time()
+            return snapshot
+
+    def diff(self):
+        """Différences entre un nouvel instantané et la référence"""
+        with self._lock:
+            if self._baseline is None:
+                raise ProfilerError("Aucun instantané de référence")
+            return self._take(), self._baseline
+
+    def stats(self):
+        with self._lock:
+            tracing = tracemalloc.is_tracing()
+            current, peak = tracemalloc.get_traced_memory() if tracing else (0, 0)
+            return {
+                'tracing': tracing,
+                'frames': tracemalloc.get_traceback_limit() if tracing else None,
+                'traced_bytes': current,
+                'peak_bytes': peak,
+                'overhead_bytes': tracemalloc.get_tracemalloc_memory() if tracing else 0,
+                'baseline_age': round(time.time() - self._baseline_at, 1) if self._baseline_at else None,
+            }
+
+
+def _traceback(statistic):
+    return [f'{frame.filename}:{frame.lineno}' for frame in statistic.traceback]
+
+
+def top_allocations(snapshot, key='lineno', top=25):
+    """Plus gros consommateurs d'un instantané"""
+    return [{
+        'size': stat.size,
+        'count': stat.count,
+        'traceback': _traceback(stat),
+    } for stat in snapshot.statistics(key)[:top]]
+
+
+def top_differences(snapshot, baseline, key='lineno', top=25):
+    """Plus fortes évolutions depuis la référence (croissances en premier)"""
+    return [{
+        'size_diff': stat.size_diff,
+        'size': stat.size,
+        'count_diff': stat.count_diff,
+        'count': stat.count,
+        'traceback': _traceback(stat),
+    } for stat in snapshot.compare_to(baseline, key)[:top]]
@@ -0,0 +1,323 @@
+"""
+Modèle de lecture : instantané immuable des WANs et de leurs appareils en mémoire
+
+Le tableau de bord et les API de lecture (`/`, `/wan/<id>`, `/api/wans`,
+`/api/wans/<id>`, `/api/wans/<id>/devices`) sont servis depuis cet
+instantané, sans verrou ni accès à la base. Après chaque commit, le
+rédacteur relit les seuls WANs et appareils modifiés, construit un nouvel
+instantané qui partage tout le reste avec le précédent, puis le publie par
+une simple affectation : une requête travaille du début à la fin sur
+l'instantané lu à son arrivée.
+
+Rien n'est modifié après publication : un WAN modifié est remplacé par un
+nouvel enregistrement, jamais mis à jour sur place.
+"""
+import bisect
+import json
+import threading
+import time
+
+import listing
+from listing import InvalidQuery, encode_cursor
+from ports import decode_ports, normalize_ports
+
+SQL_WANS = 'SELECT * FROM wans'
+SQL_DEVICES = 'SELECT * FROM devices'
+SQL_WAN_DEVICES = 'SELECT * FROM devices WHERE wan_id = ?'
+# Appareils écrits par un rapport (index unique (wan_id, device_key))
+SQL_WAN_DEVICE_KEYS = 'SELECT * FROM devices WHERE wan_id = ? AND device_key IN (SELECT value FROM json_each(?))'
+
+
+def _equals(column):
+    return lambda value: lambda row: row[column] == value
+
+
+def _prefix(column, normalize=None):
+    def build(value):
+        value = normalize(value) if normalize else value
+        return lambda row: isinstance(row[column], str) and row[column].startswith(value)
+    return build
+
+
+def _port(value):
+    port = int(value)
+    # Comme device_ports : ports ouverts des seuls appareils présents
+    return lambda row: row['status'] == 'up' and any(
+        number == port for number, _ in normalize_ports(row['open_ports']))
+
+
+def _has_open_ports(value):
+    expected = value in ('1', 'true', 'yes')
+    return lambda row: (row['status'] == 'up' and bool(normalize_ports(row['open_ports']))) == expected
+
+
+# Équivalents en mémoire des filtres de listing.py (déjà validés par `parse`)
+MATCHERS = {
+    'wans': {
+        'status': _equals('status'),
+        'location': _equals('location'),
+        'hostname': _prefix('hostname'),
+        'ip': _prefix('ip'),
+    },
+    'devices': {
+        'wan_id': _equals('wan_id'),
+        'status': _equals('status'),
+        'hostname': _prefix('hostname'),
+        'ip': _prefix('ip'),
+        'mac': _prefix('device_key', str.lower),
+        'port': _port,
+        'has_open_ports': _has_open_ports,
+    },
+}
+
+
+def _sort_value(value):
+    # SQLite range NULL avant les chaînes ; la chaîne vide en tient lieu ici
+    return '' if value is None else value
+
+
+class _Ordered:
+    """Lignes triées par (colonne, clé) croissantes et leurs clés de tri, pour bisect"""
+
+    __slots__ = ('rows', 'keys')
+
+    def __init__(self, rows, column, key):
+        self.rows = sorted(rows, key=lambda row: (_sort_value(row[column]), row[key]))
+        self.keys = [(_sort_value(row[column]), row[key]) for row in self.rows]
+
+
+def page(target, matchers, ordered, query):
+    """Page d'une liste triée en mémoire, mêmes règles que `Listing.page`
+
+    Retourne (lignes, curseur de la page suivante ou None).
+    """
+    column = target.sorts[query.sort]
+    predicates = [matchers[name](value) for name, value in query.filters.items()]
+    keys, rows = ordered.keys, ordered.rows
+    start, step, stop = 0, 1, len(rows)
+    if query.descending:
+        start, step, stop = len(rows) - 1, -1, -1
+    if query.after is not None:
+        value, key = query.after
+        after = (_sort_value(key if column == target.key else value), key)
+        try:
+            # Première ligne strictement après (ou avant, en ordre décroissant) le curseur
+            start = bisect.bisect_left(keys, after) - 1 if query.descending else bisect.bisect_right(keys, after)
+        except TypeError:
+            raise InvalidQuery("Curseur invalide") from None
+
+    selected = []
+    for index in range(start, stop, step):
+        row = rows[index]
+        if all(predicate(row) for predicate in predicates):
+            selected.append(row)
+            if len(selected) > query.limit:
+                break
+    next_cursor = None
+    if len(selected) > query.limit:
+        selected = selected[:query.limit]
+        last = selected[-1]
+        sort = ('-' if query.descending else '') + query.sort
+        next_cursor = encode_cursor(sort, (last[column], last[target.key]))
+    # Les lignes de l'instantané gardent device_key (correctifs, filtre `mac`)
+    return [target.public(row) for row in selected], next_cursor
+
+
+class WanRecord:
+    """Ligne d'un WAN et tuple de ses appareils (`open_ports` décodé)
+
+    Les vues dérivées (tris, appareils présents) sont calculées à la première
+    lecture puis gardées : un enregistrement inchangé les transmet d'un
+    instantané au suivant.
+    """
+
+    __slots__ = ('wan', 'devices', '_views')
+
+    def __init__(self, wan, devices):
+        self.wan = wan
+        self.devices = devices
+        self._views = {}
+
+    def with_wan(self, wan):
+        """Nouvel enregistrement : nouvelle ligne de WAN, mêmes appareils"""
+        record = WanRecord(wan, self.devices)
+        record._views = self._views
+        return record
+
+    def with_devices(self, wan, keys, rows):
+        """Nouvel enregistrement où les appareils `keys` sont remplacés par `rows`
+
+        `rows` : lignes relues de ces appareils, par clé ; une clé sans ligne
+        est un appareil supprimé.
+        """
+        devices = [rows.get(device['device_key'], device) for device in self.devices
+                   if device['device_key'] not in keys or device['device_key'] in rows]
+        known = {device['device_key'] for device in self.devices}
+        devices.extend(row for key, row in rows.items() if key not in known)
+        return WanRecord(wan, tuple(devices))
+
+    def _view(self, name, build):
+        # Sans verrou : deux lectures simultanées calculent au pire deux fois la même vue
+        view = self._views.get(name)
+        if view is None:
+            view = self._views[name] = build()
+        return view
+
+    def ordered(self, sort):
+        column = listing.DEVICES.sorts[sort]
+        return self._view(sort, lambda: _Ordered(self.devices, column, listing.DEVICES.key))
+
+    @property
+    def devices_up(self):
+        """Appareils présents triés par IP (tableau de bord)"""
+        return self._view('up', lambda: [device for device in self.ordered('ip').rows
+                                         if device['status'] == 'up'])
+
+
+class Snapshot:
+    """État publié : WANs dans l'ordre d'enregistrement et numéro de l'instantané"""
+
+    __slots__ = ('records', 'version', '_views')
+
+    def __init__(self, records, version):
+        self.records = records
+        self.version = version
+        self._views = {}
+
+    def __contains__(self, client_id):
+        return client_id in self.records
+
+    def wan(self, client_id):
+        record = self.records.get(client_id)
+        return record.wan if record is not None else None
+
+    def wans_page(self, query):
+        ordered = self._views.get(query.sort)
+        if ordered is None:
+            column = listing.WANS.sorts[query.sort]
+            ordered = self._views[query.sort] = _Ordered(
+                [record.wan for record in self.records.values()], column, listing.WANS.key)
+        return page(listing.WANS, MATCHERS['wans'], ordered, query)
+
+    def devices_page(self, client_id, query):
+        """Page d'appareils d'un WAN ; None si le WAN n'existe pas"""
+        record = self.records.get(client_id)
+        if record is None:
+            return None
+        return page(listing.DEVICES, MATCHERS['devices'], record.ordered(query.sort), query)
+
+    def dashboard(self):
+        """WANs avec leurs appareils présents triés par IP (clé `devices`)"""
+        wans = self._views.get('dashboard')
+        if wans is None:
+            wans = [{**record.wan, 'devices': record.devices_up} for record in self.records.values()]
+            self._views['dashboard'] = wans
+        return wans
+
+    def counts(self):
+        return {
+            'wans': len(self.records),
+            'devices': sum(len(record.devices) for record in self.records.values()),
+        }
+
+
+def _device(row):
+    device = dict(row)
+    device['open_ports'] = decode_ports(device['open_ports'])
+    return device
+
+
+class ReadModel:
+    """Instantané courant (`current`) et construction des suivants
+
+    La lecture de `current` ne prend aucun verrou ; les constructions, elles,
+    sont sérialisées (rédacteur, chargement initial).
+    """
+
+    def __init__(self):
+        self.current = Snapshot({}, 0)
+        self._lock = threading.Lock()
+        self._builds = 0
+        self._rows_read = 0
+        self._build_seconds = 0.0
+
+    def _publish(self, records, started, rows_read):
+        snapshot = Snapshot(records, self.current.version + 1)
+        self.current = snapshot
+        self._builds += 1
+        self._rows_read += rows_read
+        self._build_seconds += time.perf_counter() - started
+        return snapshot
+
+    def load(self, db):
+        """Construit l'instantané complet depuis la base (démarrage)"""
+        started = time.perf_counter()
+        devices = {}
+        rows_read = 0
+        for row in db.execute(SQL_DEVICES):
+            devices.setdefault(row['wan_id'], []).append(_device(row))
+            rows_read += 1
+        records = {}
+        for row in db.execute(SQL_WANS):
+            records[row['client_id']] = WanRecord(dict(row), tuple(devices.get(row['client_id'], ())))
+            rows_read += 1
+        with self._lock:
+            return self._publish(records, started, rows_read)
+
+    def apply(self, db, wans=(), devices=(), device_keys=None, removed=()):
+        """Publie un instantané où `wans` (lignes) et `devices` (appareils) sont relus
+
+        `device_keys` ({WAN: clés}) : seuls ces appareils du WAN sont relus
+        (rapport différentiel), `devices` relisant toute sa liste.
+        À appeler par le rédacteur après le commit, avant toute autre
+        notification : une version lue ensuite ne précède jamais l'instantané.
+        """
+        wans, devices = set(wans), set(devices)
+        device_keys = {wan_id: keys for wan_id, keys in (device_keys or {}).items() if wan_id not in devices}
+        removed = set(removed)
+        if not (wans or devices or device_keys or removed):
+            return self.current
+        started = time.perf_counter()
+        rows_read = 0
+        with self._lock:
+            records = dict(self.current.records)
+            for client_id in removed:
+                records.pop(client_id, None)
+            # Un WAN supprimé puis réenregistré dans le même lot est relu : la base tranche
+            reload = sorted(wans | devices | device_keys.keys())
+            fresh = {}
+            for i in range(0, len(reload), 500):
+                chunk = reload[i:i + 500]
+                placeholders = ','.join('?' * len(chunk))
+                for row in db.execute(f'SELECT * FROM wans WHERE client_id IN ({placeholders})', chunk):
+                    fresh[row['client_id']] = dict(row)
+            rows_read += len(fresh)
+            for client_id in reload:
+                wan = fresh.get(client_id)
+                if wan is None:
+                    records.pop(client_id, None)
+                    continue
+                record = records.get(client_id)
+                if client_id in devices or record is None:
+                    rows = tuple(_device(row) for row in db.execute(SQL_WAN_DEVICES, (client_id,)))
+                    rows_read += len(rows)
+                    records[client_id] = WanRecord(wan, rows)
+                elif client_id in device_keys:
+                    keys = device_keys[client_id]
+                    rows = {row['device_key']: _device(row)
+                            for row in db.execute(SQL_WAN_DEVICE_KEYS, (client_id, json.dumps(sorted(keys))))}
+                    rows_read += len(rows)
+                    records[client_id] = record.with_devices(wan, keys, rows)
+                else:
+                    records[client_id] = record.with_wan(wan)
+            return self._publish(records, started, rows_read)
+
+    def stats(self):
+        snapshot = self.current
+        return {
+            **snapshot.counts(),
+            'version': snapshot.version,
+            'builds': self._builds,
+            'rows_read': self._rows_read,
+            'build_seconds': round(self._build_seconds, 3),
+        }
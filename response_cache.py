@@ -0,0 +1,54 @@
+"""
+Cache en mémoire des réponses JSON, indexé par version de changement
+"""
+import threading
+from collections import OrderedDict
+
+
+class ResponseCache:
+    """Corps de réponse sérialisés, avec éviction LRU bornée
+
+    Chaque entrée associe une clé (route et paramètres) à l'ETag de la
+    version servie et au corps JSON déjà encodé. Une entrée dont l'ETag ne
+    correspond plus à la version courante est simplement remplacée au
+    prochain calcul : aucune invalidation explicite n'est nécessaire.
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, key, etag):
+        """Retourne la valeur en cache pour cet ETag, ou None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != etag:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[1]
+
+    def put(self, key, etag, value):
+        with self._lock:
+            self._entries[key] = (etag, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'entries': len(self._entries),
+                'capacity': self.max_entries,
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'hit_ratio': round(self._hits / lookups, 3) if lookups else None,
+            }
@@ -8,13 +8,15 @@ import threading
 import requests
 from datetime import datetime
 from flask import Flask, jsonify, request
+from wire import ReportSender
 
 app = Flask(__name__)
 
 class NetworkMonitor:
-    def __init__(self, server_url, scan_interval=30):
+    def __init__(self, server_url, scan_interval=30, heartbeat_interval=5):
         self.server_url = server_url
         self.scan_interval = scan_interval
+        self.heartbeat_interval = heartbeat_interval
         self.client_id = str(uuid.uuid4())
         self.hostname = socket.gethostname()
         self.ip = self._get_ip()
@@ -22,6 +24,9 @@ class NetworkMonitor:
         self.location = os.getenv('LOCATION', 'Non spécifié')
         self.devices = []
         self.running = False
+        # Rapports compressés (ou binaires) dès que le serveur les accepte,
+        # retentés après Retry-After si le serveur est saturé
+        self.sender = ReportSender(requests.Session(), client_id=self.client_id)
 
     def _get_ip(self):
         """Récupère l'adresse IP du client"""
@@ -80,8 +85,8 @@ class NetworkMonitor:
             }
             print(f"Tentative d'enregistrement avec les données : {json.dumps(data, indent=2)}")
             
-            response = requests.post(f"{self.server_url}/api/register", json=data)
-            if response.status_code == 200:
+            response = self.sender.post(f"{self.server_url}/api/register", data)
+            if response.status_code in (200, 202):
                 print("Enregistrement réussi")
                 return True
             else:
@@ -99,15 +104,35 @@ class NetworkMonitor:
                 'wan_id': self.client_id,
                 'devices': self.devices
             }
-            response = requests.post(f"{self.server_url}/api/devices/update", json=data)
-            return response.status_code == 200
+            response = self.sender.post(f"{self.server_url}/api/devices/update", data)
+            return response.status_code in (200, 202)
         except Exception as e:
             print(f"Erreur lors de la mise à jour des appareils: {str(e)}")
             return False
 
+    def send_heartbeat(self):
+        """Signale au serveur que ce client est toujours actif"""
+        try:
+            response = requests.post(f"{self.server_url}/api/heartbeat",
+                                     json={'client_id': self.client_id}, timeout=5)
+            if response.status_code == 404:
+                # Le serveur ne connaît plus ce client : ré-enregistrement
+                return self.register()
+            return response.status_code == 200
+        except Exception as e:
+            print(f"Erreur lors de l'envoi du battement de cœur: {str(e)}")
+            return False
+
+    def heartbeat_loop(self):
+        """Envoie des battements de cœur tant que le monitoring est actif"""
+        while self.running:
+            self.send_heartbeat()
+            time.sleep(self.heartbeat_interval)
+
     def start_monitoring(self):
         """Démarre le monitoring"""
         self.running = True
+        threading.Thread(target=self.heartbeat_loop, daemon=True).start()
         while self.running:
             self.scan_network()
             self.update_devices()
@@ -131,10 +156,15 @@ if __name__ == '__main__':
     # Création du moniteur réseau
     monitor = NetworkMonitor(server_url)
     
-    # Enregistrement auprès du serveur
-    if not monitor.register():
-        print("Erreur lors de l'enregistrement auprès du serveur")
-        exit(1)
+    # Enregistrement auprès du serveur (attente croissante et aléatoire entre
+    # les tentatives : au redémarrage du serveur, les clients ne reviennent
+    # pas tous ensemble)
+    attempt = 0
+    while not monitor.register():
+        delay = monitor.sender.backoff.delay(attempt)
+        print(f"Erreur lors de l'enregistrement auprès du serveur, nouvelle tentative dans {delay:.0f}s")
+        time.sleep(delay)
+        attempt += 1
     
     # Démarrage du thread de monitoring
     monitor_thread = threading.Thread(target=monitor.start_monitoring)
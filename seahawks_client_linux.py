@@ -6,7 +6,9 @@ import time
 import socket
 import nmap
 import argparse
+import threading
 import requests
+from wire import ReportSender
 from datetime import datetime
 
 class SeahawksClient:
@@ -14,6 +16,9 @@ class SeahawksClient:
         self.server_url = server_url
         self.client_id = self.get_or_create_client_id()
         self.nm = nmap.PortScanner()
+        # Rapports compressés (ou binaires) dès que le serveur les accepte,
+        # retentés après Retry-After si le serveur est saturé
+        self.sender = ReportSender(requests.Session(), client_id=self.client_id)
         
     def get_or_create_client_id(self):
         """Récupère ou crée un ID unique pour ce client"""
@@ -91,17 +96,41 @@ class SeahawksClient:
         
         print(f"Tentative d'enregistrement avec les données : {json.dumps(data, indent=2)}")
         try:
-            response = requests.post(f"{self.server_url}/api/register", json=data)
+            response = self.sender.post(f"{self.server_url}/api/register", data)
             print(f"Code de réponse : {response.status_code}")
             print(f"Contenu de la réponse : {json.dumps(response.json(), indent=2)}\n")
             
-            if response.status_code == 200:
+            if response.status_code in (200, 202):
                 print("Enregistrement réussi")
                 return True
         except Exception as e:
             print(f"Erreur lors de l'enregistrement : {str(e)}")
         return False
     
+    def send_heartbeat(self):
+        """Signale au serveur que ce client est toujours actif
+
+        Retourne None si le serveur ne connaît pas ce client (il faut alors
+        se ré-enregistrer).
+        """
+        try:
+            response = requests.post(f"{self.server_url}/api/heartbeat",
+                                     json={'client_id': self.client_id}, timeout=5)
+            if response.status_code == 404:
+                return None
+            return response.status_code == 200
+        except Exception as e:
+            print(f"Erreur lors de l'envoi du battement de cœur : {str(e)}")
+            return False
+    
+    def heartbeat_loop(self, name, location, interval):
+        """Envoie un battement de cœur toutes les `interval` secondes"""
+        while True:
+            if self.send_heartbeat() is None:
+                print("Client inconnu du serveur, ré-enregistrement...")
+                self.register_with_server(name, location)
+            time.sleep(interval)
+    
     def send_devices(self, devices):
         """Envoie la liste des appareils au serveur"""
         if not devices:
@@ -113,9 +142,9 @@ class SeahawksClient:
                 'wan_id': self.client_id,
                 'devices': devices
             }
-            response = requests.post(f"{self.server_url}/api/devices/update", json=data)
+            response = self.sender.post(f"{self.server_url}/api/devices/update", data)
             
-            if response.status_code == 200:
+            if response.status_code in (200, 202):
                 print("Appareils mis à jour avec succès")
                 return True
             else:
@@ -124,27 +153,36 @@ class SeahawksClient:
             print(f"Erreur lors de l'envoi des appareils : {str(e)}")
         return False
     
-    def start_monitoring(self, name, location, update_interval=60):
+    def start_monitoring(self, name, location, update_interval=60, heartbeat_interval=5):
         """Démarre le monitoring en continu"""
-        if self.register_with_server(name, location):
-            print(f"Client enregistre avec succes. ID: {self.client_id}")
-            while True:
-                try:
-                    # Re-enregistrement périodique pour maintenir le statut "online"
-                    self.register_with_server(name, location)
-                    
-                    # Scan et envoi des appareils
-                    devices = self.scan_network()
-                    self.send_devices(devices)
-                    
-                    print("\n")  # Ligne vide pour la lisibilité
-                    time.sleep(update_interval)
-                except KeyboardInterrupt:
-                    print("\nArrêt du monitoring...")
-                    break
-                except Exception as e:
-                    print(f"Erreur lors du monitoring : {str(e)}")
-                    time.sleep(update_interval)
+        attempt = 0
+        while not self.register_with_server(name, location):
+            delay = self.sender.backoff.delay(attempt)
+            print(f"Enregistrement impossible, nouvelle tentative dans {delay:.0f}s")
+            time.sleep(delay)
+            attempt += 1
+        print(f"Client enregistre avec succes. ID: {self.client_id}")
+        
+        # Battements de cœur légers pour maintenir le statut "online"
+        heartbeat_thread = threading.Thread(
+            target=self.heartbeat_loop, args=(name, location, heartbeat_interval), daemon=True
+        )
+        heartbeat_thread.start()
+        
+        while True:
+            try:
+                # Scan et envoi des appareils
+                devices = self.scan_network()
+                self.send_devices(devices)
+                
+                print("\n")  # Ligne vide pour la lisibilité
+                time.sleep(update_interval)
+            except KeyboardInterrupt:
+                print("\nArrêt du monitoring...")
+                break
+            except Exception as e:
+                print(f"Erreur lors du monitoring : {str(e)}")
+                time.sleep(update_interval)
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Seahawks Network Monitor Client')
@@ -152,8 +190,10 @@ if __name__ == '__main__':
     parser.add_argument('--name', required=True, help='Nom du WAN')
     parser.add_argument('--location', required=True, help='Localisation du WAN')
     parser.add_argument('--interval', type=int, default=60, help='Intervalle de mise à jour en secondes')
+    parser.add_argument('--heartbeat-interval', type=int, default=5,
+                        help='Intervalle des battements de cœur en secondes')
     
     args = parser.parse_args()
     
     client = SeahawksClient(args.server)
-    client.start_monitoring(args.name, args.location, args.interval)
+    client.start_monitoring(args.name, args.location, args.interval, args.heartbeat_interval)
@@ -0,0 +1,229 @@
+"""
+Recherche d'appareils dans toute la flotte (MAC, IP, réseau CIDR, nom d'hôte, fabricant)
+
+Chaque forme de requête est résolue par un index :
+- MAC (préfixe) : index sur `device_key`, qui est la MAC en minuscules ;
+- IP exacte ou préfixe (`10.1.`) : index sur `ip` ;
+- réseau CIDR (`10.1.0.0/16`) : intervalle sur `ip_num`, l'adresse IPv4 en entier ;
+- nom d'hôte (`printer*`) et sous-chaîne : table FTS5 à trigrammes sur le
+  nom d'hôte, le fabricant, la MAC et l'IP, tenue à jour par l'ingestion
+  pour les seuls appareils nouveaux ou modifiés.
+"""
+import ipaddress
+import logging
+import re
+import sqlite3
+
+from listing import InvalidQuery, prefix_range
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = 'devices_fts'
+# Le tokenizer trigram n'indexe pas les motifs plus courts
+MIN_SUBSTRING = 3
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+KINDS = ('auto', 'mac', 'ip', 'cidr', 'hostname', 'text')
+
+SELECT_MATCHES = '''
+    SELECT d.id, d.wan_id, w.name AS wan_name, w.location AS wan_location,
+           d.mac, d.ip, d.hostname, d.vendor, d.open_ports, d.status, d.last_seen
+    FROM devices d LEFT JOIN wans w ON w.client_id = d.wan_id
+'''
+
+_MAC = re.compile(r'^[0-9a-f]{1,2}([:.-]?[0-9a-f]{1,4})*[:.-]?$', re.IGNORECASE)
+_IP_PREFIX = re.compile(r'^\d{1,3}(\.\d{0,3}){0,3}$')
+_MAC_SEPARATORS = re.compile(r'[:.-]')
+
+
+# Entrées de l'index, écrites par l'ingestion (device_ingest.py) en une
+# instruction par rapport et par rowid croissant : FTS5 vide son tampon
+# dès qu'un rowid n'est pas croissant, si bien que des triggers ligne à
+# ligne coûteraient plusieurs fois le prix du rapport lui-même
+INDEXED_FIELDS = ('hostname', 'vendor', 'device_key', 'ip')
+INDEX_DEVICES = f'''
+    INSERT INTO {FTS_TABLE} (rowid, hostname, vendor, device_key, ip)
+    SELECT id, hostname, vendor, device_key, ip FROM devices
+    WHERE wan_id = ? AND device_key IN (SELECT value FROM json_each(?))
+    ORDER BY id
+'''
+# Une suppression doit fournir les valeurs indexées à l'identique :
+# [[id, hostname, vendor, device_key, ip], ...]
+UNINDEX_DEVICES = f'''
+    INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, hostname, vendor, device_key, ip)
+    SELECT 'delete', json_extract(value, '$[0]') AS id, json_extract(value, '$[1]'),
+           json_extract(value, '$[2]'), json_extract(value, '$[3]'), json_extract(value, '$[4]')
+    FROM json_each(?) ORDER BY id
+'''
+
+
+def create_index(db):
+    """Table FTS5 à trigrammes sur les appareils (migration)
+
+    Table à contenu externe : les insertions et modifications sont reportées
+    par `apply_device_report`, les suppressions (rares : WAN supprimé,
+    rétention) par un trigger. Sans le tokenizer trigram (SQLite < 3.34),
+    la table n'est pas créée et les recherches par sous-chaîne parcourent
+    la table des appareils.
+    """
+    try:
+        db.execute(f'''
+            CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+                hostname, vendor, device_key, ip,
+                content='devices', content_rowid='id', tokenize='trigram'
+            )
+        ''')
+    except sqlite3.OperationalError as e:
+        logger.warning(f"Index plein texte indisponible ({e}) : recherche par parcours de table")
+        return
+    db.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS devices_fts_delete AFTER DELETE ON devices BEGIN
+            INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, hostname, vendor, device_key, ip)
+            VALUES ('delete', old.id, old.hostname, old.vendor, old.device_key, old.ip);
+        END
+    ''')
+    db.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def has_index(db):
+    return db.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (FTS_TABLE,)
+    ).fetchone() is not None
+
+
+def normalize_mac(value):
+    """MAC (complète ou début) au format de `device_key` : aa:bb:cc..."""
+    digits = _MAC_SEPARATORS.sub('', value).lower()
+    return ':'.join(digits[i:i + 2] for i in range(0, len(digits), 2))
+
+
+def _escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _phrase(value):
+    """Phrase FTS5 littérale (les guillemets sont doublés)"""
+    return '"' + value.replace('"', '""') + '"'
+
+
+def detect(q):
+    """Devine la forme d'une requête `auto`"""
+    if '/' in q:
+        return 'cidr'
+    if _IP_PREFIX.match(q):
+        return 'ip'
+    try:
+        ipaddress.ip_address(q)
+        return 'ip'
+    except ValueError:
+        pass
+    digits = _MAC_SEPARATORS.sub('', q)
+    # Séparateurs ou 12 chiffres hexadécimaux : « cafe » reste un nom d'hôte
+    if _MAC.match(q) and (len(digits) == 12 or (digits != q and len(digits) >= 4)):
+        return 'mac'
+    if q.endswith('*'):
+        return 'hostname'
+    return 'text'
+
+
+class SearchQuery:
+    """Recherche validée : (forme, clause SQL, paramètres), `key` pour le cache"""
+
+    __slots__ = ('q', 'kind', 'clause', 'params', 'limit', 'key')
+
+    def __init__(self, q, kind, clause, params, limit):
+        self.q = q
+        self.kind = kind
+        self.clause = clause
+        self.params = params
+        self.limit = limit
+        self.key = (kind, clause, tuple(params), limit)
+
+
+def parse(args, fts=True):
+    """Valide `q`, `type`, `status`, `wan_id` et `limit` ; `fts` : index FTS5 disponible"""
+    q = (args.get('q') or '').strip()
+    if not q:
+        raise InvalidQuery("Paramètre q manquant")
+    kind = args.get('type') or 'auto'
+    if kind not in KINDS:
+        raise InvalidQuery(f"Type de recherche invalide : {kind} (possibles : {', '.join(KINDS)})")
+    if kind == 'auto':
+        kind = detect(q)
+
+    if kind == 'cidr':
+        try:
+            network = ipaddress.ip_network(q, strict=False)
+        except ValueError:
+            raise InvalidQuery(f"Réseau invalide : {q}") from None
+        if network.version != 4:
+            raise InvalidQuery("Seuls les réseaux IPv4 sont indexés")
+        clause, params = 'd.ip_num BETWEEN ? AND ?', (
+            int(network.network_address), int(network.broadcast_address))
+    elif kind == 'ip':
+        try:
+            ipaddress.ip_address(q)
+            clause, params = 'd.ip = ?', (q,)
+        except ValueError:
+            clause, params = prefix_range('d.ip', q)
+    elif kind == 'mac':
+        mac = normalize_mac(q)
+        if not mac:
+            raise InvalidQuery(f"MAC invalide : {q}")
+        clause, params = prefix_range('d.device_key', mac)
+    elif kind == 'hostname':
+        prefix = q.rstrip('*')
+        if not prefix:
+            raise InvalidQuery("Préfixe de nom d'hôte vide")
+        clause, params = "d.hostname LIKE ? ESCAPE '\\'", (_escape_like(prefix) + '%',)
+        if fts and len(prefix) >= MIN_SUBSTRING:
+            # L'index réduit les candidats, LIKE garde ceux qui commencent par le préfixe
+            clause = f'd.id IN (SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH ?) AND ' + clause
+            params = ('hostname : ' + _phrase(prefix),) + params
+    else:
+        if fts and len(q) >= MIN_SUBSTRING:
+            clause, params = f'd.id IN (SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH ?)', (_phrase(q),)
+        else:
+            pattern = '%' + _escape_like(q) + '%'
+            clause = ' OR '.join(f"d.{column} LIKE ? ESCAPE '\\'"
+                                 for column in ('hostname', 'vendor', 'device_key', 'ip'))
+            clause, params = f'({clause})', (pattern,) * 4
+
+    status = args.get('status')
+    if status:
+        if status not in ('up', 'gone'):
+            raise InvalidQuery(f"Valeur invalide pour status : {status}")
+        clause += ' AND d.status = ?'
+        params += (status,)
+    wan_id = args.get('wan_id')
+    if wan_id:
+        clause += ' AND d.wan_id = ?'
+        params += (wan_id,)
+
+    try:
+        limit = int(args.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise InvalidQuery("limit doit être un entier") from None
+    return SearchQuery(q, kind, clause, params, min(max(limit, 1), MAX_LIMIT))
+
+
+def sql(query):
+    """(sql, paramètres) ; une ligne de plus que la limite signale un résultat tronqué"""
+    return f'{SELECT_MATCHES} WHERE {query.clause} LIMIT {query.limit + 1}', query.params
+
+
+def run(db, query):
+    """Retourne (appareils triés par WAN puis IP, tronqué ?)"""
+    statement, params = sql(query)
+    rows = [dict(row) for row in db.execute(statement, params)]
+    truncated = len(rows) > query.limit
+    rows = rows[:query.limit]
+    rows.sort(key=lambda row: (row['wan_name'] or '', row['wan_id'], _ip_sort_key(row['ip'])))
+    return rows, truncated
+
+
+def _ip_sort_key(ip):
+    try:
+        return (0, int(ipaddress.ip_address(ip)))
+    except ValueError:
+        return (1, ip or '')
@@ -0,0 +1,537 @@
+"""
+Point d'entrée de production du serveur central (pool de threads)
+
+    python server.py [--threads 32] [--backlog 128] [--keepalive 5]
+    python server.py --supervise      # rechargement sans coupure : kill -HUP <pid>
+
+Un seul processus sert toutes les requêtes avec un pool de threads borné.
+L'état partagé du serveur (versions de changement, registre des WANs,
+échéances de présence, cache des réponses, file d'écriture, abonnés SSE)
+vit en mémoire : plusieurs processus auraient chacun le leur et
+divergeraient. SQLite n'accepte de toute façon qu'un rédacteur à la fois ;
+les lectures, elles, s'exécutent en parallèle dans le pool de connexions
+(le module sqlite3 libère le GIL pendant les requêtes).
+
+Avec `--supervise` (POSIX), un superviseur ouvre le socket d'écoute une fois
+pour toutes et le transmet au processus serveur. SIGHUP recharge sans
+coupure : un nouveau processus hérite du même socket, ne signale qu'il est
+prêt qu'après son contrôle de santé (`/api/health`), puis l'ancien cesse
+d'accepter des connexions et termine ses requêtes en cours (au plus
+SERVER_DRAIN_TIMEOUT secondes) avant de s'arrêter. Le port ne se ferme
+jamais : les connexions arrivées entre-temps attendent dans la file du
+socket. Si le nouveau processus échoue, l'ancien continue de servir.
+Le nouveau processus ne démarre ses tâches de fond (présence, agrégats,
+maintenance, mises à jour) qu'une fois l'ancien arrêté, sur SIGUSR1 du
+superviseur : elles ne tournent jamais dans deux processus à la fois.
+L'adresse, le port et la file du socket ne changent qu'en relançant le
+superviseur.
+"""
+import argparse
+import logging
+import os
+import select
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.exceptions import InternalServerError
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler, get_sockaddr, select_address_family
+from werkzeug.wsgi import LimitedStream
+
+logger = logging.getLogger(__name__)
+
+# Attente avant de relancer un processus serveur arrêté de lui-même
+RESPAWN_DELAY = 5.0
+# Délai accordé en plus du drainage à un ancien processus (vidage de la file d'écriture)
+RETIRE_MARGIN = 30.0
+
+
+class KeepAliveRequestHandler(WSGIRequestHandler):
+    """Gestionnaire HTTP/1.1 avec connexions persistantes
+
+    Le gestionnaire de werkzeug ferme chaque connexion après une réponse et
+    lit tout ce qui reste sur le socket (ce qui avalerait la requête
+    suivante). Ici, la connexion reste ouverte si le client l'accepte et
+    que le corps de la requête a une longueur connue : seul le reste non lu
+    de ce corps est consommé avant la requête suivante. `timeout` (défini
+    par le serveur) borne l'attente de cette requête.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def make_environ(self):
+        environ = super().make_environ()
+        self._body = None
+        if environ.get('wsgi.input_terminated'):
+            # Corps découpé (chunked) : on ne garde pas la connexion
+            self.close_connection = True
+        else:
+            self._body = LimitedStream(self.rfile, int(environ.get('CONTENT_LENGTH') or 0))
+            environ['wsgi.input'] = self._body
+        return environ
+
+    def run_wsgi(self):
+        if self.server.draining:
+            # Arrêt en cours : dernière requête de cette connexion, le client
+            # ouvre la suivante sur le nouveau processus
+            self.close_connection = True
+        if self.headers.get('Expect', '').lower().strip(' \t') == '100-continue':
+            self.wfile.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+
+        self.environ = environ = self.make_environ()
+        status_set = headers_set = status_sent = None
+        chunked = False
+
+        def write(data):
+            nonlocal status_sent, chunked
+            if status_sent is None:
+                status_sent = status_set
+                code, _, message = status_sent.partition(' ')
+                code = int(code)
+                self.send_response(code, message)
+                keys = set()
+                for key, value in headers_set:
+                    self.send_header(key, value)
+                    keys.add(key.lower())
+                if not ('content-length' in keys or environ['REQUEST_METHOD'] == 'HEAD'
+                        or 100 <= code < 200 or code in (204, 304)):
+                    chunked = True
+                    self.send_header('Transfer-Encoding', 'chunked')
+                if self.close_connection:
+                    self.send_header('Connection', 'close')
+                self.end_headers()
+            if data:
+                if chunked:
+                    self.wfile.write(f'{len(data):x}\r\n'.encode('ascii') + data + b'\r\n')
+                else:
+                    self.wfile.write(data)
+            self.wfile.flush()
+
+        def start_response(status, headers, exc_info=None):
+            nonlocal status_set, headers_set
+            if exc_info:
+                try:
+                    if status_sent is not None:
+                        raise exc_info[1].with_traceback(exc_info[2])
+                finally:
+                    exc_info = None
+            status_set, headers_set = status, headers
+            return write
+
+        def execute(app):
+            application_iter = app(environ, start_response)
+            try:
+                for data in application_iter:
+                    write(data)
+                if status_sent is None:
+                    write(b'')
+                if chunked:
+                    self.wfile.write(b'0\r\n\r\n')
+            finally:
+                if hasattr(application_iter, 'close'):
+                    application_iter.close()
+
+        try:
+            execute(self.server.app)
+        except (ConnectionError, socket.timeout) as e:
+            self.close_connection = True
+            self.connection_dropped(e, environ)
+        except Exception:
+            self.close_connection = True
+            logger.exception(f"Erreur lors de la requête {self.command} {self.path}")
+            if status_sent is None:
+                status_set = headers_set = None
+                try:
+                    execute(InternalServerError())
+                except Exception:
+                    pass
+
+        if self._body is not None and not self.close_connection:
+            # Reste du corps non lu par l'application : ne pas le prendre
+            # pour le début de la requête suivante
+            self._body.exhaust()
+
+    def log_error(self, format, *args):
+        # Connexion persistante restée inactive au-delà de `timeout` : fin
+        # normale, pas une erreur
+        if format.startswith('Request timed out'):
+            self.log('debug', format, *args)
+        else:
+            super().log_error(format, *args)
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """Serveur WSGI dont les connexions sont traitées par un pool de threads borné
+
+    Contrairement au serveur de développement (un thread par connexion, sans
+    limite), les connexions au-delà de `threads` attendent dans la file du
+    pool, puis dans la file d'attente du socket (`backlog`).
+    Chaque flux SSE ouvert occupe un thread : dimensionner `threads` en
+    conséquence.
+
+    `fd` : socket d'écoute hérité du superviseur, partagé avec un autre
+    processus serveur pendant un rechargement.
+    """
+
+    multithread = True
+    daemon_threads = True
+    # Arrêt en cours : les réponses ferment leur connexion (voir `drain`)
+    draining = False
+
+    def __init__(self, host, port, app, threads=32, backlog=128, keepalive=5.0, fd=None):
+        # Lu par server_activate() lors de l'initialisation
+        self.request_queue_size = backlog
+        handler = type('RequestHandler', (KeepAliveRequestHandler,), {'timeout': keepalive})
+        super().__init__(host, port, app, handler=handler, fd=fd)
+        if fd is not None:
+            # fromfd() a dupliqué le descripteur hérité
+            os.close(fd)
+            # Socket partagé : un autre processus peut prendre la connexion
+            # annoncée par select() ; accept() ne doit pas bloquer pour autant
+            self.socket.setblocking(False)
+        self.threads = threads
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='http')
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._active = 0
+
+    def process_request(self, request, client_address):
+        with self._lock:
+            self._queued += 1
+        self._executor.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        with self._lock:
+            self._queued -= 1
+            self._active += 1
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            with self._lock:
+                self._active -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'threads': self.threads,
+                'active': self._active,
+                'queued': self._queued,
+                'backlog': self.request_queue_size,
+                'keepalive': self.RequestHandlerClass.timeout,
+            }
+
+    def drain(self, timeout):
+        """Attend la fin des connexions en cours ; retourne le nombre restant après `timeout`
+
+        Une connexion persistante inactive se termine au plus tard après
+        `keepalive` secondes, ou après sa prochaine requête.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                remaining = self._active + self._queued
+            if not remaining or time.monotonic() >= deadline:
+                return remaining
+            time.sleep(0.1)
+
+    def server_close(self):
+        super().server_close()
+        executor = getattr(self, '_executor', None)
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+
+def serve(seahawks=None, host=None, port=None, threads=None, backlog=None, keepalive=None,
+          fd=None, ready_fd=None, drain_timeout=None, handoff=False):
+    """Initialise l'application, démarre les tâches de fond et sert les requêtes
+
+    `seahawks` : module de l'application (importé si absent ; `python app.py`
+    passe son propre module pour ne pas le charger une seconde fois).
+    `fd` et `ready_fd` : socket d'écoute hérité du superviseur et tube où
+    annoncer que le processus est prêt (contrôle de santé réussi).
+    `handoff` : un autre processus sert encore ; les tâches de fond
+    attendent SIGUSR1 (voir `take_over`).
+    """
+    if seahawks is None:
+        import app as seahawks
+    if drain_timeout is None:
+        drain_timeout = seahawks.SERVER_DRAIN_TIMEOUT
+
+    seahawks.init_db()
+    seahawks.start_background_services(defer_loops=handoff)
+
+    server = PooledWSGIServer(
+        host or seahawks.SERVER_HOST,
+        port or seahawks.SERVER_PORT,
+        seahawks.app,
+        threads=threads or seahawks.SERVER_THREADS,
+        backlog=backlog or seahawks.SERVER_BACKLOG,
+        keepalive=keepalive or seahawks.SERVER_KEEPALIVE,
+        fd=fd,
+    )
+    seahawks.http_server = server
+
+    def shutdown():
+        seahawks.prepare_shutdown()
+        server.shutdown()
+
+    def stop(signum, frame):
+        logger.info(f"Signal {signum} reçu, arrêt du serveur...")
+        server.draining = True
+        # shutdown() attend la fin de serve_forever : depuis un autre thread
+        threading.Thread(target=shutdown, daemon=True).start()
+
+    def take_over(signum, frame):
+        # Envoyé par le superviseur une fois l'ancien processus arrêté
+        threading.Thread(target=seahawks.take_over, name='take-over', daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    if ready_fd is not None:
+        signal.signal(signal.SIGUSR1, take_over)
+        response = seahawks.app.test_client().get('/api/health')
+        if response.status_code != 200:
+            logger.error(f"Contrôle de santé en échec : {response.get_data(as_text=True)}")
+            server.server_close()
+            seahawks.stop_background_services()
+            sys.exit(1)
+        with os.fdopen(ready_fd, 'wb') as ready:
+            ready.write(b'ready\n')
+
+    logger.info(
+        f"Serveur Seahawks {seahawks.VERSION} sur {server.host}:{server.port} "
+        f"({server.threads} threads, backlog {server.request_queue_size}, "
+        f"keep-alive {server.RequestHandlerClass.timeout}s, pid {os.getpid()})"
+    )
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        remaining = server.drain(drain_timeout)
+        seahawks.stop_background_services()
+        if remaining:
+            logger.warning(f"{remaining} connexion(s) encore ouverte(s) après {drain_timeout}s, abandonnée(s)")
+        logger.info("Serveur arrêté")
+    if remaining:
+        # Les threads du pool bloqueraient la sortie de l'interpréteur
+        logging.shutdown()
+        os._exit(0)
+
+
+class Supervisor:
+    """Détient le socket d'écoute et remplace le processus serveur sans coupure
+
+    SIGHUP : rechargement ; SIGTERM/SIGINT : arrêt (le processus serveur
+    termine ses requêtes en cours). Un processus serveur arrêté de lui-même
+    est relancé après RESPAWN_DELAY secondes.
+    """
+
+    def __init__(self, host, port, backlog, options=(), drain_timeout=30.0, ready_timeout=60.0, environ=None):
+        self.options = list(options)
+        self.drain_timeout = drain_timeout
+        self.ready_timeout = ready_timeout
+        self.environ = dict(environ if environ is not None else os.environ)
+        self.environ['SEAHAWKS_SUPERVISOR_PID'] = str(os.getpid())
+        family = select_address_family(host, port)
+        self.socket = socket.socket(family, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind(get_sockaddr(host, port, family))
+        self.socket.listen(backlog)
+        self.address = self.socket.getsockname()
+        self.worker = None
+        # Anciens processus en cours d'arrêt : {processus: échéance}
+        self._retiring = {}
+        # Processus serveur dont les tâches de fond attendent l'arrêt des anciens
+        self._handoff = None
+        self._reload = False
+        self._stopping = False
+
+    def _spawn(self, handoff):
+        """Lance un processus serveur sur le socket ; retourne (processus, lecture du tube)"""
+        read_fd, write_fd = os.pipe()
+        try:
+            process = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), '--fd', str(self.socket.fileno()),
+                 '--ready-fd', str(write_fd), '--drain-timeout', str(self.drain_timeout),
+                 *(['--handoff'] if handoff else []), *self.options],
+                pass_fds=(self.socket.fileno(), write_fd),
+                env=self.environ,
+            )
+        except BaseException:
+            os.close(read_fd)
+            raise
+        finally:
+            os.close(write_fd)
+        return process, read_fd
+
+    def _wait_ready(self, read_fd):
+        """Attend « ready » sur le tube (fin de fichier : le processus s'est arrêté)"""
+        deadline = time.monotonic() + self.ready_timeout
+        data = b''
+        try:
+            while not data.endswith(b'\n'):
+                timeout = deadline - time.monotonic()
+                if timeout <= 0 or not select.select([read_fd], [], [], timeout)[0]:
+                    return False
+                chunk = os.read(read_fd, 64)
+                if not chunk:
+                    return False
+                data += chunk
+            return data.strip() == b'ready'
+        finally:
+            os.close(read_fd)
+
+    def start_worker(self, handoff=False):
+        """Lance un processus serveur et attend qu'il soit prêt ; None en cas d'échec
+
+        `handoff` : l'ancien processus sert encore, le nouveau diffère ses
+        tâches de fond jusqu'à SIGUSR1.
+        """
+        process, read_fd = self._spawn(handoff)
+        logger.info(f"Processus serveur {process.pid} lancé, attente du contrôle de santé...")
+        if self._wait_ready(read_fd):
+            logger.info(f"Processus serveur {process.pid} prêt")
+            return process
+        logger.error(f"Processus serveur {process.pid} non prêt après {self.ready_timeout}s ou arrêté")
+        process.kill()
+        process.wait()
+        return None
+
+    def _retire(self, process):
+        """Demande à un processus de terminer ses requêtes et de s'arrêter"""
+        process.send_signal(signal.SIGTERM)
+        self._retiring[process] = time.monotonic() + self.drain_timeout + RETIRE_MARGIN
+
+    def _reap(self):
+        """Surveille les processus en cours d'arrêt ; retourne vrai si l'un d'eux s'est terminé"""
+        reaped = False
+        for process, deadline in list(self._retiring.items()):
+            if process.poll() is None and time.monotonic() < deadline:
+                continue
+            if process.returncode is None:
+                logger.warning(f"Processus serveur {process.pid} toujours actif après le drainage, SIGKILL")
+                process.kill()
+                process.wait()
+            logger.info(f"Ancien processus serveur {process.pid} arrêté (code {process.returncode})")
+            del self._retiring[process]
+            reaped = True
+        return reaped
+
+    def reload(self):
+        """Remplace le processus serveur ; l'ancien reste en place si le nouveau échoue"""
+        logger.info("Rechargement du serveur...")
+        worker = self.start_worker(handoff=True)
+        if worker is None:
+            logger.error("Rechargement abandonné : l'ancien processus continue de servir")
+            return False
+        old, self.worker = self.worker, worker
+        self._handoff = worker
+        if old is not None and old.poll() is None:
+            self._retire(old)
+        return True
+
+    def _signal(self, signum, frame):
+        if signum == signal.SIGHUP:
+            self._reload = True
+        else:
+            self._stopping = True
+
+    def run(self):
+        for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, self._signal)
+        logger.info(f"Superviseur {os.getpid()} à l'écoute sur {self.address[0]}:{self.address[1]}")
+        self.worker = self.start_worker()
+        if self.worker is None:
+            return 1
+        while not self._stopping:
+            if self._reload:
+                self._reload = False
+                self.reload()
+            elif self.worker is None or self.worker.poll() is not None:
+                if self.worker is not None:
+                    logger.error(f"Processus serveur {self.worker.pid} arrêté (code {self.worker.returncode}), "
+                                 f"relance dans {RESPAWN_DELAY}s")
+                    self.worker = None
+                time.sleep(RESPAWN_DELAY)
+                if not self._stopping:
+                    self.worker = self.start_worker()
+            self._reap()
+            if self._handoff is not None and not self._retiring:
+                # Plus d'autre processus : relecture de l'état, puis tâches de fond
+                if self._handoff is self.worker and self.worker.poll() is None:
+                    self.worker.send_signal(signal.SIGUSR1)
+                self._handoff = None
+            time.sleep(0.2)
+
+        logger.info("Arrêt du superviseur...")
+        if self.worker is not None and self.worker.poll() is None:
+            self._retire(self.worker)
+        while self._retiring:
+            self._reap()
+            time.sleep(0.2)
+        self.socket.close()
+        logger.info("Superviseur arrêté")
+        return 0
+
+
+def supervise(host=None, port=None, backlog=None, options=(), drain_timeout=None, ready_timeout=None):
+    """Lance le superviseur (configuration et journalisation de l'application)"""
+    # Environnement des processus serveur : sans les valeurs de .env chargées
+    # ici, qu'un rechargement doit relire
+    environ = dict(os.environ)
+    import app as seahawks
+
+    supervisor = Supervisor(
+        host or seahawks.SERVER_HOST,
+        port or seahawks.SERVER_PORT,
+        backlog or seahawks.SERVER_BACKLOG,
+        options=options,
+        drain_timeout=drain_timeout if drain_timeout is not None else seahawks.SERVER_DRAIN_TIMEOUT,
+        ready_timeout=ready_timeout if ready_timeout is not None else seahawks.SERVER_READY_TIMEOUT,
+        environ=environ,
+    )
+    return supervisor.run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serveur central Seahawks')
+    parser.add_argument('--host', help='Adresse d\'écoute (SERVER_HOST)')
+    parser.add_argument('--port', type=int, help='Port d\'écoute (SERVER_PORT)')
+    parser.add_argument('--threads', type=int, help='Taille du pool de threads (SERVER_THREADS)')
+    parser.add_argument('--backlog', type=int, help='File d\'attente du socket (SERVER_BACKLOG)')
+    parser.add_argument('--keepalive', type=float,
+                        help='Délai d\'inactivité des connexions persistantes en secondes (SERVER_KEEPALIVE)')
+    parser.add_argument('--supervise', action='store_true',
+                        help='Superviseur : rechargement sans coupure sur SIGHUP (POSIX)')
+    parser.add_argument('--drain-timeout', type=float,
+                        help='Délai accordé aux requêtes en cours à l\'arrêt, en secondes (SERVER_DRAIN_TIMEOUT)')
+    parser.add_argument('--ready-timeout', type=float,
+                        help='Délai de démarrage d\'un nouveau processus, en secondes (SERVER_READY_TIMEOUT)')
+    # Transmis par le superviseur à ses processus serveur
+    parser.add_argument('--fd', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--ready-fd', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--handoff', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.supervise:
+        # Options reprises par chaque processus serveur
+        options = []
+        for name in ('host', 'port', 'threads', 'keepalive'):
+            value = getattr(args, name)
+            if value is not None:
+                options += [f'--{name}', str(value)]
+        sys.exit(supervise(host=args.host, port=args.port, backlog=args.backlog, options=options,
+                           drain_timeout=args.drain_timeout, ready_timeout=args.ready_timeout))
+    serve(host=args.host, port=args.port, threads=args.threads,
+          backlog=args.backlog, keepalive=args.keepalive,
+          fd=args.fd, ready_fd=args.ready_fd, drain_timeout=args.drain_timeout, handoff=args.handoff)
+
+
+if __name__ == '__main__':
+    main()
@@ -33,7 +33,9 @@ class DashboardManager {
     // Démarrage des mises à jour
     startUpdates() {
         this.updateDevices();
-        setInterval(() => this.updateDevices(), this.updateInterval * 2);
+        const pushed = typeof ServerEvents !== 'undefined' &&
+            ServerEvents.on('devices', () => this.updateDevices());
+        if (!pushed) setInterval(() => this.updateDevices(), this.updateInterval * 2);
     }
 
     // Initialisation des écouteurs d'événements
@@ -198,8 +200,10 @@ document.addEventListener('DOMContentLoaded', () => {
     // Chargement initial des données
     refreshDevices();
     
-    // Rafraîchissement périodique
-    setInterval(refreshDevices, REFRESH_INTERVAL);
+    // Rafraîchissement sur événement serveur, sinon périodique
+    const pushed = typeof ServerEvents !== 'undefined' &&
+        ServerEvents.on('devices', refreshDevices);
+    if (!pushed) setInterval(refreshDevices, REFRESH_INTERVAL);
     
     // Event listeners
     document.getElementById('refreshButton').addEventListener('click', refreshDevices);
@@ -0,0 +1,32 @@
+// Canal d'événements serveur (SSE) partagé par les pages du tableau de bord.
+// EventSource renvoie automatiquement Last-Event-ID à la reconnexion : les
+// événements manqués sont rejoués, sinon le serveur envoie `resync`.
+const ServerEvents = {
+    source: null,
+
+    supported() {
+        return typeof window.EventSource !== 'undefined';
+    },
+
+    connect() {
+        if (!this.source && this.supported()) {
+            this.source = new EventSource('/api/events');
+        }
+        return this.source;
+    },
+
+    // Abonne `handler` au type d'événement donné ; retourne false si le
+    // navigateur ne gère pas SSE (l'appelant doit alors revenir au polling)
+    on(type, handler) {
+        const source = this.connect();
+        if (!source) return false;
+        source.addEventListener(type, event => {
+            try {
+                handler(JSON.parse(event.data));
+            } catch (error) {
+                console.error(`Erreur lors du traitement de l'événement ${type}:`, error);
+            }
+        });
+        return true;
+    }
+};
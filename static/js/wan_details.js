@@ -172,11 +172,20 @@ class WANDetailsManager {
         this.updateWANInfo();
         this.updateDevices();
         
-        // Mises à jour périodiques
-        setInterval(() => {
-            this.updateWANInfo();
-            this.updateDevices();
-        }, this.updateInterval);
+        // Mises à jour sur événement serveur, sinon périodiques
+        const pushed = typeof ServerEvents !== 'undefined' &&
+            ServerEvents.on('wan', wan => {
+                if (wan.client_id === this.wanId) this.updateWANInfo();
+            }) &&
+            ServerEvents.on('devices', event => {
+                if (event.client_id === this.wanId) this.updateDevices();
+            });
+        if (!pushed) {
+            setInterval(() => {
+                this.updateWANInfo();
+                this.updateDevices();
+            }, this.updateInterval);
+        }
     }
 }
 
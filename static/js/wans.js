@@ -113,55 +113,93 @@ class WANManager {
             this.refreshWANs();
         }, this.refreshInterval);
         
-        // Actualisation automatique des statuts
-        setInterval(() => {
-            document.querySelectorAll('[id^="status-"]').forEach(statusBadge => {
-                const clientId = statusBadge.id.replace('status-', '');
-                fetch(`/api/wans/${clientId}`)
-                    .then(response => response.json())
-                    .then(data => {
-                        // Met à jour le badge de statut
-                        statusBadge.className = `badge ${data.status === 'online' ? 'bg-success' : 'bg-danger'}`;
-                        statusBadge.textContent = data.status.toUpperCase();
-                        
-                        // Met à jour la latence
-                        const latencyBadge = document.getElementById(`latency-${clientId}`);
-                        if (latencyBadge) {
-                            const latency = data.latency;
-                            let color = 'gray';
-                            if (latency !== null) {
-                                if (latency <= 100) color = '#28a745';
-                                else if (latency <= 200) color = '#ffc107';
-                                else color = '#dc3545';
-                                latencyBadge.textContent = `${Math.round(latency)} ms`;
-                            } else {
-                                latencyBadge.textContent = 'N/A';
-                            }
-                            latencyBadge.style.backgroundColor = color;
-                        }
-                        
-                        // Met à jour la charge CPU
-                        const cpuBadge = document.getElementById(`cpu-${clientId}`);
-                        if (cpuBadge) {
-                            const cpu = data.cpu_load;
-                            let color = 'gray';
-                            if (cpu !== null) {
-                                if (cpu <= 40) color = '#28a745';
-                                else if (cpu <= 70) color = '#ffc107';
-                                else color = '#dc3545';
-                                cpuBadge.textContent = `${Math.round(cpu)}%`;
-                            } else {
-                                cpuBadge.textContent = 'N/A';
-                            }
-                            cpuBadge.style.backgroundColor = color;
-                        }
-                    })
-                    .catch(error => console.error('Erreur:', error));
-            });
-        }, 5000);
+        // Actualisation groupée des statuts
+        FleetStatus.start();
     }
 }
 
+// Couleur d'un badge selon des seuils (vert, orange, rouge)
+function badgeColor(value, low, high) {
+    if (value === null || value === undefined) return 'gray';
+    if (value <= low) return '#28a745';
+    if (value <= high) return '#ffc107';
+    return '#dc3545';
+}
+
+// Met à jour les badges d'une carte WAN
+function updateWANBadges(clientId, wan) {
+    const statusBadge = document.getElementById(`status-${clientId}`);
+    if (statusBadge && wan.status) {
+        statusBadge.className = `badge ${wan.status === 'online' ? 'bg-success' : 'bg-danger'} me-2`;
+        statusBadge.textContent = wan.status.toUpperCase();
+    }
+
+    const latencyBadge = document.getElementById(`latency-${clientId}`);
+    if (latencyBadge) {
+        const latency = wan.latency;
+        latencyBadge.textContent = latency !== null ? `${Math.round(latency)} ms` : 'N/A';
+        latencyBadge.style.backgroundColor = badgeColor(latency, 100, 200);
+    }
+
+    const cpuBadge = document.getElementById(`cpu-${clientId}`);
+    if (cpuBadge) {
+        const cpu = wan.cpu_load;
+        cpuBadge.textContent = cpu !== null ? `${Math.round(cpu)}%` : 'N/A';
+        cpuBadge.style.backgroundColor = badgeColor(cpu, 40, 70);
+    }
+}
+
+// Suivi des statuts de la flotte : les changements arrivent par SSE, et
+// sans SSE une seule requête groupée par intervalle, quelle que soit la
+// taille de la flotte
+const FleetStatus = {
+    epoch: null,
+    version: null,
+    started: false,
+
+    start(interval = 5000) {
+        if (this.started) return;
+        this.started = true;
+        this.poll();
+
+        const pushed = typeof ServerEvents !== 'undefined' &&
+            ServerEvents.on('wan', wan => updateWANBadges(wan.client_id, wan));
+        if (pushed) {
+            // Événements perdus (historique dépassé, redémarrage) : rechargement complet
+            ServerEvents.on('resync', () => {
+                this.epoch = null;
+                this.poll();
+            });
+        } else {
+            setInterval(() => this.poll(), interval);
+        }
+    },
+
+    async poll() {
+        const params = new URLSearchParams();
+        if (this.epoch !== null) {
+            params.set('epoch', this.epoch);
+            params.set('since', this.version);
+        }
+        try {
+            const response = await fetch(`/api/wans/status?${params}`);
+            if (!response.ok) throw new Error('Erreur réseau');
+
+            const data = await response.json();
+            this.epoch = data.epoch;
+            this.version = data.version;
+
+            Object.entries(data.wans).forEach(([clientId, values]) => {
+                const wan = {};
+                data.fields.forEach((field, i) => { wan[field] = values[i]; });
+                updateWANBadges(clientId, wan);
+            });
+        } catch (error) {
+            console.error('Erreur lors de la mise à jour des statuts:', error);
+        }
+    }
+};
+
 // Mise à jour de la commande de déploiement
 function updateCommand() {
     const name = document.getElementById('wanName').value || '[nom]';
@@ -0,0 +1,49 @@
+"""
+Fixtures communes des tests (les modules du serveur sont à la racine du dépôt)
+"""
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import migrations  # noqa: E402
+
+
+@pytest.fixture
+def db():
+    """Base en mémoire au schéma courant, avec un WAN `wan-1`"""
+    db = sqlite3.connect(':memory:')
+    db.row_factory = sqlite3.Row
+    migrations.migrate(db)
+    db.execute('''
+        INSERT INTO wans (client_id, name, ip, subnet, location, hostname, status)
+        VALUES ('wan-1', 'Siège', '192.0.2.1', '192.0.2.0/24', 'Paris', 'gw-1', 'online')
+    ''')
+    db.commit()
+    yield db
+    db.close()
+
+
+@pytest.fixture(scope='session')
+def seahawks(tmp_path_factory):
+    """Module `app` sur une base temporaire, rédacteur démarré (écritures validées avant réponse)"""
+    path = tmp_path_factory.mktemp('seahawks')
+    os.environ.update({
+        'DATABASE_PATH': str(path / 'wans.db'),
+        'LOG_FILE': str(path / 'seahawks.log'),
+        'INGEST_DURABILITY': 'commit',
+        'ADMISSION_CLIENT_BURST': '1000',
+    })
+    import app
+    app.init_db()
+    app.writer.start()
+    yield app
+    app.writer.stop()
+
+
+@pytest.fixture
+def client(seahawks):
+    return seahawks.app.test_client()
@@ -0,0 +1,18 @@
+"""
+Clé des seaux d'admission : adresse du client, identifiant seulement s'il est enregistré
+"""
+
+
+def key(seahawks, remote_addr, headers=None):
+    with seahawks.app.test_request_context(environ_base={'REMOTE_ADDR': remote_addr}, headers=headers or {}):
+        return seahawks.admission_key()
+
+
+def test_unregistered_client_id_does_not_split_the_bucket(seahawks):
+    assert key(seahawks, '198.51.100.7', {'X-Client-Id': 'a'}) == key(seahawks, '198.51.100.7', {'X-Client-Id': 'b'})
+
+
+def test_forwarded_for_is_ignored_without_trusted_proxies(seahawks):
+    assert seahawks.TRUSTED_PROXIES == 0
+    assert key(seahawks, '198.51.100.7', {'X-Forwarded-For': '203.0.113.9'}) == ('198.51.100.7', None)
+
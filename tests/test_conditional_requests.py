@@ -0,0 +1,86 @@
+"""
+ETags des API de lecture : 304 tant que rien ne change, nouveau corps après une écriture
+"""
+import uuid
+
+import pytest
+
+
+@pytest.fixture
+def wan_id(client):
+    wan_id = f'wan-{uuid.uuid4().hex[:8]}'
+    response = client.post('/api/register', json={
+        'client_id': wan_id, 'name': 'Agence', 'ip': '192.0.2.10',
+        'subnet': '192.0.2.0/24', 'location': 'Lyon', 'hostname': 'gw-lyon',
+    })
+    assert response.status_code in (200, 201)
+    return wan_id
+
+
+def report(client, wan_id, devices):
+    response = client.post('/api/devices/update', json={'client_id': wan_id, 'devices': devices})
+    assert response.status_code == 200
+
+
+def revalidate(client, url, etag):
+    return client.get(url, headers={'If-None-Match': etag})
+
+
+def test_unchanged_resource_answers_304(client, wan_id):
+    for url in ('/api/wans', f'/api/wans/{wan_id}', f'/api/wans/{wan_id}/devices'):
+        etag = client.get(url).headers['ETag']
+
+        response = revalidate(client, url, etag)
+
+        assert response.status_code == 304
+        assert response.headers['ETag'] == etag
+
+
+def test_device_report_invalidates_device_list(client, wan_id):
+    url = f'/api/wans/{wan_id}/devices'
+    first = client.get(url)
+    assert first.get_json() == []
+
+    report(client, wan_id, [{'mac': 'aa:00:00:00:00:01', 'ip': '10.0.0.1', 'hostname': 'nas'}])
+
+    response = revalidate(client, url, first.headers['ETag'])
+    assert response.status_code == 200
+    assert response.headers['ETag'] != first.headers['ETag']
+    assert [device['hostname'] for device in response.get_json()] == ['nas']
+    assert revalidate(client, url, response.headers['ETag']).status_code == 304
+
+
+def test_identical_report_keeps_device_etag(client, wan_id):
+    url = f'/api/wans/{wan_id}/devices'
+    devices = [{'mac': 'aa:00:00:00:00:02', 'ip': '10.0.0.2'}]
+    report(client, wan_id, devices)
+    etag = client.get(url).headers['ETag']
+
+    report(client, wan_id, devices)
+
+    assert revalidate(client, url, etag).status_code == 304
+
+
+def test_registration_invalidates_wan_list(client, wan_id):
+    etag = client.get('/api/wans').headers['ETag']
+
+    client.post('/api/register', json={
+        'client_id': f'{wan_id}-bis', 'name': 'Annexe', 'ip': '192.0.2.11',
+        'subnet': '192.0.2.0/24', 'location': 'Lyon', 'hostname': 'gw-annexe',
+    })
+
+    response = revalidate(client, '/api/wans', etag)
+    assert response.status_code == 200
+    assert f'{wan_id}-bis' in [wan['client_id'] for wan in response.get_json()]
+
+
+def test_write_to_another_wan_keeps_wan_etag(client, wan_id):
+    url = f'/api/wans/{wan_id}'
+    etag = client.get(url).headers['ETag']
+
+    client.post('/api/register', json={
+        'client_id': f'{wan_id}-autre', 'name': 'Autre', 'ip': '192.0.2.12',
+        'subnet': '192.0.2.0/24', 'location': 'Nantes', 'hostname': 'gw-autre',
+    })
+
+    assert revalidate(client, url, etag).status_code == 304
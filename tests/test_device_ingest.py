@@ -0,0 +1,84 @@
+"""
+Ingestion différentielle des rapports d'appareils
+"""
+from device_ingest import apply_device_report
+
+
+def device(mac, ip, hostname=None, open_ports=None):
+    return {'mac': mac, 'ip': ip, 'hostname': hostname, 'open_ports': open_ports or []}
+
+
+def statuses(db):
+    return {row['mac']: row['status'] for row in db.execute('SELECT mac, status FROM devices')}
+
+
+def test_first_report_inserts_every_device(db):
+    counts = apply_device_report(db, 'wan-1', [
+        device('aa:00:00:00:00:01', '10.0.0.1'),
+        device('aa:00:00:00:00:02', '10.0.0.2'),
+        device('aa:00:00:00:00:03', '10.0.0.3'),
+    ])
+
+    assert {k: counts[k] for k in ('inserted', 'updated', 'removed', 'unchanged')} == {
+        'inserted': 3, 'updated': 0, 'removed': 0, 'unchanged': 0}
+    assert counts['present'] == 3
+    assert counts['absent'] == 0
+
+
+def test_report_diff_counts(db):
+    apply_device_report(db, 'wan-1', [
+        device('aa:00:00:00:00:01', '10.0.0.1', 'nas'),
+        device('aa:00:00:00:00:02', '10.0.0.2', 'printer'),
+        device('aa:00:00:00:00:03', '10.0.0.3', 'camera'),
+    ])
+
+    counts = apply_device_report(db, 'wan-1', [
+        device('aa:00:00:00:00:01', '10.0.0.1', 'nas'),
+        device('aa:00:00:00:00:02', '10.0.0.2', 'printer-2'),
+        device('aa:00:00:00:00:04', '10.0.0.4', 'phone'),
+    ])
+
+    assert counts['inserted'] == 1
+    assert counts['updated'] == 1
+    assert counts['removed'] == 1
+    assert counts['unchanged'] == 1
+    assert counts['present'] == 3
+    assert counts['absent'] == 1
+    # Seuls les appareils écrits (nouveau, modifié, disparu) sont relus par l'instantané
+    assert sorted(counts['keys']) == ['aa:00:00:00:00:02', 'aa:00:00:00:00:03', 'aa:00:00:00:00:04']
+    assert statuses(db)['aa:00:00:00:00:03'] == 'gone'
+
+
+def test_identical_report_writes_nothing(db):
+    report = [device('aa:00:00:00:00:01', '10.0.0.1', open_ports=[{'port': 22, 'protocol': 'tcp'}])]
+    apply_device_report(db, 'wan-1', report)
+
+    counts = apply_device_report(db, 'wan-1', report)
+
+    assert (counts['inserted'], counts['updated'], counts['removed'], counts['unchanged']) == (0, 0, 0, 1)
+    assert counts['keys'] == []
+
+
+def test_returning_device_counts_as_updated(db):
+    first = device('aa:00:00:00:00:01', '10.0.0.1')
+    second = device('aa:00:00:00:00:02', '10.0.0.2')
+    apply_device_report(db, 'wan-1', [first, second])
+    apply_device_report(db, 'wan-1', [first])
+
+    counts = apply_device_report(db, 'wan-1', [first, second])
+
+    assert (counts['inserted'], counts['updated'], counts['removed'], counts['unchanged']) == (0, 1, 0, 1)
+    assert statuses(db)['aa:00:00:00:00:02'] == 'up'
+    assert db.execute('SELECT COUNT(*) FROM devices').fetchone()[0] == 2
+
+
+def test_duplicate_devices_in_a_report_count_once(db):
+    counts = apply_device_report(db, 'wan-1', [
+        device('aa:00:00:00:00:01', '10.0.0.1', 'old'),
+        device('AA:00:00:00:00:01', '10.0.0.1', 'new'),
+        {'mac': 'aa:00:00:00:00:09'},
+    ])
+
+    assert counts['inserted'] == 1
+    assert counts['present'] == 1
+    assert db.execute('SELECT hostname FROM devices').fetchone()[0] == 'new'
@@ -0,0 +1,55 @@
+"""
+Corps des requêtes d'ingestion : 400 (et non 500) pour un JSON valide mais mal formé
+"""
+import pytest
+
+INGEST_ROUTES = ['/api/register', '/api/heartbeat', '/api/devices/update']
+
+
+@pytest.mark.parametrize('url', INGEST_ROUTES)
+@pytest.mark.parametrize('body', ['[1, 2]', '"wan-1"', '42', 'null'])
+def test_non_object_body_is_rejected(client, url, body):
+    response = client.post(url, data=body, content_type='application/json')
+
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Le corps de la requête doit être un objet JSON'
+
+
+@pytest.mark.parametrize('url', INGEST_ROUTES)
+@pytest.mark.parametrize('field', ['client_id', 'wan_id'])
+def test_non_string_client_id_is_rejected(client, url, field):
+    response = client.post(url, json={field: ['wan-1']})
+
+    assert response.status_code == 400
+    assert response.get_json()['error'] == f'{field} doit être une chaîne'
+
+
+def test_heartbeat_from_unknown_wan_asks_to_register(client):
+    response = client.post('/api/heartbeat', json={'client_id': 'inconnu'})
+
+    assert response.status_code == 404
+    assert response.get_json()['register'] is True
+
+
+@pytest.mark.parametrize('report', [
+    {'client_id': 'wan-1', 'devices': {'ip': '10.0.0.1'}},
+    {'client_id': 'wan-1', 'devices': [[1, 2]]},
+    {'client_id': 'wan-1', 'devices': ['10.0.0.1']},
+    {'client_id': 'wan-1', 'devices': [], 'network_stats': [3]},
+])
+def test_malformed_device_report_is_rejected(client, report):
+    response = client.post('/api/devices/update', json=report)
+
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Format de rapport invalide'
+
+
+def test_device_report_errors_do_not_leak_exception_text(client, seahawks, monkeypatch):
+    def fail(*args):
+        raise RuntimeError('détail interne')
+    monkeypatch.setattr(seahawks, 'enqueue_write', fail)
+
+    response = client.post('/api/devices/update', json={'client_id': 'wan-1', 'devices': []})
+
+    assert response.status_code == 500
+    assert response.get_json() == {'error': 'Erreur serveur'}
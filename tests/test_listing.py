@@ -0,0 +1,90 @@
+"""
+Pagination par clé : chaque ligne une seule fois, même quand la colonne de tri a des ex aequo
+"""
+import pytest
+
+import listing
+from device_ingest import apply_device_report
+from listing import InvalidQuery
+from read_model import ReadModel
+
+SORTS = ['ip', '-ip', 'mac', '-mac', 'last_seen', '-last_seen', 'id', '-id']
+
+
+@pytest.fixture
+def fleet(db):
+    """Trois WANs aux mêmes appareils : IP et MAC en double d'un WAN à l'autre"""
+    for index in (2, 3):
+        db.execute('''
+            INSERT INTO wans (client_id, name, ip, subnet, location, hostname)
+            VALUES (?, ?, '192.0.2.1', '192.0.2.0/24', 'Paris', 'gw')
+        ''', (f'wan-{index}', f'Agence {index}'))
+    devices = [{'mac': f'aa:00:00:00:00:{n:02x}', 'ip': f'10.0.0.{n}', 'hostname': 'host'} for n in range(1, 8)]
+    for wan_id in ('wan-1', 'wan-2', 'wan-3'):
+        apply_device_report(db, wan_id, devices)
+    # Deux horodatages seulement : longues séries d'ex aequo sur last_seen
+    db.execute("UPDATE devices SET last_seen = CASE WHEN id % 2 THEN '2026-01-01 00:00:00' ELSE '2026-01-02 00:00:00' END")
+    db.commit()
+    return db
+
+
+def walk(fetch, sort, limit=2, **filters):
+    """Parcourt toutes les pages ; retourne les lignes dans l'ordre reçu"""
+    rows, cursor = [], None
+    while True:
+        args = {'sort': sort, 'limit': str(limit), **filters}
+        if cursor:
+            args['cursor'] = cursor
+        page, cursor = fetch(listing.DEVICES.parse(args))
+        rows += page
+        if cursor is None:
+            return rows
+
+
+def expected_ids(db, sort, where=''):
+    column = listing.DEVICES.sorts[sort.lstrip('-')]
+    direction = 'DESC' if sort.startswith('-') else 'ASC'
+    return [row[0] for row in db.execute(
+        f'SELECT id FROM devices {where} ORDER BY {column} {direction}, id {direction}')]
+
+
+@pytest.mark.parametrize('sort', SORTS)
+def test_fleet_pages_cover_every_device_once(fleet, sort):
+    rows = walk(lambda query: listing.DEVICES.page(fleet, query), sort)
+
+    assert [row['id'] for row in rows] == expected_ids(fleet, sort)
+
+
+@pytest.mark.parametrize('sort', SORTS)
+def test_snapshot_pages_match_sql_pages(fleet, sort):
+    snapshot = ReadModel().load(fleet)
+
+    from_snapshot = walk(lambda query: snapshot.devices_page('wan-2', query), sort, limit=3)
+    from_sql = walk(lambda query: listing.DEVICES.page(fleet, query, {'wan_id': 'wan-2'}), sort, limit=3)
+
+    assert [row['id'] for row in from_snapshot] == [row['id'] for row in from_sql]
+    assert [row['id'] for row in from_sql] == expected_ids(fleet, sort, "WHERE wan_id = 'wan-2'")
+
+
+def test_filters_apply_across_pages(fleet):
+    rows = walk(lambda query: listing.DEVICES.page(fleet, query), 'last_seen', limit=2, ip='10.0.0.1')
+
+    assert {row['wan_id'] for row in rows} == {'wan-1', 'wan-2', 'wan-3'}
+    assert {row['ip'] for row in rows} == {'10.0.0.1'}
+
+
+def test_pages_expose_only_public_columns(fleet):
+    snapshot = ReadModel().load(fleet)
+    query = listing.DEVICES.parse({'sort': 'mac', 'limit': '2'})
+
+    for rows, _ in (listing.DEVICES.page(fleet, query), snapshot.devices_page('wan-1', query)):
+        assert set(rows[0]) == set(listing.DEVICES.columns)
+
+
+def test_cursor_is_bound_to_its_sort(fleet):
+    _, cursor = listing.DEVICES.page(fleet, listing.DEVICES.parse({'sort': 'ip', 'limit': '2'}))
+
+    with pytest.raises(InvalidQuery):
+        listing.DEVICES.parse({'sort': '-ip', 'cursor': cursor})
+    with pytest.raises(InvalidQuery):
+        listing.DEVICES.parse({'sort': 'ip', 'cursor': 'pas-un-curseur'})
@@ -0,0 +1,39 @@
+"""
+Historique des métriques d'un WAN
+"""
+import uuid
+
+
+def test_unknown_wan_is_404(client):
+    response = client.get('/api/wans/inconnu/metrics')
+
+    assert response.status_code == 404
+    assert response.get_json() == {'error': 'WAN non trouvé'}
+
+
+def test_wan_without_samples_has_an_empty_series(client):
+    wan_id = f'wan-{uuid.uuid4().hex[:8]}'
+    client.post('/api/register', json={
+        'client_id': wan_id, 'name': 'Agence', 'ip': '192.0.2.20',
+        'subnet': '192.0.2.0/24', 'location': 'Lille', 'hostname': 'gw-lille',
+    })
+
+    response = client.get(f'/api/wans/{wan_id}/metrics')
+
+    assert response.status_code == 200
+    assert response.get_json()['points'] == []
+
+
+def test_current_bucket_is_included_at_coarse_resolution(client):
+    wan_id = f'wan-{uuid.uuid4().hex[:8]}'
+    client.post('/api/register', json={
+        'client_id': wan_id, 'name': 'Agence', 'ip': '192.0.2.21',
+        'subnet': '192.0.2.0/24', 'location': 'Lille', 'hostname': 'gw-lille-2',
+    })
+    client.post('/api/devices/update', json={
+        'client_id': wan_id, 'devices': [], 'network_stats': {'latency': 12.5, 'cpu_load': 0.3}})
+
+    series = client.get(f'/api/wans/{wan_id}/metrics').get_json()
+
+    assert series['resolution'] == '1h'
+    assert [point['latency_avg'] for point in series['points']] == [12.5]
@@ -0,0 +1,67 @@
+"""
+Décodage des corps de requête : limite de taille après décompression
+"""
+import gzip
+import json
+import zlib
+
+import pytest
+
+import wire
+
+
+@pytest.mark.parametrize('encoding', ['gzip', 'deflate'])
+def test_body_at_the_limit_is_accepted(encoding):
+    body = b'x' * 4096
+
+    assert wire.decompress(wire.compress(body, encoding), encoding, max_size=4096) == body
+
+
+@pytest.mark.parametrize('encoding', ['gzip', 'deflate'])
+def test_body_over_the_limit_is_rejected(encoding):
+    bomb = wire.compress(b'\0' * (1024 * 1024), encoding)
+
+    with pytest.raises(wire.WireError, match='supérieur à 4096 octets'):
+        wire.decompress(bomb, encoding, max_size=4096)
+
+
+def test_raw_deflate_is_limited_too():
+    compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+    bomb = compressor.compress(b'\0' * (1024 * 1024)) + compressor.flush()
+
+    with pytest.raises(wire.WireError):
+        wire.decompress(bomb, 'deflate', max_size=4096)
+
+
+def test_truncated_body_is_rejected():
+    body = gzip.compress(b'x' * 4096)
+
+    with pytest.raises(wire.WireError, match='tronqué'):
+        wire.decompress(body[:len(body) // 2], 'gzip')
+
+
+def test_decode_body_applies_the_limit_before_parsing():
+    report = json.dumps({'devices': [{'ip': '10.0.0.1', 'hostname': 'h' * 8192}]}).encode()
+    body = wire.compress(report, 'gzip')
+
+    assert wire.decode_body(body, wire.JSON_TYPE, 'gzip', max_size=len(report)) == json.loads(report)
+    with pytest.raises(wire.WireError):
+        wire.decode_body(body, wire.JSON_TYPE, 'gzip', max_size=len(report) - 1)
+
+
+def test_oversized_request_is_answered_400(client, seahawks, monkeypatch):
+    monkeypatch.setattr(seahawks, 'WIRE_MAX_BODY_SIZE', 4096)
+    bomb = wire.compress(json.dumps({'devices': [], 'padding': ' ' * 65536}).encode(), 'gzip')
+
+    response = client.post('/api/devices/update', data=bomb, headers={
+        'Content-Type': wire.JSON_TYPE, 'Content-Encoding': 'gzip'})
+
+    assert response.status_code == 400
+    assert 'supérieur' in response.get_json()['error']
+
+
+def test_unknown_encoding_is_answered_415(client):
+    response = client.post('/api/devices/update', data=b'{}', headers={
+        'Content-Type': wire.JSON_TYPE, 'Content-Encoding': 'br'})
+
+    assert response.status_code == 415
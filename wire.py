@@ -0,0 +1,389 @@
+"""
+Encodage des rapports clients : JSON compressé ou format binaire compact
+
+Module sans dépendance externe, partagé par le serveur et les clients.
+"""
+import email.utils
+import gzip
+import json
+import random
+import struct
+import time
+import zlib
+
+JSON_TYPE = 'application/json'
+BINARY_TYPE = 'application/x-seahawks-wire'
+# Codages de contenu acceptés, par ordre de préférence
+ENCODINGS = ('gzip', 'deflate')
+
+# Taille maximale d'un corps décompressé (protection contre les bombes zip)
+MAX_BODY_SIZE = 64 * 1024 * 1024
+# En dessous de cette taille, la compression coûte plus qu'elle ne rapporte
+MIN_COMPRESS_SIZE = 512
+MAX_DEPTH = 32
+
+MAGIC = b'SHW1'
+
+_NONE, _FALSE, _TRUE, _INT, _FLOAT, _STR, _STR_REF, _LIST, _DICT = range(9)
+_DOUBLE = struct.Struct('>d')
+
+
+class WireError(ValueError):
+    """Corps de requête illisible (codage, compression ou format invalide)"""
+
+
+class UnsupportedEncoding(WireError):
+    """Codage de contenu ou type de média non pris en charge"""
+
+
+# --- Format binaire -----------------------------------------------------------
+#
+# Chaque valeur commence par un octet de type. Les entiers sont des varints
+# zigzag, les flottants des doubles big-endian. Chaque chaîne n'est écrite
+# qu'une fois : ses occurrences suivantes (clés des dictionnaires, fabricants,
+# statuts...) sont des références vers une table construite à la volée.
+
+def _write_varint(out, value):
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _encode_value(out, value, strings, depth):
+    if depth > MAX_DEPTH:
+        raise WireError("Structure trop profonde")
+    if value is None:
+        out.append(_NONE)
+    elif value is True:
+        out.append(_TRUE)
+    elif value is False:
+        out.append(_FALSE)
+    elif isinstance(value, int):
+        out.append(_INT)
+        _write_varint(out, (value << 1) if value >= 0 else ((-value << 1) - 1))
+    elif isinstance(value, float):
+        out.append(_FLOAT)
+        out += _DOUBLE.pack(value)
+    elif isinstance(value, str):
+        index = strings.get(value)
+        if index is not None:
+            out.append(_STR_REF)
+            _write_varint(out, index)
+        else:
+            strings[value] = len(strings)
+            data = value.encode('utf-8')
+            out.append(_STR)
+            _write_varint(out, len(data))
+            out += data
+    elif isinstance(value, (list, tuple)):
+        out.append(_LIST)
+        _write_varint(out, len(value))
+        for item in value:
+            _encode_value(out, item, strings, depth + 1)
+    elif isinstance(value, dict):
+        out.append(_DICT)
+        _write_varint(out, len(value))
+        for key, item in value.items():
+            if not isinstance(key, str):
+                raise WireError(f"Clé non textuelle : {key!r}")
+            _encode_value(out, key, strings, depth + 1)
+            _encode_value(out, item, strings, depth + 1)
+    else:
+        raise WireError(f"Type non encodable : {type(value).__name__}")
+
+
+def encode(value):
+    """Encode une valeur JSON (dict, list, str, nombres, bool, None) en binaire"""
+    out = bytearray(MAGIC)
+    _encode_value(out, value, {}, 0)
+    return bytes(out)
+
+
+class _Decoder:
+    __slots__ = ('data', 'pos', 'strings')
+
+    def __init__(self, data):
+        self.data = data
+        self.pos = len(MAGIC)
+        self.strings = []
+
+    def _byte(self):
+        try:
+            b = self.data[self.pos]
+        except IndexError:
+            raise WireError("Corps binaire tronqué") from None
+        self.pos += 1
+        return b
+
+    def _varint(self):
+        result = shift = 0
+        while True:
+            b = self._byte()
+            result |= (b & 0x7f) << shift
+            if not b & 0x80:
+                return result
+            shift += 7
+            if shift > 70:
+                raise WireError("Entier trop long")
+
+    def _count(self):
+        # Chaque élément occupe au moins un octet : borne les allocations
+        count = self._varint()
+        if count > len(self.data) - self.pos:
+            raise WireError("Taille de conteneur incohérente")
+        return count
+
+    def value(self, depth=0):
+        if depth > MAX_DEPTH:
+            raise WireError("Structure trop profonde")
+        tag = self._byte()
+        if tag == _NONE:
+            return None
+        if tag == _TRUE:
+            return True
+        if tag == _FALSE:
+            return False
+        if tag == _INT:
+            n = self._varint()
+            return (n >> 1) if not n & 1 else -((n + 1) >> 1)
+        if tag == _FLOAT:
+            end = self.pos + _DOUBLE.size
+            if end > len(self.data):
+                raise WireError("Corps binaire tronqué")
+            value = _DOUBLE.unpack_from(self.data, self.pos)[0]
+            self.pos = end
+            return value
+        if tag == _STR:
+            length = self._varint()
+            end = self.pos + length
+            if end > len(self.data):
+                raise WireError("Corps binaire tronqué")
+            try:
+                value = bytes(self.data[self.pos:end]).decode('utf-8')
+            except UnicodeDecodeError as e:
+                raise WireError(f"Chaîne invalide : {e}") from None
+            self.pos = end
+            self.strings.append(value)
+            return value
+        if tag == _STR_REF:
+            index = self._varint()
+            if index >= len(self.strings):
+                raise WireError("Référence de chaîne invalide")
+            return self.strings[index]
+        if tag == _LIST:
+            return [self.value(depth + 1) for _ in range(self._count())]
+        if tag == _DICT:
+            result = {}
+            for _ in range(self._count()):
+                key = self.value(depth + 1)
+                if not isinstance(key, str):
+                    raise WireError("Clé non textuelle")
+                result[key] = self.value(depth + 1)
+            return result
+        raise WireError(f"Type binaire inconnu : {tag}")
+
+
+def decode(data):
+    """Décode un corps produit par `encode`"""
+    if not data.startswith(MAGIC):
+        raise WireError("Signature binaire absente")
+    decoder = _Decoder(memoryview(data))
+    value = decoder.value()
+    if decoder.pos != len(data):
+        raise WireError("Données superflues après la valeur")
+    return value
+
+
+# --- Compression --------------------------------------------------------------
+
+def compress(body, encoding, level=6):
+    """Compresse `body` avec le codage HTTP `encoding` (gzip ou deflate)"""
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=level, mtime=0)
+    if encoding == 'deflate':
+        return zlib.compress(body, level)
+    raise UnsupportedEncoding(f"Codage non pris en charge : {encoding}")
+
+
+def decompress(body, encoding, max_size=MAX_BODY_SIZE):
+    """Décompresse un corps HTTP en refusant de dépasser `max_size` octets"""
+    encoding = (encoding or 'identity').strip().lower()
+    if encoding == 'identity':
+        return body
+    if encoding == 'gzip':
+        candidates = (16 + zlib.MAX_WBITS,)
+    elif encoding == 'deflate':
+        # « deflate » désigne normalement du zlib, mais certains clients
+        # envoient du deflate brut
+        candidates = (zlib.MAX_WBITS, -zlib.MAX_WBITS)
+    else:
+        raise UnsupportedEncoding(f"Codage non pris en charge : {encoding}")
+
+    for wbits in candidates:
+        decompressor = zlib.decompressobj(wbits)
+        try:
+            data = decompressor.decompress(body, max_size)
+        except zlib.error:
+            continue
+        if decompressor.unconsumed_tail:
+            raise WireError(f"Corps décompressé supérieur à {max_size} octets")
+        if not decompressor.eof:
+            raise WireError("Corps compressé tronqué")
+        return data
+    raise WireError(f"Corps {encoding} invalide")
+
+
+def negotiate(accept_encoding):
+    """Choisit le codage de réponse d'après l'en-tête Accept-Encoding (None : aucun)"""
+    weights = {}
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.partition(';')
+        name = name.strip().lower()
+        params = params.strip()
+        try:
+            q = float(params[2:]) if params.startswith('q=') else 1.0
+        except ValueError:
+            q = 0.0
+        for encoding in (ENCODINGS if name == '*' else (name,)):
+            weights.setdefault(encoding, q)
+    candidates = [e for e in ENCODINGS if weights.get(e, 0.0) > 0]
+    # max() garde le premier ex aequo : l'ordre de ENCODINGS départage
+    return max(candidates, key=lambda e: weights[e]) if candidates else None
+
+
+# --- Corps de requête -----------------------------------------------------------
+
+def decode_body(body, content_type, content_encoding=None, max_size=MAX_BODY_SIZE):
+    """Décode un corps de requête (JSON ou binaire, éventuellement compressé)"""
+    body = decompress(body, content_encoding, max_size)
+    media_type = (content_type or JSON_TYPE).split(';')[0].strip().lower()
+    if media_type == BINARY_TYPE:
+        return decode(body)
+    if media_type == JSON_TYPE:
+        try:
+            return json.loads(body)
+        except ValueError as e:
+            raise WireError(f"JSON invalide : {e}") from None
+    raise UnsupportedEncoding(f"Type de contenu non pris en charge : {media_type}")
+
+
+def encode_body(data, binary=False, encoding=None, level=6):
+    """Encode un corps de requête ; retourne (corps, en-têtes)"""
+    if binary:
+        body, headers = encode(data), {'Content-Type': BINARY_TYPE}
+    else:
+        body = json.dumps(data, separators=(',', ':')).encode('utf-8')
+        headers = {'Content-Type': JSON_TYPE}
+    if encoding and len(body) >= MIN_COMPRESS_SIZE:
+        body = compress(body, encoding, level)
+        headers['Content-Encoding'] = encoding
+    return body, headers
+
+
+# --- Nouvelles tentatives ---------------------------------------------------------
+
+# Réponses du contrôle d'admission du serveur : l'envoi est retenté plus tard
+RETRY_STATUSES = (429, 503)
+
+
+def retry_after(headers, now=None):
+    """Délai demandé par l'en-tête Retry-After (secondes ou date HTTP), None s'il est absent"""
+    value = headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(date.timestamp() - (now if now is not None else time.time()), 0.0)
+
+
+class Backoff:
+    """Attente exponentielle avec gigue avant une nouvelle tentative
+
+    La n-ième attente (n à partir de 0) est tirée uniformément dans
+    [0, min(cap, base × 2^n)] et s'ajoute au Retry-After du serveur : les
+    clients refusés en même temps se répartissent au lieu de revenir
+    ensemble.
+    """
+
+    def __init__(self, base=1.0, cap=60.0):
+        self.base = base
+        self.cap = cap
+
+    def delay(self, attempt, retry_after=None):
+        jitter = random.uniform(0, min(self.cap, self.base * 2 ** attempt))
+        return (retry_after or 0.0) + jitter
+
+
+class ReportSender:
+    """Envoi des rapports client avec négociation progressive
+
+    Le premier envoi se fait en JSON brut, compris par tous les serveurs.
+    Un serveur récent annonce dans ses réponses les codages qu'il accepte
+    (`Accept-Encoding`, RFC 7694) et le format binaire (`Accept-Post`) :
+    les envois suivants les utilisent. Une réponse 415 ramène au JSON brut.
+
+    Le format binaire n'est utilisé que si `prefer_binary` est vrai : une
+    fois compressé, il n'est guère plus petit que le JSON compressé et son
+    décodage en Python pur coûte nettement plus de CPU au serveur (voir
+    benchmarks/wire_codec.py).
+
+    Un refus (429/503) ou une erreur de connexion (serveur en cours de
+    redémarrage) est retenté jusqu'à `retries` fois, après le délai
+    Retry-After et une attente `Backoff`. `client_id` est annoncé dans
+    l'en-tête X-Client-Id, qui sert au serveur à limiter chaque client.
+    """
+
+    def __init__(self, http, prefer_binary=False, client_id=None, retries=4, backoff=None):
+        # `http` : module requests ou requests.Session
+        self.http = http
+        self.prefer_binary = prefer_binary
+        self.client_id = client_id
+        self.retries = retries
+        self.backoff = backoff or Backoff()
+        self.binary = False
+        self.encoding = None
+        # Après un 415, les annonces du serveur ne sont plus suivies
+        self.plain_only = False
+
+    def _negotiate(self, headers):
+        if self.plain_only:
+            return
+        accepted = headers.get('Accept-Encoding')
+        if accepted is not None:
+            self.encoding = negotiate(accepted)
+        self.binary = self.prefer_binary and BINARY_TYPE in headers.get('Accept-Post', '')
+
+    def _send(self, url, data, **kwargs):
+        body, headers = encode_body(data, self.binary, self.encoding)
+        if self.client_id:
+            headers['X-Client-Id'] = self.client_id
+        return self.http.post(url, data=body, headers=headers, **kwargs)
+
+    def post(self, url, data, **kwargs):
+        """Envoie `data` ; retourne la dernière réponse (éventuellement encore 429/503)"""
+        attempt = 0
+        while True:
+            try:
+                response = self._send(url, data, **kwargs)
+            except OSError:
+                # Exceptions de requests (connexion refusée, délai dépassé...)
+                if attempt >= self.retries:
+                    raise
+                time.sleep(self.backoff.delay(attempt))
+                attempt += 1
+                continue
+            if response.status_code == 415 and (self.binary or self.encoding):
+                self.binary, self.encoding, self.plain_only = False, None, True
+                continue
+            self._negotiate(response.headers)
+            if response.status_code not in RETRY_STATUSES or attempt >= self.retries:
+                return response
+            time.sleep(self.backoff.delay(attempt, retry_after(response.headers)))
+            attempt += 1